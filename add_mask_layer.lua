@@ -1,8 +1,9 @@
 --!/bin/lua
 -- prepares a aseprite file to be processed with a modified Pigsy's priority layer lua script as
 -- it is described here https://youtu.be/uvsgg4YbJRk?list=PL1xqkpO_SvY2_rSwHTBIBxXMqmek--GAb
-local mask = "RUTA_CAMBIADA_POR_PYTHON"
-local palette = "RUTA_CAMBIADA_POR_PYTHON_PAL"
+-- paths come as --script-param mask=... --script-param palette=... (python does not edit this file anymore)
+local mask = app.params["mask"]
+local palette = app.params["palette"]
 local app = app
 app.transaction(function()
 
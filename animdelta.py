@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# animated backgrounds: upload the first frame once, then per frame only what changed
+# frames come as pngs in order or cut from a sprite sheet (--sheet, row major). priority tiles from the
+# tile_priorities.json entries of those pngs (or of the sheet, cut the same way) if there is a --json
+# - every frame goes through the same palette (--palette shared.pal as setprioFULLAND01 --palette, or one
+#   ADAPTIVE pass over all frames stacked) so equal pixels are equal tiles on every frame
+# - tiles of all frames are deduped together (flips too unless --no-flip)
+# - the tiles frame 0 uses are the BASE: resident in vram from TILE_USER_INDEX (+ --tile-base) for good
+# - the rest go to a STREAM area right after the base. a frame uploads only the stream tiles it needs that
+#   the previous frame did not have, into slots the previous frame freed. map cells are only written where
+#   the word changed. --loop adds the last frame -> frame 0 step as the record of frame 0
+# outputs for <out>:
+# - <out>_base_tiles.bin / <out>_base_map.bin / <out>_pal.bin  frame 0 as setprioFULLAND01 --bin would load it
+# - <out>_stream_tiles.bin  every stream tile once, 32 bytes each, uploads point in there
+# - <out>_delta.bin  u16 frames, u32 offset per frame, then per frame: u16 uploads, u16 cells,
+#                    uploads x (u16 vram slot from the base index, u16 stream tile), cells x (u16 y*w+x, u16 word)
+#                    all big endian. frame 0 is empty (or the loop step)
+# - <out>_delta.json per frame tiles/cells/dma bytes against a full reload, <out>.res and <out>_anim.h
+#
+#   python animdelta.py water1.png water2.png water3.png --json tile_priorities.json --palette shared.pal --loop
+#   python animdelta.py --sheet water.png --frame 320x64 -o water
+
+import argparse
+import json
+import os
+import struct
+import numpy as np
+from PIL import Image
+from priostore import entry_mask, read_priorities
+from setprioFULLAND01 import (TILE_BYTES, TILE_SIZE, TILE_INDEX_MASK, dedup_tiles, fixed_quantize, image_to_indices,
+                              palette_rgb16, sgdk_map_words, shared_palette, tile_view, tiles_to_4bpp)
+from sgdkbin import c_name, map_to_bytes, palette_to_vdp_bytes
+
+MAP_WORD_BYTES = 2
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+# -> list of (name, PIL image) in order
+def load_frames(paths=None, sheet=None, frame_size=None, count=None):
+    if sheet:
+        fw, fh = frame_size
+        img = Image.open(sheet)
+        img.load()
+        cols, rows = img.size[0] // fw, img.size[1] // fh
+        frames = [(f"{sheet}#{i}", img.crop(((i % cols) * fw, (i // cols) * fh, (i % cols + 1) * fw, (i // cols + 1) * fh)))
+                  for i in range(cols * rows)]
+    else:
+        frames = []
+        for path in paths:
+            img = Image.open(path)
+            img.load()
+            frames.append((path, img))
+    frames = frames[:count] if count else frames
+    if not frames:
+        raise ValueError("no frames")
+    size = frames[0][1].size
+    if size[0] % TILE_SIZE or size[1] % TILE_SIZE:
+        raise ValueError(f"frame size {size[0]}x{size[1]} is not a multiple of {TILE_SIZE}")
+    for name, img in frames:
+        if img.size != size:
+            raise ValueError(f"{name} is {img.size[0]}x{img.size[1]}, first frame is {size[0]}x{size[1]}")
+    return frames
+
+
+# (height, width) bool grid per frame from the json, no priority where there is no entry
+def frame_priorities(json_path, frames, paths=None, sheet=None, frame_size=None):
+    w_px, h_px = frames[0][1].size
+    width_tiles, height_tiles = w_px // TILE_SIZE, h_px // TILE_SIZE
+    empty = np.zeros((height_tiles, width_tiles), dtype=bool)
+    if not json_path:
+        return [empty] * len(frames)
+    folder = os.path.dirname(json_path)
+    by_path = {os.path.normpath(os.path.join(folder, e["path"])): e for e in read_priorities(json_path)}
+    if sheet:
+        entry = by_path.get(os.path.normpath(sheet))
+        if entry is None:
+            return [empty] * len(frames)
+        mask = entry_mask(entry)
+        cols = mask.shape[1] // width_tiles
+        return [mask[(i // cols) * height_tiles:(i // cols + 1) * height_tiles,
+                     (i % cols) * width_tiles:(i % cols + 1) * width_tiles] for i in range(len(frames))]
+    out = []
+    for path in paths:
+        entry = by_path.get(os.path.normpath(path))
+        out.append(entry_mask(entry) if entry is not None else empty)
+    return out
+
+
+# every frame to 4 bit indices on one palette -> (list of (h, w) index arrays, 16 rgb colors)
+def quantize_frames(frames, colors=None):
+    if colors:
+        imgs = [fixed_quantize(img, colors) for _, img in frames]
+        return [image_to_indices(p) for p in imgs], palette_rgb16(imgs[0])
+    w_px, h_px = frames[0][1].size
+    stacked = Image.new("RGBA", (w_px, h_px * len(frames)))
+    for i, (_, img) in enumerate(frames):
+        stacked.paste(img.convert("RGBA"), (0, i * h_px))
+    stacked_p = stacked.convert("RGB").convert("P", palette=Image.ADAPTIVE, colors=16)
+    indices = image_to_indices(stacked_p)
+    return [indices[i * h_px:(i + 1) * h_px] for i in range(len(frames))], palette_rgb16(stacked_p)
+
+
+# ids (frames, rows, cols) 1 based global tile ids -> base ids in first use order, per frame slot tables
+# and uploads. slots: base tiles 0..len(base)-1, stream right after
+def plan_slots(ids, loop=False):
+    first = ids[0].ravel()
+    base = list(dict.fromkeys(first.tolist()))
+    slot_of = {tid: i for i, tid in enumerate(base)}
+    base_set = set(base)
+    stream_slots = 0
+    resident = {}   # stream tile id -> slot, what the previous frame left in vram
+    frames = []     # per frame: ({tile id: slot}, [(slot, tile id) uploads])
+    order = list(range(len(ids))) + ([0] if loop and len(ids) > 1 else [])
+    for step, f in enumerate(order):
+        needed = [t for t in dict.fromkeys(ids[f].ravel().tolist()) if t not in base_set]
+        kept = {t: resident[t] for t in needed if t in resident}
+        used = set(kept.values())
+        free = [s for s in range(len(base), len(base) + stream_slots) if s not in used]
+        uploads = []
+        for t in needed:
+            if t in kept:
+                continue
+            if free:
+                slot = free.pop(0)
+            else:
+                slot = len(base) + stream_slots
+                stream_slots += 1
+            kept[t] = slot
+            uploads.append((slot, t))
+        resident = kept
+        frames.append(({**slot_of, **kept}, uploads))
+    return base, stream_slots, frames, order
+
+
+def frame_words(ids, flags, prio, slots, tile_base, pal_line):
+    lookup = np.vectorize(slots.__getitem__, otypes=[np.int64])
+    return sgdk_map_words(lookup(ids) + tile_base, flags, prio, pal_line)
+
+
+def build_delta(frames, prios, colors=None, flips=True, loop=False, tile_base=0, pal_line=0):
+    indices, palette = quantize_frames(frames, colors)
+    rows, cols = indices[0].shape[0] // TILE_SIZE, indices[0].shape[1] // TILE_SIZE
+    tiles = np.concatenate([tile_view(ix) for ix in indices], axis=0)
+    unique, ids, flags = dedup_tiles(tiles, flips=flips)
+    ids = ids.reshape(len(frames), rows, cols).astype(np.int64)
+    flags = flags.reshape(len(frames), rows, cols)
+
+    base, stream_slots, plan, order = plan_slots(ids, loop)
+    if len(base) + stream_slots + tile_base > TILE_INDEX_MASK + 1:
+        print(f"[WARN] {len(base) + stream_slots} vram tiles from {tile_base} do not fit SGDK's 11 bit tile index")
+    stream_ids = sorted({t for _, uploads in plan for _, t in uploads})
+    bank_of = {t: i for i, t in enumerate(stream_ids)}
+
+    words = [frame_words(ids[f], flags[f], prios[f], plan[step][0], tile_base, pal_line)
+             for step, f in enumerate(order)]
+    records = []
+    for step, f in enumerate(order):
+        uploads = [(slot, bank_of[t]) for slot, t in plan[step][1]]
+        if step == 0:
+            cells = []
+        else:
+            changed = np.flatnonzero(words[step].ravel() != words[step - 1].ravel())
+            cells = list(zip(changed.tolist(), words[step].ravel()[changed].tolist()))
+        records.append({"frame": f, "uploads": uploads, "cells": cells})
+    if loop and len(frames) > 1:
+        records[0]["uploads"], records[0]["cells"] = records[-1]["uploads"], records[-1]["cells"]
+        records.pop()
+
+    return {
+        "palette": palette,
+        "rows": rows,
+        "cols": cols,
+        "base_tiles": tiles_to_4bpp(unique[np.array(base) - 1]),
+        "base_map": words[0],
+        "stream_tiles": tiles_to_4bpp(unique[np.array(stream_ids, dtype=np.int64) - 1]) if stream_ids else b"",
+        "stream_slots": stream_slots,
+        "records": records,
+        "frame_tiles": [len(set(ids[f].ravel().tolist())) for f in range(len(frames))],
+        "unique_tiles": len(unique),
+    }
+
+
+def delta_bytes(records):
+    out = bytearray(struct.pack(">H", len(records)))
+    offset = 2 + 4 * len(records)
+    bodies = []
+    for rec in records:
+        body = struct.pack(">HH", len(rec["uploads"]), len(rec["cells"]))
+        body += b"".join(struct.pack(">HH", slot, bank) for slot, bank in rec["uploads"])
+        body += b"".join(struct.pack(">HH", cell, word) for cell, word in rec["cells"])
+        out += struct.pack(">I", offset)
+        offset += len(body)
+        bodies.append(body)
+    return bytes(out) + b"".join(bodies)
+
+
+# per frame dma against reloading the frame whole (its tiles + the full map)
+def dma_report(delta, names):
+    map_cells = delta["rows"] * delta["cols"]
+    frames = []
+    for rec in delta["records"]:
+        f = rec["frame"]
+        dma = len(rec["uploads"]) * TILE_BYTES + len(rec["cells"]) * MAP_WORD_BYTES
+        full = delta["frame_tiles"][f] * TILE_BYTES + map_cells * MAP_WORD_BYTES
+        frames.append({"frame": f, "source": names[f], "tile_uploads": len(rec["uploads"]),
+                       "map_cells": len(rec["cells"]), "dma_bytes": dma, "full_reload_bytes": full})
+    return {
+        "map_w": delta["cols"], "map_h": delta["rows"],
+        "unique_tiles": delta["unique_tiles"],
+        "base_tiles": len(delta["base_tiles"]) // TILE_BYTES,
+        "stream_slots": delta["stream_slots"],
+        "stream_tiles": len(delta["stream_tiles"]) // TILE_BYTES,
+        "initial_dma_bytes": len(delta["base_tiles"]) + map_cells * MAP_WORD_BYTES,
+        "frames": frames,
+    }
+
+
+def header_snippet(out, report):
+    name = c_name(out)
+    up = name.upper()
+    return (f"// {os.path.basename(out)} - generated by animdelta.py\n"
+            f"#define {up}_BASE_TILES {report['base_tiles']}\n"
+            f"#define {up}_STREAM_SLOTS {report['stream_slots']}\n"
+            f"#define {up}_STREAM_TILES {report['stream_tiles']}\n"
+            f"#define {up}_FRAMES {len(report['frames'])}\n"
+            f"#define {up}_MAP_W {report['map_w']}\n"
+            f"#define {up}_MAP_H {report['map_h']}\n"
+            f"// start: VDP_loadTileData((const u32*) {name}_base_tiles, TILE_USER_INDEX, {up}_BASE_TILES, DMA);\n"
+            f"//        VDP_setTileMapDataRectEx(BG_A, (const u16*) {name}_base_map, TILE_USER_INDEX, x, y,\n"
+            f"//                                 {up}_MAP_W, {up}_MAP_H, {up}_MAP_W, DMA);\n"
+            f"// frame n: record at {name}_delta + offset[n]: every upload\n"
+            f"//   VDP_loadTileData((const u32*) {name}_stream_tiles + tile * 8, TILE_USER_INDEX + slot, 1, DMA_QUEUE);\n"
+            f"// every cell: VDP_setTileMapXY(BG_A, word + TILE_USER_INDEX, x + cell % {up}_MAP_W, y + cell / {up}_MAP_W);\n")
+
+
+def write_outputs(out, delta, names):
+    report = dma_report(delta, names)
+    files = {
+        f"{out}_base_tiles.bin": delta["base_tiles"],
+        f"{out}_base_map.bin": map_to_bytes(delta["base_map"]),
+        f"{out}_pal.bin": palette_to_vdp_bytes(delta["palette"]),
+        f"{out}_stream_tiles.bin": delta["stream_tiles"],
+        f"{out}_delta.bin": delta_bytes(delta["records"]),
+    }
+    for path, data in files.items():
+        with open(path, "wb") as f:
+            f.write(data)
+    name, file = c_name(out), os.path.basename(out)
+    with open(f"{out}.res", "w") as f:
+        for part in ("base_tiles", "base_map", "pal", "stream_tiles", "delta"):
+            f.write(f'BIN {name}_{part} "{file}_{part}.bin" 2\n')
+    with open(f"{out}_anim.h", "w") as f:
+        f.write(header_snippet(out, report))
+    with open(f"{out}_delta.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="animation frames -> base tileset + per frame vram deltas")
+    parser.add_argument("frames", nargs="*", help="frame pngs in order")
+    parser.add_argument("--sheet", help="sprite sheet png instead of frame files, cut row major")
+    parser.add_argument("--frame", type=parse_size, help="with --sheet: frame size in pixels, WxH")
+    parser.add_argument("--count", type=int, help="use only the first N frames")
+    parser.add_argument("--json", help="tile_priorities.json with the frames' (or the sheet's) priority tiles")
+    parser.add_argument("--palette", help="shared JASC .pal (16 colors or the --pal-line row)")
+    parser.add_argument("--pal-line", type=int, default=0, choices=range(4))
+    parser.add_argument("--tile-base", type=int, default=0, help="added to every tile index of the map words")
+    parser.add_argument("--no-flip", action="store_true", help="do not reuse flipped tiles")
+    parser.add_argument("--loop", action="store_true", help="frame 0 record = going back from the last frame")
+    parser.add_argument("-o", "--output", help="output base name (default: first frame / sheet name + _anim)")
+    args = parser.parse_args()
+
+    if bool(args.sheet) == bool(args.frames):
+        parser.error("give frame pngs or --sheet, one of them")
+    if args.sheet and not args.frame:
+        parser.error("--sheet needs --frame WxH")
+    frames = load_frames(args.frames, args.sheet, args.frame, args.count)
+    prios = frame_priorities(args.json, frames, args.frames, args.sheet, args.frame)
+    colors = shared_palette(args.palette, args.pal_line) if args.palette else None
+    delta = build_delta(frames, prios, colors, flips=not args.no_flip, loop=args.loop,
+                        tile_base=args.tile_base, pal_line=args.pal_line)
+    out = args.output or os.path.splitext(args.sheet or args.frames[0])[0] + "_anim"
+    report = write_outputs(out, delta, [n for n, _ in frames])
+
+    print(f"{len(frames)} frames {report['map_w']}x{report['map_h']} tiles, {report['unique_tiles']} unique tiles")
+    print(f"base {report['base_tiles']} tiles + stream {report['stream_slots']} slots "
+          f"({report['stream_tiles']} stream tiles), first load {report['initial_dma_bytes']} bytes")
+    print(f"{'frame':>5} {'uploads':>8} {'cells':>6} {'dma B':>8} {'full B':>8}")
+    for fr in report["frames"]:
+        print(f"{fr['frame']:>5} {fr['tile_uploads']:>8} {fr['map_cells']:>6} {fr['dma_bytes']:>8} "
+              f"{fr['full_reload_bytes']:>8}")
+    print(f"-> {out}_base_tiles.bin / _base_map.bin / _pal.bin / _stream_tiles.bin / _delta.bin / _delta.json")
+
+
+if __name__ == "__main__":
+    main()
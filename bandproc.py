@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# --band N: world sized maps without ever having the whole png (or any full size copy of it) in memory
+# the png is read N tile rows at a time (pngbands.py) and every band is quantized, encoded and appended to
+# the outputs right away:
+# - setprioFULLAND01.py: .pal, _map.tmx (main layer rows as they come), --dedup _tiles.png, --bin
+#   _tiles.bin / _map.bin. byte for byte what the in memory path writes. needs --palette, the ADAPTIVE
+#   quantizer has to see the whole image to pick its 16 colors. --pack needs the whole bins, not with --band
+# - pipeline.py / prepareprioasepirte.py: the final <png>_map--0.png, and the aseprite mask / _fg_ pngs,
+#   written band by band. same pixels and palette as the in memory ones (the png bytes are not)
+# memory: one band + what grows with the map in tiles, not pixels (priority grid, --dedup unique tiles)
+# outputs go to <file>.part first and are renamed at the end, a failed run leaves the old ones there
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from PIL import Image
+import instrument
+from pngbands import BandWriter, read_bands
+from prepareprioasepirte import apply_priority
+from priostore import entry_mask
+from setprioFULLAND01 import (TILE_BYTES, TILE_INDEX_MASK, TILE_SIZE, TMX_HFLIP, TMX_VFLIP, HFLIP_MASK,
+                              VFLIP_MASK, TileDedup, check_entry_image, count_written, image_to_indices,
+                              palette_lut, palette_rgb16, report_off_palette, save_palette_file, save_tileset,
+                              sgdk_map_words, tile_view, tiles_to_4bpp, tmx_attribs, warn_tile_index, write_budget)
+from sgdkbin import map_to_bytes, palette_to_vdp_bytes, write_snippets
+from sgdkpal import flat_rgb, image_to_palette_indices, lut_indices
+from tmxio import CHUNK_ROWS, LayerWriter, write_tmx_head, write_tmx_tail
+
+
+class PartFiles:
+    def __init__(self):
+        self.files = {}
+
+    def open(self, path, mode="wb"):
+        if "b" in mode:
+            f = open(path + ".part", mode)
+        else:
+            f = open(path + ".part", mode, encoding="utf-8", newline="\n")
+        self.files[path] = f
+        return f
+
+    def commit(self):
+        for path, f in self.files.items():
+            f.close()
+            os.replace(path + ".part", path)
+        return list(self.files)
+
+    def discard(self):
+        for path, f in self.files.items():
+            f.close()
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+
+
+def entry_size(entry):
+    with Image.open(entry["path"]) as head:  # header only, nothing decoded
+        return check_entry_image(entry, head)
+
+
+# same arguments as setprioFULLAND01.process_entry, band in tile rows
+def process_entry_banded(entry, band, dedup=False, flips=True, binary=False, pal_line=0, tile_base=0,
+                         tmx_encoding="csv", fixed_palette=None, strict_palette=False, budget=None, pack=None):
+    if not fixed_palette:
+        raise ValueError("--band needs --palette, the adaptive quantizer has to see the whole png")
+    if pack and pack != "none":
+        raise ValueError("--pack needs the whole bins, it does not go with --band")
+    path = entry["path"]
+    width_tiles = int(entry["width"])
+    height_tiles = int(entry["height"])
+    prio = entry_mask(entry)
+
+    if not os.path.exists(path):
+        print(f"[SKIP] '{path}' does not exist")
+        return False
+
+    print(f"[+] Processing: {path} ({width_tiles} x {height_tiles} tiles, {band} tile rows per band)")
+    w_px, h_px = entry_size(entry)
+    instrument.count("tiles", width_tiles * height_tiles)
+    instrument.count("priority_tiles", int(prio.sum()))
+
+    base, _ = os.path.splitext(path)
+    pal_img = Image.new("P", (1, 1))
+    pal_img.putpalette(flat_rgb(fixed_palette))
+    lut, exact = palette_lut(fixed_palette)
+    tiles_dedup = TileDedup(flips) if dedup else None
+    parts = PartFiles()
+    spool = None
+    off = {}
+    try:
+        if binary:
+            tiles_f, map_f = parts.open(f"{base}_tiles.bin"), parts.open(f"{base}_map.bin")
+        elif dedup:
+            spool = tempfile.TemporaryFile("w+", encoding="utf-8", newline="\n")
+            main_layer = LayerWriter(spool, 1, "main", width_tiles, height_tiles, tmx_encoding)
+
+        for y, band_img in read_bands(path, band * TILE_SIZE):
+            with instrument.stage("quantize"):
+                indices, band_off = lut_indices(band_img, lut, exact)
+            for color, n in band_off.items():
+                off[color] = off.get(color, 0) + n
+            if not binary and not dedup:
+                continue  # plain tmx: the png itself is the tileset, only the colors get checked
+            ty = y // TILE_SIZE
+            tiles = tile_view(image_to_indices(indices))
+            rows = tiles.shape[0]
+            if dedup:
+                before = tiles_dedup.count
+                with instrument.stage("dedup"):
+                    ids, flags = tiles_dedup.add(tiles)
+                new_tiles = tiles_dedup.tiles()[before:]
+            else:
+                new_tiles = tiles
+                ids = np.arange(ty * width_tiles + 1, (ty + rows) * width_tiles + 1,
+                                dtype=np.int64).reshape(rows, width_tiles)
+                flags = np.zeros_like(ids)
+            if binary:
+                with instrument.stage("bin_write"):
+                    if len(new_tiles):
+                        tiles_f.write(tiles_to_4bpp(new_tiles))
+                    words = sgdk_map_words(ids.astype(np.int64) - 1 + tile_base, flags, prio[ty:ty + rows],
+                                           pal_line)
+                    map_f.write(map_to_bytes(words))
+            else:
+                gids = ids.astype(np.uint32)
+                gids[(flags & HFLIP_MASK) != 0] |= TMX_HFLIP
+                gids[(flags & VFLIP_MASK) != 0] |= TMX_VFLIP
+                main_layer.write(gids)
+        report_off_palette(off, strict_palette)
+
+        pal_path = f"{base}.pal"
+        with instrument.stage("palette_write"):
+            save_palette_file(pal_img, pal_path)
+        print(f"    Paleta -> {pal_path}")
+        outputs = [pal_path]
+
+        if binary:
+            unique = tiles_dedup.count if dedup else width_tiles * height_tiles
+            warn_tile_index(unique, tile_base)
+            with parts.open(f"{base}_pal.bin") as f:
+                f.write(palette_to_vdp_bytes(palette_rgb16(pal_img)))
+            written = parts.commit() + write_snippets(base, unique, width_tiles, height_tiles, pal_line,
+                                                            tile_base=tile_base)
+            print(f"    SGDK bin -> {base}_tiles.bin / _map.bin / _pal.bin  (tiles: {unique})")
+            if budget:
+                written.append(write_budget(base, path, width_tiles, height_tiles, unique, prio, tile_base, budget))
+            count_written(outputs + written)
+            return outputs + written
+
+        tileset_source = os.path.basename(path)
+        tileset_w, tileset_h = w_px, h_px
+        tilecount = width_tiles * height_tiles
+        columns = width_tiles
+        if dedup:
+            unique = tiles_dedup.tiles()
+            instrument.count("unique_tiles", len(unique))
+            if len(unique) > TILE_INDEX_MASK:
+                print(f"    [WARN] {len(unique)} unique tiles, more than SGDK can index ({TILE_INDEX_MASK})")
+            tileset_path, (tileset_w, tileset_h), columns = save_tileset(base, unique, pal_img.getpalette())
+            outputs.append(tileset_path)
+            tileset_source = os.path.basename(tileset_path)
+            tilecount = len(unique)
+            cells = width_tiles * height_tiles
+            saved = (cells - len(unique)) * TILE_BYTES
+            print(f"    Tileset -> {tileset_path}  (unique tiles: {len(unique)} / {cells}, saved: {saved} bytes)")
+
+        tmx_path = f"{base}_map.tmx"
+        map_attrib, tileset_attrib, image_attrib, properties = tmx_attribs(
+            path, width_tiles, height_tiles, tileset_source, tileset_w, tileset_h, tilecount, columns, dedup)
+        with instrument.stage("tmx_write"):
+            f = parts.open(tmx_path, "w")
+            write_tmx_head(f, map_attrib, tileset_attrib, image_attrib, properties)
+            if dedup:
+                main_layer.close()
+                spool.seek(0)
+                shutil.copyfileobj(spool, f)
+            else:
+                main_layer = LayerWriter(f, 1, "main", width_tiles, height_tiles, tmx_encoding)
+                for y in range(0, height_tiles, CHUNK_ROWS):
+                    rows = min(CHUNK_ROWS, height_tiles - y)
+                    main_layer.write(np.arange(y * width_tiles + 1, (y + rows) * width_tiles + 1,
+                                               dtype=np.uint32).reshape(rows, width_tiles))
+                main_layer.close()
+            high_prio = LayerWriter(f, 2, "high_prio", width_tiles, height_tiles, tmx_encoding)
+            for y in range(0, height_tiles, CHUNK_ROWS):
+                high_prio.write(prio[y:y + CHUNK_ROWS].astype(np.uint8))
+            high_prio.close()
+            write_tmx_tail(f)
+            parts.commit()
+        print(f"    TMX -> {tmx_path}")
+        outputs.append(tmx_path)
+        if budget:
+            outputs.append(write_budget(base, path, width_tiles, height_tiles, tilecount, prio, 0, budget))
+        count_written(outputs)
+        return outputs
+    except BaseException:
+        parts.discard()
+        raise
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+# (h, w) bool tile grid -> the (rows, w_px) pixel mask of the tile rows ty .. ty + rows
+def band_mask(high_prio, ty, rows_px, w_px, tilewidth=TILE_SIZE, tileheight=TILE_SIZE):
+    rows = -(-rows_px // tileheight)
+    grid = high_prio[ty:ty + rows]
+    mask = np.zeros((rows * tileheight, w_px), dtype=bool)
+    cols = min(grid.shape[1], w_px // tilewidth)
+    mask[:grid.shape[0] * tileheight, :cols * tilewidth] = np.repeat(np.repeat(grid[:, :cols], tileheight, 0),
+                                                                     tilewidth, 1)
+    return mask[:rows_px]
+
+
+# the final indexed png (pipeline.build_entry / prepareprio native): palette indices + priority band, by bands
+def write_final_png(src, high_prio, palette, out_png, band, tilewidth=TILE_SIZE, tileheight=TILE_SIZE):
+    with Image.open(src) as head:
+        w_px, h_px = head.size
+    rows, cols = high_prio.shape
+    writer = BandWriter(out_png + ".part", w_px, h_px, "P", flat_rgb(palette), transparency=0)
+    try:
+        for y, band_img in read_bands(src, band * tileheight):
+            with instrument.stage("quantize_palette"):
+                indices = image_to_palette_indices(band_img, palette)
+            with instrument.stage("composite"):
+                ty = y // tileheight
+                rows_band = min(indices.shape[0] // tileheight, rows - ty)
+                inside = indices[:rows_band * tileheight, :cols * tilewidth]
+                inside[...] = apply_priority(inside, high_prio[ty:ty + rows_band], tilewidth, tileheight)
+            with instrument.stage("png_write"):
+                writer.write(indices)
+        writer.close()
+    except BaseException:
+        writer.f.close()
+        os.remove(out_png + ".part")
+        raise
+    os.replace(out_png + ".part", out_png)
+    instrument.count("bytes_written", os.path.getsize(out_png))
+    return out_png
+
+
+# prepareprio's aseprite inputs by bands: the png as RGBA (the _fg_ copy), or with high_prio only the flagged
+# tiles of it (create_mask_layer)
+def write_rgba_png(src, out_png, band, high_prio=None, tilewidth=TILE_SIZE, tileheight=TILE_SIZE):
+    with Image.open(src) as head:
+        w_px, h_px = head.size
+    writer = BandWriter(out_png, w_px, h_px, "RGBA")
+    for y, band_img in read_bands(src, band * tileheight):
+        rgba = np.asarray(band_img.convert("RGBA"))
+        if high_prio is not None:
+            keep = band_mask(high_prio, y // tileheight, rgba.shape[0], w_px, tilewidth, tileheight)
+            rgba = np.where(keep[..., None], rgba, 0).astype(np.uint8)
+        writer.write(rgba)
+    writer.close()
+    return out_png
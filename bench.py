@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# benchmarks for the scripts, on synthetic maps so anybody gets the same numbers (same seed, same pngs)
+# every case is a map size in tiles + a share of priority tiles. each stage is timed on its own, the
+# inputs it needs are made before the clock starts:
+#   tiles_reference    get_tile_pixels / tile_to_4bpp_bytes loop (setprioFULLAND01 --reference), only up to
+#                      --reference-limit tiles as it is really slow
+#   tiles              numpy encoder (encode_tiles)
+#   quantize_adaptive  png -> 16 colors as setprioFULLAND01 does (PIL ADAPTIVE)
+#   quantize_palette   png -> 64+ color pigsy palette as prepareprioasepirte does (sgdkpal)
+#   quantize_lut       png -> shared 16 colors through the BGR555 table (setprioFULLAND01 --palette)
+#   tmx_write          both layers to a csv tmx (tmxio.write_tmx)
+#   parse_tmx          prepareprioasepirte.parse_tmx
+#   create_mask_layer  the mask png for the aseprite backend
+#   composite_priority the native backend priority shift
+# best and median of --repeat runs go to a json (-o). --compare old.json runs the same cases again (or takes
+# --current new.json) and exits 1 if a stage got slower than --threshold (0.2 = 20%). changes under
+# --min-delta seconds are noise and never count
+#
+#   python bench.py -o baseline.json
+#   python bench.py --compare baseline.json --threshold 0.25
+#   python bench.py --sizes 40x28,512x512 --densities 0,1 --repeat 5
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+from prepareprioasepirte import composite_priority, create_mask_layer, parse_tmx
+from setprioFULLAND01 import TILE_SIZE, build_map_words, encode_tiles, encode_tiles_reference, fixed_quantize
+from sgdkpal import image_to_palette_indices
+from tmxio import write_tmx
+
+BENCH_VERSION = 1
+DEFAULT_SIZES = "40x28,128x128,512x512"
+DEFAULT_DENSITIES = "0.05,0.5"
+TILE_POOL = 256   # distinct tiles the synthetic maps are made of, so they look like a map and not noise
+SEED = 1234
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def case_name(width_tiles, height_tiles, density):
+    return f"{width_tiles}x{height_tiles}@{density:g}"
+
+
+def parse_case(name):
+    size, density = name.split("@")
+    return parse_size(size) + (float(density),)
+
+
+# 64 colors as the pigsy scheme wants (0/16/32/48 transparent) and the two bands copied after them
+def synthetic_palette(rng):
+    base = [tuple(int(v) for v in rng.integers(0, 256, 3)) + (255,) for _ in range(64)]
+    for i in range(0, 64, 16):
+        base[i] = (255, 0, 255, 255)
+    return base + base + [(c[0] // 2, c[1] // 2, c[2] // 2, 255) for c in base]
+
+
+# indexed png using PAL0 of the palette (index 0 transparent) + (height, width) bool priority grid
+def synthetic_map(rng, palette, width_tiles, height_tiles, density):
+    pool = rng.integers(0, 16, (TILE_POOL, TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+    pick = rng.integers(0, TILE_POOL, (height_tiles, width_tiles))
+    pixels = pool[pick].swapaxes(1, 2).reshape(height_tiles * TILE_SIZE, width_tiles * TILE_SIZE)
+    img = Image.fromarray(pixels, mode="P")
+    flat = []
+    for r, g, b, _ in palette[:16]:
+        flat += [r, g, b]
+    img.putpalette(flat)
+    img.info["transparency"] = 0
+    prio = rng.random((height_tiles, width_tiles)) < density
+    return img, prio
+
+
+def time_stage(func, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {"best": min(runs), "median": statistics.median(runs), "runs": len(runs)}
+
+
+def tmx_layers(width_tiles, height_tiles, prio):
+    words = build_map_words(width_tiles, height_tiles, prio)
+    gids = np.arange(1, width_tiles * height_tiles + 1, dtype=np.uint32).reshape(height_tiles, width_tiles)
+    return [("main", gids), ("high_prio", ((words & 0x8000) != 0).astype(np.uint8))]
+
+
+def write_case_tmx(tmx_path, png_name, img, width_tiles, height_tiles, prio):
+    map_attrib = {
+        "version": "1.9", "tiledversion": "1.9.2", "orientation": "orthogonal", "renderorder": "right-down",
+        "width": str(width_tiles), "height": str(height_tiles),
+        "tilewidth": str(TILE_SIZE), "tileheight": str(TILE_SIZE), "infinite": "0",
+    }
+    tileset_attrib = {"firstgid": "1", "name": "bench_tiles", "tilewidth": str(TILE_SIZE),
+                      "tileheight": str(TILE_SIZE), "tilecount": str(width_tiles * height_tiles),
+                      "columns": str(width_tiles)}
+    image_attrib = {"source": png_name, "width": str(img.size[0]), "height": str(img.size[1])}
+    write_tmx(tmx_path, map_attrib, tileset_attrib, image_attrib, tmx_layers(width_tiles, height_tiles, prio))
+
+
+# -> {stage: {best, median, runs}} for one case
+def run_case(width_tiles, height_tiles, density, repeat, reference_limit, workdir):
+    rng = np.random.default_rng(SEED)
+    palette = synthetic_palette(rng)
+    img, prio = synthetic_map(rng, palette, width_tiles, height_tiles, density)
+    png_path = os.path.join(workdir, "bench.png")
+    tmx_path = os.path.join(workdir, "bench_map.tmx")
+    img.save(png_path)
+    with Image.open(png_path) as f:
+        img = f.copy()
+    rgba = img.convert("RGBA")
+    img_p = img.convert("P", palette=Image.ADAPTIVE, colors=16)
+
+    stages = {}
+    if width_tiles * height_tiles <= reference_limit:
+        coords = {(int(x), int(y)) for y, x in zip(*np.nonzero(prio))}
+        stages["tiles_reference"] = time_stage(
+            lambda: encode_tiles_reference(img_p, width_tiles, height_tiles, coords), repeat)
+    stages["tiles"] = time_stage(lambda: encode_tiles(img_p, width_tiles, height_tiles, prio), repeat)
+    stages["quantize_adaptive"] = time_stage(
+        lambda: rgba.convert("RGB").convert("P", palette=Image.ADAPTIVE, colors=16), repeat)
+    stages["quantize_palette"] = time_stage(lambda: image_to_palette_indices(rgba, palette), repeat)
+    fixed_quantize(rgba, palette[:16])  # lut built once per batch, not timed
+    stages["quantize_lut"] = time_stage(lambda: fixed_quantize(rgba, palette[:16]), repeat)
+    stages["tmx_write"] = time_stage(
+        lambda: write_case_tmx(tmx_path, "bench.png", img, width_tiles, height_tiles, prio), repeat)
+    stages["parse_tmx"] = time_stage(lambda: parse_tmx(tmx_path), repeat)
+    _, geom, layers = parse_tmx(tmx_path)
+    stages["create_mask_layer"] = time_stage(lambda: create_mask_layer(rgba, layers, geom), repeat)
+    indices = image_to_palette_indices(rgba, palette)
+    stages["composite_priority"] = time_stage(lambda: composite_priority(indices, layers, geom), repeat)
+    return stages
+
+
+def run_all(cases, repeat, reference_limit):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="sgdkbench") as workdir:
+        for width_tiles, height_tiles, density in cases:
+            name = case_name(width_tiles, height_tiles, density)
+            print(f"[bench] {name}", file=sys.stderr)
+            results[name] = run_case(width_tiles, height_tiles, density, repeat, reference_limit, workdir)
+    return {
+        "version": BENCH_VERSION,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": Image.__version__,
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def print_table(report):
+    print(f"{'case':<18} {'stage':<20} {'best ms':>10} {'median ms':>10}")
+    for name, stages in report["results"].items():
+        for stage, t in stages.items():
+            print(f"{name:<18} {stage:<20} {t['best'] * 1000:>10.2f} {t['median'] * 1000:>10.2f}")
+
+
+# -> list of (case, stage, old, new, ratio) that got slower than allowed, best times compared
+def find_regressions(old, new, threshold, min_delta):
+    regressions = []
+    print(f"{'case':<18} {'stage':<20} {'old ms':>10} {'new ms':>10} {'change':>8}")
+    for name, stages in old["results"].items():
+        for stage, t in stages.items():
+            current = new["results"].get(name, {}).get(stage)
+            if current is None:
+                continue
+            before, after = t["best"], current["best"]
+            ratio = after / before if before > 0 else float("inf")
+            slower = ratio > 1 + threshold and after - before > min_delta
+            flag = "  REGRESSION" if slower else ""
+            print(f"{name:<18} {stage:<20} {before * 1000:>10.2f} {after * 1000:>10.2f} {ratio - 1:>+8.1%}{flag}")
+            if slower:
+                regressions.append((name, stage, before, after, ratio))
+    return regressions
+
+
+def load_report(path):
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    if report.get("version") != BENCH_VERSION:
+        raise ValueError(f"{path} is bench format {report.get('version')}, this script writes {BENCH_VERSION}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="time the scripts' stages on synthetic SGDK maps")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="map sizes in tiles, comma separated WxH")
+    parser.add_argument("--densities", default=DEFAULT_DENSITIES, help="share of priority tiles, 0..1")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, best and median are kept")
+    parser.add_argument("--reference-limit", type=int, default=128 * 128,
+                        help="biggest map (in tiles) the getpixel reference encoder is timed on")
+    parser.add_argument("-o", "--output", help="write the results json here")
+    parser.add_argument("--compare", metavar="BASELINE", help="results json to check against")
+    parser.add_argument("--current", help="with --compare: results json to check instead of running")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--min-delta", type=float, default=0.002, help="seconds below which changes are noise")
+    args = parser.parse_args()
+
+    baseline = load_report(args.compare) if args.compare else None
+    if args.current:
+        report = load_report(args.current)
+    else:
+        if baseline is not None:
+            cases = [parse_case(name) for name in baseline["results"]]
+        else:
+            cases = [parse_size(s) + (float(d),) for s in args.sizes.split(",") for d in args.densities.split(",")]
+        report = run_all(cases, args.repeat, args.reference_limit)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+
+    if baseline is None:
+        print_table(report)
+        return
+    regressions = find_regressions(baseline, report, args.threshold, args.min_delta)
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) slower than {args.threshold:.0%} over {args.compare}")
+        sys.exit(1)
+    print(f"\nno regressions over {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# build manifest for setprioFULLAND01.py so "Generate" only redoes the images that really changed
+# lives next to the json as <json name>.build.json, one record per entry path with:
+# - the png stat (mtime + size) and a hash of its decoded pixels + palette
+# - a hash of the priority tile set and the image size in tiles
+# - generator version and the options used (dedup etc.)
+# - the files written, so we know they are still there
+# if the png stat changed but the pixels did not (touched, re-saved) it still counts as unchanged
+
+import hashlib
+import json
+import os
+import numpy as np
+from PIL import Image
+from pngbands import png_size, read_bands
+from priostore import entry_mask
+
+MANIFEST_SUFFIX = ".build.json"
+HASH_BAND_ROWS = 256
+
+
+def manifest_path_for(json_path, suffix=MANIFEST_SUFFIX):
+    base, _ = os.path.splitext(json_path)
+    return base + suffix
+
+
+# img: the png already decoded (watch.py keeps them), otherwise read HASH_BAND_ROWS rows at a time (same
+# hash, the pixel bytes go in the same order) so --band maps are never whole in memory here either
+def pixel_hash(path, img=None):
+    if img is not None:
+        return image_hash(img)
+    try:
+        h = None
+        for y, band in read_bands(path, HASH_BAND_ROWS):
+            if h is None:
+                h = hash_head(band.mode, png_size(path)[:2], band)
+            h.update(band.tobytes())
+        return h.hexdigest()
+    except ValueError:  # not a png
+        with Image.open(path) as img:
+            return image_hash(img)
+
+
+def hash_head(mode, size, img):
+    h = hashlib.sha1()
+    h.update(f"{mode}:{size}".encode())
+    palette = img.getpalette() if mode == "P" else None
+    if palette:
+        h.update(bytes(palette))
+    return h
+
+
+def image_hash(img):
+    h = hash_head(img.mode, img.size, img)
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def priority_hash(entry):
+    h = hashlib.sha1(f"{entry.get('width')}x{entry.get('height')}".encode())
+    h.update(np.packbits(entry_mask(entry)).tobytes())
+    return h.hexdigest()
+
+
+def file_stat(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+class BuildCache:
+    # suffix: other tools building from the same json keep their own manifest
+    def __init__(self, json_path, version, options, suffix=MANIFEST_SUFFIX):
+        self.path = manifest_path_for(json_path, suffix)
+        self.version = str(version)
+        self.options = dict(options)
+        self.records = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.records = json.load(f).get("entries", {})
+            except (OSError, ValueError) as e:
+                print(f"[CACHE] unreadable manifest {self.path}, starting clean: {e}")
+
+    # everything but the outputs; pixel hash only recomputed when the png stat moved
+    def fingerprint(self, entry, img=None):
+        path = entry["path"]
+        stat = file_stat(path)
+        old = self.records.get(path, {})
+        pixels = old.get("pixels") if old.get("stat") == stat else None
+        return {
+            "stat": stat,
+            "pixels": pixels or pixel_hash(path, img),
+            "priority": priority_hash(entry),
+            "version": self.version,
+            "options": self.options,
+        }
+
+    def is_fresh(self, entry, fp):
+        old = self.records.get(entry["path"])
+        if not old or not old.get("outputs"):
+            return False
+        for key in ("pixels", "priority", "version", "options"):
+            if old.get(key) != fp[key]:
+                return False
+        if not all(os.path.exists(p) for p in old["outputs"]):
+            return False
+        old["stat"] = fp["stat"]
+        return True
+
+    def record(self, entry, fp, outputs):
+        self.records[entry["path"]] = dict(fp, outputs=list(outputs))
+
+    def forget(self, path):
+        self.records.pop(path, None)
+
+    # drops records of entries gone from the json (or whose png is gone) and deletes their outputs
+    def prune(self, entries):
+        alive = {e["path"] for e in entries if os.path.exists(e["path"])}
+        removed = []
+        for path in [p for p in self.records if p not in alive]:
+            for out in self.records.pop(path).get("outputs", []):
+                if os.path.exists(out):
+                    os.remove(out)
+            removed.append(path)
+        return removed
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"entries": self.records}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
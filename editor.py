@@ -4,12 +4,23 @@
 # that will be loaded on the central canvas. Then select one by one tiles (8x8) by clicking on it or just press down the
 # left mouse button to select as you run the cursor over them. Can make zoom in and out using
 # the wheel. It constantly saves the state on a json so you can get your work where you left it if
-# the json is on the same folder. Once that's generated, calls setprioFULLAND01.py that generates
-# tmx and pal (pal bin format, barely tested as lately i did not care - legacy code) 
+# the json is on the same folder. (not on every mouse move anymore: changes are kept in memory and
+# journaled a moment after you stop, fully written on button release and on close - see priostore.py)
+# Big maps: only what you see gets drawn. the zoomed image is built in chunks kept on a small LRU
+# cache, grid lines only for the visible rows/cols. Scroll with the bars or drag with the middle button.
+# The image list fills itself in the background: thumbnails come from worker threads (cached on disk on
+# .thumbcache/, see thumbcache.py), only the rows you can see exist, and new/removed pngs show up alone. Generate
+# builds right here on a background thread (pipeline.py): tmx and pal as setprioFULLAND01.py, and with a JASC .pal
+# on the folder also the final <png>_map--0.png, so prepareprioaseprite is not needed anymore
+# Preview shows the final look right on the canvas (the <png>_map--0.png Generate would write: marked tiles on
+# the +128 band of the .pal of the folder). built once per image, then every click only redoes that 8x8 tile
+# SGDK_PROFILE=1 python editor.py times image loads, zoom chunks, redraws, thumbnails and saves, the
+# trace (sgdk_profile.json) and a summary come out when the window is closed - see instrument.py
 
 # THE RIGHT FLOW IS:
-# $ python editor.py
-# $ python prepareprioaseprite palette.pal 
+# $ python editor.py   (Generate, with palette.pal on the folder)
+# or without the gui: $ python pipeline.py palette.pal
+# (the old way still works: $ python prepareprioaseprite palette.pal)
 # after that, just take the <original_png_file_name>_map--0.png and use with resources.res and SGDK
 # 5 scripts involved and 1 palette needed - just read all the script first lines to get an idea
 # editor.py - which should be runned first - it's the GUI
@@ -22,18 +33,57 @@
 # some day i will make a canonical repo README.md.
 
 import os
-import json
 import tkinter as tk
-from tkinter import filedialog
+from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
-import subprocess
 import math
+import multiprocessing
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import instrument
+import pipeline
+from prepareprioasepirte import apply_priority
+from priostore import PriorityStore
+from sgdkpal import image_to_palette_indices, indexed_image, load_jasc_pal
+from thumbcache import ThumbCache
 
 TILE_SIZE = 8
 GRID_COLOR = "#00FF00"
 SELECT_COLOR = "#8080FF"
 STIPPLE_PATTERN = "gray25"
 OUTPUT_JSON = "tile_priorities.json"
+FLUSH_DELAY_MS = 300
+CHUNK_SCREEN_PX = 512    # zoomed chunk size the view is built with
+CHUNK_CACHE_SIZE = 48    # zoomed chunks kept around, this is what bounds memory at any image size
+THUMB_ROW_H = 160        # one image list row: thumbnail + name
+THUMB_WORKERS = 2
+THUMB_POLL_MS = 40       # how often finished thumbnails are picked up
+FOLDER_POLL_MS = 2000    # how often the folder is checked for new/removed pngs
+BUILD_POLL_MS = 200      # how often a running Generate is checked
+
+
+# zoomed pieces of the current image, least recently used goes away first
+class ZoomChunkCache:
+    def __init__(self, max_items=CHUNK_CACHE_SIZE):
+        self.items = OrderedDict()
+        self.max_items = max_items
+
+    def get(self, key, make):
+        photo = self.items.get(key)
+        if photo is None:
+            photo = make()
+            self.items[key] = photo
+            if len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+        else:
+            self.items.move_to_end(key)
+        return photo
+
+    def clear(self):
+        self.items.clear()
 
 
 class TilePriorityEditor:
@@ -42,18 +92,39 @@ class TilePriorityEditor:
         self.root.title("Tile Priority Editor")
 
         self.image_folder = image_folder
-        self.current_image = None
+        self.original_image = None
         self.current_image_name = None
-        self.tile_data = []
+        self.zoom_cache = ZoomChunkCache()
+        self.chunk_items = {}  # chunk key -> (canvas item, PhotoImage) on screen now
+        self.render_job = None
+        self.thumb_cache = ThumbCache(image_folder)
+        self.thumb_pool = ThreadPoolExecutor(max_workers=THUMB_WORKERS)
+        self.thumb_done = queue.Queue()
+        self.thumb_files = []      # sorted png names, one list row each
+        self.thumb_images = {}     # name -> (PIL thumbnail, file stamp), once a worker delivered it
+        self.thumb_requested = set()
+        self.thumb_rows = {}       # name -> (canvas window, button), only for rows near the view
+        self.thumb_poll_job = None
+        self.tile_items = {}  # (x, y) -> canvas rectangle of the current image
         self.json_path = os.path.join(image_folder, OUTPUT_JSON)
 
         self.zoom = 1.0
         self.is_dragging = False
         self.current_action = None  # "add" o "remove"
+        self.flush_job = None
+        self.build_thread = None
+        self.build_result = None
+        self.palette_path = None
+        self.preview = False
+        self.preview_palette = None
+        self.preview_indices = None   # (h, w) palette indices of the current image, before priority
+        self.preview_image = None     # what the canvas shows in preview mode, patched tile by tile
+        self.preview_items = {}       # (x, y) -> (canvas image, PhotoImage) of tiles redone since the last redraw
 
         self.load_json()
         self.build_ui()
         self.load_thumbnails()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     # make lines thin/thicker on zoom 
     def _line_width(self):
@@ -61,30 +132,39 @@ class TilePriorityEditor:
 
     # mr.Voorhees stuff
     def load_json(self):
-        if os.path.exists(self.json_path):
-            with open(self.json_path, "r") as f:
-                self.tile_data = json.load(f)
-        else:
-            self.tile_data = []
+        self.store = PriorityStore(self.json_path)
 
+    # writes everything now, journal included
     def save_json(self):
-        with open(self.json_path, "w") as f:
-            json.dump(self.tile_data, f, indent=2)
-        print(f"[Guardado automático] {self.json_path}")
+        self.cancel_flush()
+        self.store.flush(compact=True)
+
+    # debounced: every change pushes the write a bit further
+    def schedule_flush(self):
+        self.cancel_flush()
+        self.flush_job = self.root.after(FLUSH_DELAY_MS, self.flush_now)
+
+    def cancel_flush(self):
+        if self.flush_job is not None:
+            self.root.after_cancel(self.flush_job)
+            self.flush_job = None
+
+    def flush_now(self):
+        self.flush_job = None
+        with instrument.stage("flush"):
+            self.store.flush()
+
+    def on_close(self):
+        self.save_json()
+        self.thumb_pool.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+        instrument.finish()
+
+    def image_path_bin(self, name):
+        return f"{os.path.splitext(name)[0]}.png"
 
     def get_entry_for_image(self, name, width, height):
-        path_bin = f"{os.path.splitext(name)[0]}.png"
-        for entry in self.tile_data:
-            if entry["path"] == path_bin:
-                return entry
-        entry = {
-            "path": path_bin,
-            "width": width // TILE_SIZE,
-            "height": height // TILE_SIZE,
-            "priority_tiles": []
-        }
-        self.tile_data.append(entry)
-        return entry
+        return self.store.entry_for(self.image_path_bin(name), width // TILE_SIZE, height // TILE_SIZE)
 
     # winning award user interface
     def build_ui(self):
@@ -101,23 +181,32 @@ class TilePriorityEditor:
         )
         btn_generate.pack(fill=tk.X, padx=5, pady=5)
 
+        self.btn_preview = tk.Button(
+            self.frame_left,
+            text="Preview: off",
+            command=self.toggle_preview
+        )
+        self.btn_preview.pack(fill=tk.X, padx=5, pady=(0, 5))
+
         self.frame_center = tk.Frame(self.root)
         self.frame_center.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
 
         self.canvas_list = tk.Canvas(self.frame_left, width=150)
         self.scrollbar = tk.Scrollbar(self.frame_left, orient=tk.VERTICAL, command=self.canvas_list.yview)
-        self.scrollable_frame = tk.Frame(self.canvas_list)
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas_list.configure(scrollregion=self.canvas_list.bbox("all"))
-        )
-        self.canvas_list.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas_list.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas_list.configure(yscrollcommand=self.on_list_view)
+        self.canvas_list.bind("<Configure>", lambda e: self.update_list_rows())
         self.canvas_list.pack(side=tk.LEFT, fill=tk.Y)
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
         # main Canvas
-        self.canvas = tk.Canvas(self.frame_center, bg="black")
+        self.hbar = tk.Scrollbar(self.frame_center, orient=tk.HORIZONTAL)
+        self.vbar = tk.Scrollbar(self.frame_center, orient=tk.VERTICAL)
+        self.canvas = tk.Canvas(self.frame_center, bg="black",
+                                xscrollcommand=self.on_xview, yscrollcommand=self.on_yview)
+        self.hbar.configure(command=self.canvas.xview)
+        self.vbar.configure(command=self.canvas.yview)
+        self.hbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.vbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.canvas.pack(expand=True, fill=tk.BOTH)
 
         self.canvas.bind("<Button-1>", self.on_click)
@@ -129,35 +218,147 @@ class TilePriorityEditor:
         self.canvas.bind("<MouseWheel>", self.on_zoom)  
         self.canvas.bind("<Button-4>", self.on_zoom)  
         self.canvas.bind("<Button-5>", self.on_zoom)  
+        self.canvas.bind("<Button-2>", self.on_pan_start)
+        self.canvas.bind("<B2-Motion>", self.on_pan)
+        self.canvas.bind("<Configure>", lambda e: self.schedule_render())
+
+    def list_pngs(self):
+        return sorted(f for f in os.listdir(self.image_folder) if f.lower().endswith(".png"))
 
     def load_thumbnails(self):
-        files = [f for f in os.listdir(self.image_folder) if f.lower().endswith(".png")]
-        for fname in sorted(files):
-            path = os.path.join(self.image_folder, fname)
-            img = Image.open(path)
-            img.thumbnail((128, 128))
-            img_tk = ImageTk.PhotoImage(img)
-
-            btn = tk.Button(
-                self.scrollable_frame,
-                image=img_tk,
-                text=fname,
-                compound="top",
-                command=lambda n=fname: self.load_image(n)
-            )
-            btn.image = img_tk
-            btn.pack(pady=5)
+        self.thumb_files = self.list_pngs()
+        self.layout_list()
+        self.root.after(FOLDER_POLL_MS, self.refresh_thumbnails)
+
+    # only what changed: gone files lose their row, new ones get one, the rest just move
+    def refresh_thumbnails(self):
+        files = self.list_pngs()
+        if files != self.thumb_files:
+            for name in set(self.thumb_files) - set(files):
+                self.forget_thumbnail(name)
+            self.thumb_files = files
+            self.layout_list()
+            self.thumb_pool.submit(self.thumb_cache.prune,
+                                   [os.path.join(self.image_folder, f) for f in files])
+        else:
+            # same names, but an edited png needs a new thumbnail
+            for name, (_, stamp) in list(self.thumb_images.items()):
+                if stamp != self.file_stamp(os.path.join(self.image_folder, name)):
+                    self.forget_thumbnail(name)
+            self.update_list_rows()
+        self.root.after(FOLDER_POLL_MS, self.refresh_thumbnails)
+
+    def forget_thumbnail(self, name):
+        self.drop_list_row(name)
+        self.thumb_images.pop(name, None)
+        self.thumb_requested.discard(name)
+
+    def file_stamp(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def layout_list(self):
+        self.canvas_list.configure(scrollregion=(0, 0, 150, len(self.thumb_files) * THUMB_ROW_H))
+        for i, name in enumerate(self.thumb_files):
+            if name in self.thumb_rows:
+                self.canvas_list.coords(self.thumb_rows[name][0], 0, i * THUMB_ROW_H)
+        self.update_list_rows()
+
+    def on_list_view(self, *args):
+        self.scrollbar.set(*args)
+        self.update_list_rows()
+
+    # visible rows (+1 each side) get a button and a thumbnail request, the others are destroyed
+    def update_list_rows(self):
+        top = self.canvas_list.canvasy(0)
+        height = self.canvas_list.winfo_height()
+        first = max(0, int(top // THUMB_ROW_H) - 1)
+        last = min(len(self.thumb_files), int((top + height) // THUMB_ROW_H) + 2)
+        wanted = self.thumb_files[first:last]
+        for name in [n for n in self.thumb_rows if n not in wanted]:
+            self.drop_list_row(name)
+        for i, name in enumerate(wanted, start=first):
+            if name not in self.thumb_rows:
+                self.make_list_row(i, name)
+            if name not in self.thumb_images and name not in self.thumb_requested:
+                self.request_thumbnail(name)
+
+    def make_list_row(self, i, name):
+        btn = tk.Button(
+            self.canvas_list,
+            text=name,
+            compound="top",
+            command=lambda n=name: self.load_image(n)
+        )
+        if name in self.thumb_images:
+            self.set_row_image(btn, self.thumb_images[name][0])
+        item = self.canvas_list.create_window((0, i * THUMB_ROW_H), window=btn, anchor="nw")
+        self.thumb_rows[name] = (item, btn)
+
+    def drop_list_row(self, name):
+        row = self.thumb_rows.pop(name, None)
+        if row:
+            self.canvas_list.delete(row[0])
+            row[1].destroy()
+
+    def set_row_image(self, btn, thumb):
+        img_tk = ImageTk.PhotoImage(thumb)
+        btn.configure(image=img_tk)
+        btn.image = img_tk
+
+    def request_thumbnail(self, name):
+        path = os.path.join(self.image_folder, name)
+        self.thumb_requested.add(name)
+        stamp = self.file_stamp(path)
+        future = self.thumb_pool.submit(self.make_thumbnail, path)
+        future.add_done_callback(lambda f, n=name, st=stamp: self.thumb_done.put((n, st, f)))
+        if self.thumb_poll_job is None:
+            self.thumb_poll_job = self.root.after(THUMB_POLL_MS, self.poll_thumbnails)
+
+    # worker thread
+    def make_thumbnail(self, path):
+        with instrument.stage("thumbnail", path):
+            return self.thumb_cache.get(path)
+
+    # tk is not thread safe: workers only fill the queue, PhotoImages are made here
+    def poll_thumbnails(self):
+        self.thumb_poll_job = None
+        while True:
+            try:
+                name, stamp, future = self.thumb_done.get_nowait()
+            except queue.Empty:
+                break
+            if name not in self.thumb_requested:
+                continue  # removed or changed meanwhile
+            if future.exception() is not None:
+                print(f"[Thumbnail] {name}: {future.exception()}")
+                self.thumb_requested.discard(name)
+                continue
+            self.thumb_images[name] = (future.result(), stamp)
+            if name in self.thumb_rows:
+                self.set_row_image(self.thumb_rows[name][1], future.result())
+        if len(self.thumb_images) < len(self.thumb_requested):
+            self.thumb_poll_job = self.root.after(THUMB_POLL_MS, self.poll_thumbnails)
 
     def load_image(self, name):
         path = os.path.join(self.image_folder, name)
         self.current_image_name = name
-        self.original_image = Image.open(path)
+        with instrument.stage("load_image", name):
+            self.original_image = Image.open(path)
+            self.original_image.load()
+        self.make_preview()
+        self.zoom_cache.clear()
         self.update_zoom_image()
+        self.canvas.xview_moveto(0)
+        self.canvas.yview_moveto(0)
         self.draw_selected_tiles()
 
     # Zoom stuff
     def on_zoom(self, event):
-        if not self.current_image:
+        if self.original_image is None:
             return
         delta = 0
         if hasattr(event, "delta") and event.delta:
@@ -175,63 +376,153 @@ class TilePriorityEditor:
         self.zoom = max(0.5, min(8.0, self.zoom))
 
         if abs(self.zoom - old_zoom) > 1e-3:
+            # keep the image point under the mouse where it is
+            ratio = self.zoom / old_zoom
+            mx, my = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
             self.update_zoom_image()
-            self.draw_selected_tiles()
+            zw, zh = self.zoomed_size()
+            self.canvas.xview_moveto(max(0, mx * ratio - event.x) / zw)
+            self.canvas.yview_moveto(max(0, my * ratio - event.y) / zh)
+            # selection rectangles just get scaled, no need to rebuild them
+            self.canvas.scale("selection", 0, 0, ratio, ratio)
+            self.canvas.itemconfigure("selection", width=self._line_width())
 
-    def update_zoom_image(self):
+    def zoomed(self, v):
+        return int(round(v * self.zoom))
+
+    def zoomed_size(self):
         w, h = self.original_image.size
-        zw, zh = int(round(w * self.zoom)), int(round(h * self.zoom))
-        self.current_image = self.original_image.resize((zw, zh), Image.NEAREST)
-        self.tk_image = ImageTk.PhotoImage(self.current_image)
-        self.canvas.delete("all")
-        self.canvas.create_image(0, 0, anchor="nw", image=self.tk_image)
-        self.draw_grid(zw, zh)
+        return max(1, self.zoomed(w)), max(1, self.zoomed(h))
+
+    # new zoom: drop what is on screen, the view gets rebuilt from the chunk cache
+    def update_zoom_image(self):
+        zw, zh = self.zoomed_size()
+        self.canvas.delete("img")
+        self.chunk_items = {}
+        self.preview_items = {}
+        self.canvas.configure(scrollregion=(0, 0, zw, zh))
+        self.schedule_render()
+
+    # scrollbars, panning, resizing and zoom all end here, once per idle loop
+    def schedule_render(self):
+        if self.render_job is None:
+            self.render_job = self.root.after_idle(self.render_view)
+
+    def on_xview(self, *args):
+        self.hbar.set(*args)
+        self.schedule_render()
+
+    def on_yview(self, *args):
+        self.vbar.set(*args)
+        self.schedule_render()
+
+    def on_pan_start(self, event):
+        self.canvas.scan_mark(event.x, event.y)
+
+    def on_pan(self, event):
+        self.canvas.scan_dragto(event.x, event.y, gain=1)
+
+    # visible part of the zoomed image in canvas coords
+    def visible_box(self):
+        zw, zh = self.zoomed_size()
+        x0, y0 = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        x1, y1 = x0 + self.canvas.winfo_width(), y0 + self.canvas.winfo_height()
+        return max(0, x0), max(0, y0), min(zw, x1), min(zh, y1)
+
+    # source pixels per chunk side at the current zoom (or the given one), whole tiles
+    def chunk_src(self, zoom=None):
+        return max(TILE_SIZE, int(CHUNK_SCREEN_PX / (zoom or self.zoom)) // TILE_SIZE * TILE_SIZE)
+
+    def make_chunk(self, cx, cy, size):
+        source = self.preview_image if self.preview_image is not None else self.original_image
+        w, h = source.size
+        box = (cx * size, cy * size, min(w, (cx + 1) * size), min(h, (cy + 1) * size))
+        # edges rounded the same way for every chunk, so neighbours meet without gaps
+        zsize = (self.zoomed(box[2]) - self.zoomed(box[0]), self.zoomed(box[3]) - self.zoomed(box[1]))
+        instrument.count("zoom_chunks")
+        with instrument.stage("zoom_chunk", self.current_image_name):
+            return ImageTk.PhotoImage(source.crop(box).resize(zsize, Image.NEAREST))
+
+    def render_view(self):
+        self.render_job = None
+        if self.original_image is None:
+            return
+        with instrument.stage("render_view", self.current_image_name):
+            self.draw_view()
+
+    def draw_view(self):
+        x0, y0, x1, y1 = self.visible_box()
+        size = self.chunk_src()
+        src_step = size * self.zoom
+        wanted = set()
+        if x1 > x0 and y1 > y0:
+            for cy in range(int(y0 // src_step), int((y1 - 1) // src_step) + 1):
+                for cx in range(int(x0 // src_step), int((x1 - 1) // src_step) + 1):
+                    wanted.add((round(self.zoom, 6), cx, cy))
+
+        for key in [k for k in self.chunk_items if k not in wanted]:
+            self.canvas.delete(self.chunk_items.pop(key)[0])
+        for key in wanted - self.chunk_items.keys():
+            _, cx, cy = key
+            photo = self.zoom_cache.get(key, lambda: self.make_chunk(cx, cy, size))
+            item = self.canvas.create_image(self.zoomed(cx * size), self.zoomed(cy * size),
+                                            anchor="nw", image=photo, tags="img")
+            self.chunk_items[key] = (item, photo)
+        self.canvas.tag_lower("img")
+        self.draw_grid()
 
     # Mouse Tile selection 
     def on_click(self, event):
         self.is_dragging = True
         self.current_action = "add"
-        self.toggle_tile(event.x, event.y, add=True)
+        self.toggle_tile(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y), add=True)
 
     def on_right_click(self, event):
         self.is_dragging = True
         self.current_action = "remove"
-        self.toggle_tile(event.x, event.y, add=False)
+        self.toggle_tile(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y), add=False)
 
     def on_drag(self, event):
         if not self.is_dragging:
             return
         add = self.current_action == "add"
-        self.toggle_tile(event.x, event.y, add)
+        self.toggle_tile(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y), add)
 
     def on_release(self, event):
         self.is_dragging = False
         self.current_action = None
+        self.save_json()
 
     def toggle_tile(self, px, py, add):
-        if not self.current_image:
+        if self.original_image is None:
             return
 
         tx = int(px // (TILE_SIZE * self.zoom))
         ty = int(py // (TILE_SIZE * self.zoom))
 
         w, h = self.original_image.size
-        entry = self.get_entry_for_image(self.current_image_name, w, h)
-        existing = next((t for t in entry["priority_tiles"] if t["x"] == tx and t["y"] == ty), None)
-
-        if add and not existing:
-            entry["priority_tiles"].append({"x": tx, "y": ty})
-        elif not add and existing:
-            entry["priority_tiles"].remove(existing)
-
-        self.save_json()
-        self.draw_selected_tiles()
+        if not (0 <= tx < w // TILE_SIZE and 0 <= ty < h // TILE_SIZE):
+            return
+        changed = self.store.set_tile(self.image_path_bin(self.current_image_name),
+                                      w // TILE_SIZE, h // TILE_SIZE, tx, ty, add)
+        if not changed:
+            return
 
-    def draw_grid(self, zw=0, zh=0):
-        if not self.current_image:
+        self.schedule_flush()
+        if self.preview_image is not None:
+            self.update_preview_tile(tx, ty, add)
+        if add:
+            self.draw_tile(tx, ty)
+        else:
+            item = self.tile_items.pop((tx, ty), None)
+            if item is not None:
+                self.canvas.delete(item)
+
+    # only the lines crossing the visible part
+    def draw_grid(self):
+        self.canvas.delete("grid")
+        if self.original_image is None:
             return
-        if zw == 0 or zh == 0:
-            zw, zh = self.current_image.size
 
         # col/row num from original image
         orig_w, orig_h = self.original_image.size
@@ -240,51 +531,170 @@ class TilePriorityEditor:
 
         step = TILE_SIZE * self.zoom
         lw = self._line_width()
+        x0, y0, x1, y1 = self.visible_box()
 
         # grid vertical lines
-        for i in range(cols + 1):
+        for i in range(int(x0 // step), min(cols, int(x1 // step)) + 1):
             x = int(round(i * step))
-            self.canvas.create_line(x, 0, x, zh, fill=GRID_COLOR, width=lw, tags="grid")
+            self.canvas.create_line(x, y0, x, y1, fill=GRID_COLOR, width=lw, tags="grid")
 
         # grid horizontal lines
-        for j in range(rows + 1):
+        for j in range(int(y0 // step), min(rows, int(y1 // step)) + 1):
             y = int(round(j * step))
-            self.canvas.create_line(0, y, zw, y, fill=GRID_COLOR, width=lw, tags="grid")
+            self.canvas.create_line(x0, y, x1, y, fill=GRID_COLOR, width=lw, tags="grid")
+        self.canvas.tag_raise("selection")
 
     def draw_selected_tiles(self):
         if not self.current_image_name:
             return
         self.canvas.delete("selection")
+        self.tile_items = {}
+        for tx, ty in self.store.tiles_for(self.image_path_bin(self.current_image_name)):
+            self.draw_tile(tx, ty)
 
-        w, h = self.original_image.size
-        entry = self.get_entry_for_image(self.current_image_name, w, h)
+    # one selection rectangle, remembered so removing the tile deletes just that one
+    def draw_tile(self, tx, ty):
         step = TILE_SIZE * self.zoom
         lw = self._line_width()
-
-        for t in entry["priority_tiles"]:
-            x0, y0 = t["x"] * step, t["y"] * step
-            x1, y1 = x0 + step, y0 + step
-            self.canvas.create_rectangle(
-                x0, y0, x1, y1,
-                outline="red",
-                width=lw,
-                tags="selection",
-                fill=SELECT_COLOR,
-                stipple=STIPPLE_PATTERN
-            )
+        x0, y0 = tx * step, ty * step
+        x1, y1 = x0 + step, y0 + step
+        self.tile_items[(tx, ty)] = self.canvas.create_rectangle(
+            x0, y0, x1, y1,
+            outline="red",
+            width=lw,
+            tags="selection",
+            fill=SELECT_COLOR,
+            stipple=STIPPLE_PATTERN
+        )
 
    
-    def generate_bin_tmx(self):
-        json_path = os.path.join(self.image_folder, OUTPUT_JSON)
-        # call the tmx maker
-        script_path = os.path.join(self.image_folder, "setprioFULLAND01.py")
+    # Preview stuff
+    def toggle_preview(self):
+        if not self.preview and self.preview_palette is None:
+            palette = self.pick_palette()
+            if not palette:
+                messagebox.showinfo("Preview", "Preview needs a JASC .pal on the folder")
+                return
+            self.preview_palette = load_jasc_pal(palette)
+        self.preview = not self.preview
+        self.btn_preview.configure(text=f"Preview: {'on' if self.preview else 'off'}")
+        if self.original_image is None:
+            return
+        self.make_preview()
+        self.zoom_cache.clear()
+        self.update_zoom_image()
 
-        if not os.path.exists(script_path):
-            tk.messagebox.showerror("Error", f"File not found: {script_path}")
+    # whole image, once: palette indices as pipeline.py maps them + every marked tile shifted
+    def make_preview(self):
+        self.preview_indices = self.preview_image = None
+        if not self.preview:
             return
+        w, h = self.original_image.size
+        cols, rows = w // TILE_SIZE, h // TILE_SIZE
+        with instrument.stage("preview_image", self.current_image_name):
+            self.preview_indices = image_to_palette_indices(self.original_image, self.preview_palette)
+            marked = np.zeros((rows, cols), dtype=bool)
+            for tx, ty in self.store.tiles_for(self.image_path_bin(self.current_image_name)):
+                if tx < cols and ty < rows:
+                    marked[ty, tx] = True
+            out = self.preview_indices.copy()
+            out[:rows * TILE_SIZE, :cols * TILE_SIZE] = apply_priority(
+                self.preview_indices[:rows * TILE_SIZE, :cols * TILE_SIZE], marked, TILE_SIZE, TILE_SIZE)
+            self.preview_image = indexed_image(out, self.preview_palette, transparent=None)
+
+    # one edit: that 8x8 redone, pasted on the preview image and drawn over the view. same cost at any size
+    def update_preview_tile(self, tx, ty, on):
+        with instrument.stage("preview_tile", self.current_image_name):
+            x0, y0 = tx * TILE_SIZE, ty * TILE_SIZE
+            tile = self.preview_indices[y0:y0 + TILE_SIZE, x0:x0 + TILE_SIZE]
+            patch = indexed_image(apply_priority(tile, np.array([[on]]), TILE_SIZE, TILE_SIZE),
+                                  self.preview_palette, transparent=None)
+            self.preview_image.paste(patch, (x0, y0))
+            self.drop_preview_chunks(x0, y0)
+            self.draw_preview_tile(tx, ty, patch)
+
+    # cached zoomed chunks holding that tile are stale now, the ones on screen get the tile drawn over
+    def drop_preview_chunks(self, x0, y0):
+        for key in list(self.zoom_cache.items):
+            zoom, cx, cy = key
+            size = self.chunk_src(zoom)
+            if cx == x0 // size and cy == y0 // size:
+                del self.zoom_cache.items[key]
+
+    def draw_preview_tile(self, tx, ty, patch):
+        zx0, zy0 = self.zoomed(tx * TILE_SIZE), self.zoomed(ty * TILE_SIZE)
+        zx1, zy1 = self.zoomed((tx + 1) * TILE_SIZE), self.zoomed((ty + 1) * TILE_SIZE)
+        photo = ImageTk.PhotoImage(patch.resize((max(1, zx1 - zx0), max(1, zy1 - zy0)), Image.NEAREST))
+        old = self.preview_items.pop((tx, ty), None)
+        if old is not None:
+            self.canvas.delete(old[0])
+        item = self.canvas.create_image(zx0, zy0, anchor="nw", image=photo, tags=("img", "preview_tile"))
+        if self.canvas.find_withtag("grid"):
+            self.canvas.tag_lower(item, "grid")
+        self.preview_items[(tx, ty)] = (item, photo)
+
+    # JASC palettes on the folder, first line says so
+    def find_palettes(self):
+        found = []
+        for fname in sorted(os.listdir(self.image_folder)):
+            path = os.path.join(self.image_folder, fname)
+            if not fname.lower().endswith(".pal") or not os.path.isfile(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    if f.readline().strip() == "JASC-PAL":
+                        found.append(path)
+            except OSError:
+                pass
+        return found
+
+    # the palette the final pngs are mapped to. one on the folder: that one, several: ask once
+    # none: no final pngs, only tmx/pal as setprioFULLAND01.py did
+    def pick_palette(self):
+        if self.palette_path and os.path.exists(self.palette_path):
+            return self.palette_path
+        found = self.find_palettes()
+        if len(found) > 1:
+            chosen = filedialog.askopenfilename(
+                title="Palette for the final pngs...",
+                initialdir=self.image_folder,
+                filetypes=[("JASC palette", "*.pal")],
+            )
+            self.palette_path = chosen or None
+        else:
+            self.palette_path = found[0] if found else None
+        return self.palette_path
 
-        print(f"Running: {script_path}")
-        subprocess.run(["python3", script_path, json_path], cwd=self.image_folder)
+    # builds in this process (pipeline.py) on a thread, the ui keeps working meanwhile
+    def generate_bin_tmx(self):
+        if self.build_thread is not None:
+            print("Generate already running")
+            return
+        self.save_json()
+        palette = self.pick_palette()
+        print(f"Generating from {self.json_path}" + (f" with {palette}" if palette else " (no palette, tmx only)"))
+        self.build_result = None
+        self.build_thread = threading.Thread(target=self.run_build, args=(palette,), daemon=True)
+        self.build_thread.start()
+        self.root.after(BUILD_POLL_MS, self.poll_build)
+
+    # worker thread, no tk in here
+    def run_build(self, palette):
+        try:
+            failed = pipeline.build(self.json_path, palette, workers=0, tmx=palette is not None,
+                                    mp_context=multiprocessing.get_context("spawn"))
+            if failed:
+                self.build_result = f"{len(failed)} failed\n" + "\n".join(f"{path}: {error}" for path, error in failed)
+        except Exception as e:
+            self.build_result = str(e)
+
+    def poll_build(self):
+        if self.build_thread.is_alive():
+            self.root.after(BUILD_POLL_MS, self.poll_build)
+            return
+        self.build_thread = None
+        if self.build_result:
+            messagebox.showerror("Error", f"Generate: {self.build_result}")
 
 
 if __name__ == "__main__":
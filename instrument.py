@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# where does the time go. wall time per stage and per asset plus counters (tiles, bytes written...)
+# off by default and then stage() hands back one shared do-nothing context, so leaving the calls in costs
+# next to nothing. switch it on with --profile [trace.json] on the scripts or the SGDK_PROFILE env var
+# (SGDK_PROFILE=1 -> sgdk_profile.json, anything else is the trace path), SGDK_PROFILE_FORMAT=chrome or
+# --profile-format chrome for a trace chrome://tracing / ui.perfetto.dev open.
+# at the end finish() writes the trace and prints a summary table.
+# worker processes record on their own, run_entry (setprioFULLAND01.py) hands their collect() back to the
+# main process which merge()s it. the env var is set on enable() so spawned workers switch on as well
+#
+#   with instrument.stage("quantize"):
+#       ...
+#   instrument.count("tiles", n)
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+ENV_VAR = "SGDK_PROFILE"
+ENV_FORMAT = "SGDK_PROFILE_FORMAT"
+DEFAULT_TRACE = "sgdk_profile.json"
+FORMATS = ("json", "chrome")
+
+_NULL = contextlib.nullcontext()
+_local = threading.local()
+_events = []     # (name, asset, start_ns, dur_ns, pid, tid)
+_counters = {}   # (asset, name) -> total
+_lock = threading.Lock()
+_started = time.perf_counter_ns()
+
+enabled = False
+trace_path = None
+trace_format = "json"
+
+
+def enable(path=None, fmt="json"):
+    global enabled, trace_path, trace_format
+    enabled = True
+    trace_path = path or DEFAULT_TRACE
+    trace_format = fmt if fmt in FORMATS else "json"
+    os.environ[ENV_VAR] = trace_path
+    os.environ[ENV_FORMAT] = trace_format
+
+
+def _from_env():
+    value = os.environ.get(ENV_VAR)
+    if value and value != "0":
+        enable(DEFAULT_TRACE if value == "1" else value, os.environ.get(ENV_FORMAT, "json"))
+
+
+_from_env()
+
+
+def add_arguments(parser):
+    parser.add_argument("--profile", nargs="?", const=DEFAULT_TRACE, metavar="TRACE",
+                        help=f"time every stage, trace to TRACE (default {DEFAULT_TRACE}) + summary at the end")
+    parser.add_argument("--profile-format", choices=FORMATS, default=None, help="json (default) or chrome trace")
+
+
+def setup(args):
+    if args.profile:
+        enable(args.profile, args.profile_format or os.environ.get(ENV_FORMAT, "json"))
+    elif enabled and args.profile_format:
+        enable(trace_path, args.profile_format)
+
+
+def current_asset():
+    return getattr(_local, "asset", None)
+
+
+class _Stage:
+    __slots__ = ("name", "asset", "start")
+
+    def __init__(self, name, asset):
+        self.name = name
+        self.asset = asset
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        dur = time.perf_counter_ns() - self.start
+        asset = self.asset if self.asset is not None else current_asset()
+        with _lock:
+            _events.append((self.name, asset, self.start, dur, os.getpid(), threading.get_ident()))
+        return False
+
+
+def stage(name, asset=None):
+    if not enabled:
+        return _NULL
+    return _Stage(name, asset)
+
+
+@contextlib.contextmanager
+def _asset_scope(asset):
+    old = current_asset()
+    _local.asset = asset
+    try:
+        yield
+    finally:
+        _local.asset = old
+
+
+# stages and counters inside are booked to this asset (a png path, a tmx...)
+def for_asset(asset):
+    if not enabled:
+        return _NULL
+    return _asset_scope(asset)
+
+
+def count(name, n=1, asset=None):
+    if not enabled:
+        return
+    key = (asset if asset is not None else current_asset(), name)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+# everything recorded so far, and forget it. what a worker sends back
+def collect():
+    if not enabled:
+        return None
+    global _events, _counters
+    with _lock:
+        data = {"events": _events, "counters": list(_counters.items())}
+        _events, _counters = [], {}
+    return data
+
+
+def _forget_in_child():
+    global _events, _counters
+    _events, _counters = [], {}
+
+
+# forked workers start clean, what the parent recorded is reported by the parent
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_in_child)
+
+
+def merge(data):
+    if not data or not enabled:
+        return
+    with _lock:
+        _events.extend(tuple(e) for e in data["events"])
+        for (asset, name), n in data["counters"]:
+            _counters[(asset, name)] = _counters.get((asset, name), 0) + n
+
+
+def _chrome_trace(wall_ns):
+    origin = min([e[2] for e in _events] + [_started])
+    events = [{"name": name, "cat": "stage", "ph": "X", "ts": (start - origin) / 1000, "dur": dur / 1000,
+               "pid": pid, "tid": tid, "args": {"asset": asset}}
+              for name, asset, start, dur, pid, tid in _events]
+    totals = {}
+    for (asset, name), n in _counters.items():
+        totals[name] = totals.get(name, 0) + n
+    return {"traceEvents": events, "displayTimeUnit": "ms",
+            "otherData": {"wall_ms": wall_ns / 1e6, "counters": totals}}
+
+
+def _json_trace(wall_ns):
+    assets = {}
+    for (asset, name), n in _counters.items():
+        assets.setdefault(str(asset), {})[name] = n
+    return {
+        "wall_ms": wall_ns / 1e6,
+        "events": [{"name": name, "asset": asset, "start_ms": (start - _started) / 1e6, "ms": dur / 1e6,
+                    "pid": pid, "tid": tid} for name, asset, start, dur, pid, tid in _events],
+        "counters": assets,
+    }
+
+
+# -> {stage: [calls, total_ns, max_ns]}
+def stage_totals():
+    totals = {}
+    for name, _, _, dur, _, _ in _events:
+        t = totals.setdefault(name, [0, 0, 0])
+        t[0] += 1
+        t[1] += dur
+        t[2] = max(t[2], dur)
+    return totals
+
+
+def print_summary(wall_ns, out=sys.stderr):
+    print(f"\n[profile] wall {wall_ns / 1e9:.3f}s", file=out)
+    print(f"{'stage':<22} {'calls':>6} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'% wall':>7}", file=out)
+    for name, (calls, total, peak) in sorted(stage_totals().items(), key=lambda kv: -kv[1][1]):
+        share = 100 * total / wall_ns if wall_ns else 0
+        print(f"{name:<22} {calls:>6} {total / 1e9:>9.3f} {total / calls / 1e6:>9.2f} {peak / 1e6:>9.2f}"
+              f" {share:>6.1f}%", file=out)
+    counters = {}
+    for (_, name), n in _counters.items():
+        counters[name] = counters.get(name, 0) + n
+    for name, n in sorted(counters.items()):
+        print(f"{name:<22} {n:>16,}", file=out)
+
+
+# writes the trace, prints the table. stages from worker processes overlap, so % wall can add up past 100
+def finish():
+    if not enabled:
+        return
+    wall_ns = time.perf_counter_ns() - _started
+    trace = _chrome_trace(wall_ns) if trace_format == "chrome" else _json_trace(wall_ns)
+    with open(trace_path, "w", encoding="utf-8") as f:
+        json.dump(trace, f, indent=1)
+    print_summary(wall_ns)
+    print(f"[profile] trace -> {trace_path}", file=sys.stderr)
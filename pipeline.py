@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# the whole thing in one go, no subprocesses, no tmx round trip, no temp pngs:
+#   tile_priorities.json + palette.pal -> <base>_map--0.png   (indexed, priority tiles on the +128 band)
+# same png prepareprioasepirte.py gives you, but every source png is decoded once and everything
+# else happens in memory (palette mapping, priority shift, save). only the final files hit the disk.
+# extras from the same decoded image: --tmx (.pal + _map.tmx as setprioFULLAND01.py), --bin (SGDK bins)
+# without a palette you just get the setprioFULLAND01.py outputs.
+# unchanged entries are skipped (own manifest: <json>.pipeline.build.json), -j N for more processes
+# --profile [trace.json]: per stage / per png timings, see instrument.py
+# --watch: after the build keeps running and rebuilds what changes (pngs, json, palette), see watch.py
+# --band ROWS: the final png is read and written ROWS tile rows at a time, never whole in memory (bandproc.py).
+# only the final png: banded --tmx / --bin need a shared 16 color palette, that is setprioFULLAND01.py --band
+#
+#   python pipeline.py palette.pal [tile_priorities.json] [-j 0] [--tmx] [--bin [--pack size]] [--dedup] [--force]
+#
+# from python (editor.py does this on a background thread):
+#   import pipeline
+#   failed = pipeline.build("tile_priorities.json", "palette.pal", workers=0)
+
+import argparse
+import os
+import sys
+from PIL import Image
+import instrument
+from buildcache import BuildCache
+from prepareprioasepirte import apply_priority, output_png_name
+from priostore import entry_mask, read_priorities
+from setprioFULLAND01 import GENERATOR_VERSION, TILE_SIZE, check_entry_image, process_entry, run_cached_batch
+from sgdkpal import image_to_palette_indices, indexed_image, load_jasc_pal, palette_hash
+from sgdkpack import METHODS
+
+MANIFEST_SUFFIX = ".pipeline.build.json"
+
+
+# same name the tmx route ends with: <base>_map.tmx -> <base>_map--0.png
+def final_png_path(path):
+    base, _ = os.path.splitext(path)
+    return output_png_name(base + "_map.tmx")
+
+
+# one entry, one decode (none if img, the decoded png, is given). palette None = no final png, generator outputs only
+def build_entry(entry, palette=None, tmx=False, binary=False, img=None, band=None, **generator_options):
+    path = entry["path"]
+    if not os.path.exists(path):
+        print(f"[SKIP] '{path}' does not exist")
+        return False
+    print(f"[+] Building: {path}")
+    if band and img is None:
+        import bandproc
+        bandproc.entry_size(entry)
+        out_png = bandproc.write_final_png(path, entry_mask(entry), palette, final_png_path(path), band)
+        print(f"    PNG -> {out_png}")
+        return [out_png]
+    if img is None:
+        img = decode(path)
+    check_entry_image(entry, img)
+
+    outputs = []
+    if palette is not None:
+        with instrument.stage("quantize_palette"):
+            indices = image_to_palette_indices(img, palette)
+        with instrument.stage("composite"):
+            out = indexed_image(apply_priority(indices, entry_mask(entry), TILE_SIZE, TILE_SIZE), palette)
+        out_png = final_png_path(path)
+        with instrument.stage("png_write"):
+            out.save(out_png)
+        instrument.count("bytes_written", os.path.getsize(out_png))
+        print(f"    PNG -> {out_png}")
+        outputs.append(out_png)
+    # one process_entry for both: the png is quantized and its .pal written once
+    if tmx or palette is None or binary:
+        outputs += process_entry(entry, img=img, binary=binary, also_tmx=tmx or palette is None, **generator_options)
+    return outputs
+
+
+# entry paths are relative to the json, wherever we are running from
+def decode(path):
+    with instrument.stage("decode"), Image.open(path) as img:
+        img.load()
+    return img
+
+
+def resolve_entries(json_path, entries):
+    folder = os.path.dirname(json_path)
+    return [dict(e, path=os.path.join(folder, e["path"])) for e in entries]
+
+
+# the manifest of build() and watch.py rebuilds, options as build_entry gets them (palette = the colors)
+def build_cache(json_path, options):
+    # --band writes the same pixels, the cache does not need to know
+    cache_options = {k: v for k, v in dict(options, palette=palette_hash(options.get("palette"))).items()
+                     if k != "band"}
+    return BuildCache(json_path, GENERATOR_VERSION, cache_options, suffix=MANIFEST_SUFFIX)
+
+
+def build(json_path="tile_priorities.json", palette_path=None, workers=1, force=False, prune=False,
+          mp_context=None, **options):
+    entries = resolve_entries(json_path, read_priorities(json_path))
+    palette = load_jasc_pal(palette_path) if palette_path else None
+    options = dict(options, palette=palette)
+    cache = build_cache(json_path, options)
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    return run_cached_batch(cache, entries, options, workers, force, prune, build_entry, mp_context)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tile_priorities.json -> final indexed pngs with priority tiles")
+    parser.add_argument("palette", nargs="?", help="64+ color JASC .pal, without it only tmx/pal are made")
+    parser.add_argument("json", nargs="?", default="tile_priorities.json")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="processes to use, 0 = one per cpu")
+    parser.add_argument("--tmx", action="store_true", help="also write .pal + _map.tmx")
+    parser.add_argument("--bin", action="store_true", help="also write SGDK .bin files (see sgdkbin.py)")
+    parser.add_argument("--dedup", action="store_true", help="dedup tiles for --tmx / --bin")
+    parser.add_argument("--pack", choices=METHODS, default="none", help="with --bin, pack tiles + map (sgdkpack.py)")
+    parser.add_argument("--force", action="store_true", help="rebuild everything")
+    parser.add_argument("--prune", action="store_true", help="forget (and delete outputs of) removed images")
+    parser.add_argument("--watch", action="store_true", help="stay running, rebuild what changes on the folder")
+    parser.add_argument("--poll", action="store_true", help="with --watch, poll instead of inotify (WSL2 /mnt/c)")
+    parser.add_argument("--band", type=int, metavar="ROWS", help="final png only, ROWS tile rows at a time")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.setup(args)
+
+    if args.band and (args.tmx or args.bin or not args.palette):
+        parser.error("--band makes the final png only (give the palette, no --tmx / --bin), "
+                     "for banded tmx / bins use setprioFULLAND01.py --palette --band")
+    if not os.path.exists(args.json):
+        raise FileNotFoundError(f"{args.json} not in path.")
+    failed = build(args.json, args.palette, args.workers, args.force, args.prune,
+                   tmx=args.tmx, binary=args.bin, dedup=args.dedup, pack=args.pack, band=args.band)
+    if args.watch:
+        import watch
+        # what still fails when you stop it: the first build failures not fixed since + the watch ones
+        failed = watch.run(args.json, args.palette, args.poll, failed=failed, tmx=args.tmx, binary=args.bin,
+                           dedup=args.dedup, pack=args.pack, band=args.band)
+    instrument.finish()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
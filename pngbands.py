@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# pngs a band of rows at a time, for maps too big to have whole in memory (--band on the scripts)
+# - read_bands: the IDAT stream is inflated only as far as the next band needs, and every band goes through
+#   PIL's own png decoder as a small png of its own (IHDR with the band height + PLTE / tRNS of the file +
+#   the band's filtered rows). the row above the band goes first, unfiltered, so Up / Average / Paeth rows
+#   decode the same as on the whole file. PIL images come out, same mode, palette and pixels as Image.open
+# - interlaced pngs (and the odd mode PIL can not pack back) are opened whole and cut, same bands anyway
+# - BandWriter: png written as the bands arrive (filter 0 rows, deflate level 6 like PIL). the pixels and
+#   palette are the ones PIL would save, the bytes of the file are not
+# memory is about one band decoded + one compressed IDAT chunk, whatever the image size
+
+import io
+import struct
+import zlib
+import numpy as np
+from PIL import Image
+
+SIGNATURE = b"\x89PNG\r\n\x1a\n"
+READ_BLOCK = 1 << 16
+IDAT_SIZE = 1 << 16
+COMPRESS_LEVEL = 6
+COLOR_TYPES = {"L": 0, "RGB": 2, "P": 3, "LA": 4, "RGBA": 6}
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+# -> [(type, data), ...] up to the first IDAT, then the file position of that IDAT
+def read_header(f):
+    if f.read(8) != SIGNATURE:
+        raise ValueError("not a png")
+    chunks = []
+    while True:
+        pos = f.tell()
+        length, kind = struct.unpack(">I4s", f.read(8))
+        if kind == b"IDAT":
+            return chunks, pos
+        chunks.append((kind, f.read(length)))
+        f.read(4)
+        if kind == b"IEND":
+            raise ValueError("png without IDAT")
+
+
+# compressed IDAT payloads one after the other
+def idat_payloads(f, pos):
+    f.seek(pos)
+    while True:
+        length, kind = struct.unpack(">I4s", f.read(8))
+        if kind == b"IEND":
+            return
+        data = f.read(length)
+        f.read(4)
+        if kind == b"IDAT":
+            for i in range(0, len(data), READ_BLOCK):
+                yield data[i:i + READ_BLOCK]
+
+
+class Inflater:
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.inflate = zlib.decompressobj()
+        self.pending = b""
+
+    # exactly n inflated bytes, never much more in memory than that
+    def read(self, n):
+        out = bytearray()
+        while len(out) < n:
+            if not self.pending:
+                self.pending = next(self.payloads, b"")
+                if not self.pending:
+                    raise ValueError("png image data ends early")
+            out += self.inflate.decompress(self.pending, n - len(out))
+            self.pending = self.inflate.unconsumed_tail
+        return bytes(out)
+
+
+def band_png(ihdr, extra, width, rows, data):
+    header = struct.pack(">II", width, rows) + ihdr[8:]
+    body = zlib.compress(data, 1)
+    return SIGNATURE + chunk(b"IHDR", header) + b"".join(chunk(k, d) for k, d in extra) + \
+        chunk(b"IDAT", body) + chunk(b"IEND", b"")
+
+
+def whole_bands(path, band_rows):
+    with Image.open(path) as img:
+        img.load()
+    for y in range(0, img.size[1], band_rows):
+        yield y, img.crop((0, y, img.size[0], min(img.size[1], y + band_rows)))
+
+
+# -> (width, height, PIL mode) without decoding anything
+def png_size(path):
+    with Image.open(path) as img:
+        return img.size[0], img.size[1], img.mode
+
+
+# yields (y, PIL image of rows y .. y + band_rows)
+def read_bands(path, band_rows):
+    with open(path, "rb") as f:
+        chunks, idat_pos = read_header(f)
+        ihdr = chunks[0][1]
+        width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", ihdr)
+        extra = [(k, d) for k, d in chunks if k in (b"PLTE", b"tRNS")]
+        if interlace or color_type not in CHANNELS:
+            yield from whole_bands(path, band_rows)
+            return
+        row_bytes = 1 + (width * depth * CHANNELS[color_type] + 7) // 8
+        rawmode = None
+        above = None  # last decoded row of the previous band, as png raw bytes
+        inflater = Inflater(idat_payloads(f, idat_pos))
+        for y in range(0, height, band_rows):
+            rows = min(band_rows, height - y)
+            data = inflater.read(rows * row_bytes)
+            if above is not None:
+                data = b"\0" + above + data
+            with Image.open(io.BytesIO(band_png(ihdr, extra, width, rows + (above is not None), data))) as band:
+                if rawmode is None:
+                    rawmode = band.tile[0].args if hasattr(band.tile[0], "args") else band.tile[0][3]
+                    try:
+                        Image.new(band.mode, (1, 1)).tobytes("raw", rawmode)
+                    except ValueError:
+                        yield from whole_bands(path, band_rows)
+                        return
+                band.load()
+            if above is not None:
+                band = band.crop((0, 1, width, rows + 1))
+            above = band.crop((0, rows - 1, width, rows)).tobytes("raw", rawmode)
+            yield y, band
+
+
+class BandWriter:
+    # palette: flat [r, g, b, ...] for P. transparency: index (P) as PIL's info["transparency"]
+    def __init__(self, path, width, height, mode, palette=None, transparency=None):
+        if mode not in COLOR_TYPES:
+            raise ValueError(f"BandWriter does not write {mode} pngs")
+        self.f = open(path, "wb")
+        self.width, self.height, self.mode = width, height, mode
+        self.rows = 0
+        self.deflate = zlib.compressobj(COMPRESS_LEVEL)
+        self.buffer = bytearray()
+        self.f.write(SIGNATURE)
+        self.f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, COLOR_TYPES[mode], 0, 0, 0)))
+        if mode == "P":
+            colors = bytes(palette or [])[:768]
+            self.f.write(chunk(b"PLTE", colors + b"\0" * (-len(colors) % 3)))
+            if transparency is not None:
+                self.f.write(chunk(b"tRNS", b"\xff" * transparency + b"\0"))
+
+    # band: PIL image or (rows, width[, channels]) uint8 array of the next rows
+    def write(self, band):
+        arr = np.ascontiguousarray(np.asarray(band, dtype=np.uint8))
+        rows = arr.reshape(arr.shape[0], -1)
+        filtered = np.zeros((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows
+        self.buffer += self.deflate.compress(filtered.tobytes())
+        self.rows += rows.shape[0]
+        self.flush_idat(IDAT_SIZE)
+
+    def flush_idat(self, at_least):
+        while len(self.buffer) >= max(at_least, 1):
+            self.f.write(chunk(b"IDAT", bytes(self.buffer[:IDAT_SIZE])))
+            del self.buffer[:IDAT_SIZE]
+
+    def close(self):
+        if self.rows != self.height:
+            self.f.close()
+            raise ValueError(f"png got {self.rows} rows of {self.height}")
+        self.buffer += self.deflate.flush()
+        self.flush_idat(1)
+        self.f.write(chunk(b"IEND", b""))
+        self.f.close()
@@ -24,17 +24,37 @@
 # a portion of a map that contains an animation - not the whole map. 
 # do not use TILE_ATTR_FULL or TILE_ATTR as the images should carry all that info.
 # SHARE, MODIFY, BLAME AT YOUR SCREEN. 
+#
+# NATIVE BACKEND (default now): all the aseprite dance above ends up being "on every high_prio tile with any
+# non transparent pixel, index < 64 -> index + 128" so that's done here with numpy in one go, straight
+# from the png + the .pal to the same <tmx_name>--0.png. no temp pngs, no aseprite needed.
+# the aseprite way is still there: python prepareprioaseprite.py palette.pal --backend aseprite
+# that writes one mask png per tmx and a job manifest, then runs aseprite ONCE for all of them with
+# priority_batch.lua (mask layer + indexed + pigsy pass, paths as --script-param, no lua file edited).
+# --backend aseprite-steps is the original 4 aseprite calls per tmx
+# exits 1 when any tmx did not end with its png (for the aseprite batch: a <tmx>--0.png newer than the run)
+# --profile [trace.json]: time per stage and per tmx, aseprite calls included (see instrument.py)
+# --band ROWS: the png, the final png and the aseprite temp pngs go ROWS tile rows at a time, for maps
+# too big to have whole in memory (same pixels, see bandproc.py)
 
+import argparse
 import os
+import shutil
 import sys
+import tempfile
+import time
+import numpy as np
 from PIL import Image
-from lxml import etree
+import instrument
+from sgdkpal import load_jasc_pal, image_to_palette_indices, indexed_image
+from tmxio import read_tmx
 
 
 
 # change it to your needs
 ASEPRITE_PATH = '/mnt/c/XXXX/XXXX/XXXX/XXXXXX/Aseprite-v1.3.9.2-x64-Portable/Aseprite-v1.3.9.2-x64/Aseprite.exe'
 LUA_SCRIPT = 'add_mask_layer.lua'  # ruta relativa o absoluta si prefieres
+BATCH_LUA_SCRIPT = 'priority_batch.lua'  # --backend aseprite
 
 def wsl_to_windows_path(path):
     if path.startswith('/mnt/'):
@@ -43,26 +63,18 @@ def wsl_to_windows_path(path):
         return f"{drive}/" + "/".join(parts[3:])
     return path.replace('\\', '/')
 
+# layer data comes back as flat numpy uint32 arrays (csv or base64 zlib/gzip/zstd, see tmxio.py)
 def parse_tmx(tmx_path):
-    with open(tmx_path, 'r', encoding='utf-8') as f:
-        tree = etree.parse(f)
-    root = tree.getroot()
-    img_source = root.find('.//image').attrib['source']
-    width = int(root.attrib['width'])
-    height = int(root.attrib['height'])
-    tilewidth = int(root.attrib['tilewidth'])
-    tileheight = int(root.attrib['tileheight'])
-    layers = []
-    for layer in root.findall('./layer'):
-        data = layer.find('data').text.strip().replace('\n', '')
-        arr = [int(d) for d in data.split(',')]
-        layers.append({
-            "name": layer.attrib["name"],
-            "width": int(layer.attrib["width"]),
-            "height": int(layer.attrib["height"]),
-            "data": arr,
-        })
-    return img_source, (width, height, tilewidth, tileheight), layers
+    tmx = read_tmx(tmx_path)
+    attrib = tmx["attrib"]
+    img_source = tmx["image"]["source"]
+    # deduped maps (setprioFULLAND01 --dedup) point the tileset to <base>_tiles.png, the real picture is here
+    img_source = tmx["properties"].get("source_image", img_source)
+    width = int(attrib['width'])
+    height = int(attrib['height'])
+    tilewidth = int(attrib['tilewidth'])
+    tileheight = int(attrib['tileheight'])
+    return img_source, (width, height, tilewidth, tileheight), tmx["layers"]
 
 def create_mask_layer(img, layers, geom):
     width, height, tilewidth, tileheight = geom
@@ -77,103 +89,227 @@ def create_mask_layer(img, layers, geom):
                 mask.paste(tile, box)
     return mask
 
-# changes the file to process on the called lua script
-def update_lua_vars(lua_file, new_mask_path, new_pal_path):
-    with open(lua_file, 'r') as f:
-        lines = f.readlines()
-    with open(lua_file, 'w') as f:
-        for line in lines:
-            if line.strip().startswith("local mask ="):
-                f.write(f'local mask = "{new_mask_path}"\n')
-            elif line.strip().startswith("local palette ="):
-                f.write(f'local palette = "{new_pal_path}"\n')
-            else:
-                f.write(line)
-
-# restore the same lines from above
-def restore_lua_vars(lua_file):
-    with open(lua_file, 'r') as f:
-        lines = f.readlines()
-    with open(lua_file, 'w') as f:
-        for line in lines:
-            if line.strip().startswith("local mask ="):
-                f.write('local mask = "RUTA_CAMBIADA_POR_PYTHON"\n')
-            elif line.strip().startswith("local palette ="):
-                f.write('local palette = "RUTA_CAMBIADA_POR_PYTHON_PAL"\n')
-            else:
-                f.write(line)
+# (h_px, w_px) palette indices + high_prio layer -> final indices. same rule as prioritypigsy.lua:
+# a flagged tile with any pixel > 0 gets all its pixels < 64 moved to the +128 band
+def composite_priority(indices, layers, geom):
+    width, height, tilewidth, tileheight = geom
+    return apply_priority(indices, priority_layer(layers, geom), tilewidth, tileheight)
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usw: python prepareprioaseprite.py <palette.pal>")
-        sys.exit(1)
-    pal_path_wsl = os.path.abspath(sys.argv[1])
-    pal_path_win = wsl_to_windows_path(pal_path_wsl)
+# high_prio layer -> (height, width) bool grid
+def priority_layer(layers, geom):
+    width, height = geom[:2]
+    return np.asarray(layers[1]["data"], dtype=np.int64).reshape(height, width) == 1
+
+# same thing from a (height, width) bool grid of priority tiles
+def apply_priority(indices, high_prio, tilewidth=8, tileheight=8):
+    height, width = high_prio.shape
+    out = indices.copy()
+    tiles = out.reshape(height, tileheight, width, tilewidth).swapaxes(1, 2)
+    present = high_prio & tiles.any(axis=(2, 3))
+    shift = present[:, :, None, None] & (tiles < 64)
+    tiles[shift] += 128
+    return out
+
+# same name aseprite gives it with prioritypigsy.lua
+def output_png_name(tmx_name):
+    return os.path.splitext(tmx_name)[0] + "--0.png"
+
+def render_native(fname, img_src, geom, layers, palette, band=None):
+    if band:
+        import bandproc
+        out_png = bandproc.write_final_png(img_src, priority_layer(layers, geom), palette,
+                                           os.path.abspath(output_png_name(fname)), band, *geom[2:])
+        print(f"  -> {out_png}")
+        return True
+    with instrument.stage("decode"):
+        img = Image.open(img_src)
+        img.load()
+    with instrument.stage("quantize_palette"):
+        indices = image_to_palette_indices(img, palette)
+    with instrument.stage("composite"):
+        out = indexed_image(composite_priority(indices, layers, geom), palette)
+    out_png = os.path.abspath(output_png_name(fname))
+    with instrument.stage("png_write"):
+        out.save(out_png)
+    instrument.count("bytes_written", os.path.getsize(out_png))
+    print(f"  -> {out_png}")
+    return True
+
+# os.system with its time on the profile (stage "aseprite")
+def run_aseprite(cmd):
+    with instrument.stage("aseprite"):
+        res = os.system(cmd)
+    instrument.count("subprocess_calls")
+    return res
+
+# the old 4 calls per tmx (--backend aseprite-steps), kept to compare against
+def render_aseprite(fname, img_src, geom, layers, pal_path_win, band=None):
     aseprite_path_linux = ASEPRITE_PATH
     lua_script_path = os.path.abspath(LUA_SCRIPT)
     lua_script_win = wsl_to_windows_path(lua_script_path)
 
-    for fname in os.listdir('.'):
-        if fname.endswith('.tmx'):
-            print(f"> Processing {fname}")
-            try:
-                img_src, geom, layers = parse_tmx(fname)
-            except Exception as e:
-                print(f"Read error: {fname}: {e}")
-                continue
-
-            if not os.path.isfile(img_src):
-                print(f"Tmx referred PNG missing: {img_src}!")
-                continue
+    fg_tmp_wsl = os.path.abspath(f'_fg_{fname}.png')
+    fg_tmp_win = wsl_to_windows_path(fg_tmp_wsl)
+    mask_tmp_wsl = os.path.abspath(f'_mask_{fname}.png')
+    mask_tmp_win = wsl_to_windows_path(mask_tmp_wsl)
 
+    if band:
+        import bandproc
+        with instrument.stage("temp_png_write"):
+            bandproc.write_rgba_png(img_src, fg_tmp_wsl, band, None, *geom[2:])
+            bandproc.write_rgba_png(img_src, mask_tmp_wsl, band, priority_layer(layers, geom), *geom[2:])
+    else:
+        with instrument.stage("decode"):
             img = Image.open(img_src).convert('RGBA')
-            fg_tmp_wsl = os.path.abspath(f'_fg_{fname}.png')
-            fg_tmp_win = wsl_to_windows_path(fg_tmp_wsl)
-            mask_tmp_wsl = os.path.abspath(f'_mask_{fname}.png')
-            mask_tmp_win = wsl_to_windows_path(mask_tmp_wsl)
-
+        with instrument.stage("temp_png_write"):
             img.save(fg_tmp_wsl)
+        with instrument.stage("create_mask_layer"):
             mask = create_mask_layer(img, layers, geom)
+        with instrument.stage("temp_png_write"):
             mask.save(mask_tmp_wsl)
 
-            out_ase_wsl = os.path.abspath(os.path.splitext(fname)[0] + ".aseprite")
-            out_ase_win = wsl_to_windows_path(out_ase_wsl)
-
-            # Create base ase file
-            cmd1 = f'"{aseprite_path_linux}" -b "{fg_tmp_win}" --save-as "{out_ase_win}" --palette "{pal_path_win}"'
-            res1 = os.system(cmd1)
-            if res1 != 0:
-                print("Lua Aseprite CLI script failed step 1!")
-                continue
-
-            # edit local mask = ... line on lua before running it
-            update_lua_vars(lua_script_path, mask_tmp_win, pal_path_win)
-
-            cmd2 = (
-                f'"{aseprite_path_linux}" -b "{out_ase_win}" '
-                f'--script "{lua_script_win}" '
-            )
-           
-            res2 = os.system(cmd2)
-            if res2 != 0:
-                print("Lua Aseprite CLI script failed step 2!")
-
-            cmd3 = (f'"{aseprite_path_linux}" -b "{out_ase_win}" '
-                    f'--color-mode indexed  --save-as  "{out_ase_win}"')    
-            res3 = os.system(cmd3)
-            if res3 != 0:
-                print("Lua Aseprite CLI script failed step 3!")
-
-            restore_lua_vars(lua_script_path)
-            print(f"  -> {out_ase_win} both layers made.")
-            print(f"  [PNG TEMP] {fg_tmp_win}")
-            print(f"  [PNG TEMP] {mask_tmp_win}")
-            print("launching priority tile aseprite script")
-            cmd4 = (f'"{aseprite_path_linux}" -b "{out_ase_win}" '
-                    f'--script prioritypigsy.lua')    
-            res4 = os.system(cmd4)
-            if res4 != 0:
-                print("Lua Aseprite CLI script failed step 4!")
+    out_ase_wsl = os.path.abspath(os.path.splitext(fname)[0] + ".aseprite")
+    out_ase_win = wsl_to_windows_path(out_ase_wsl)
+
+    # Create base ase file
+    cmd1 = f'"{aseprite_path_linux}" -b "{fg_tmp_win}" --save-as "{out_ase_win}" --palette "{pal_path_win}"'
+    res1 = run_aseprite(cmd1)
+    if res1 != 0:
+        print("Lua Aseprite CLI script failed step 1!")
+        return False
+
+    # mask and palette go in as script params, the lua file is left alone
+    cmd2 = (
+        f'"{aseprite_path_linux}" -b "{out_ase_win}" '
+        f'--script-param mask="{mask_tmp_win}" --script-param palette="{pal_path_win}" '
+        f'--script "{lua_script_win}" '
+    )
+   
+    res2 = run_aseprite(cmd2)
+    if res2 != 0:
+        print("Lua Aseprite CLI script failed step 2!")
+
+    cmd3 = (f'"{aseprite_path_linux}" -b "{out_ase_win}" '
+            f'--color-mode indexed  --save-as  "{out_ase_win}"')    
+    res3 = run_aseprite(cmd3)
+    if res3 != 0:
+        print("Lua Aseprite CLI script failed step 3!")
+
+    print(f"  -> {out_ase_win} both layers made.")
+    print(f"  [PNG TEMP] {fg_tmp_win}")
+    print(f"  [PNG TEMP] {mask_tmp_win}")
+    print("launching priority tile aseprite script")
+    cmd4 = (f'"{aseprite_path_linux}" -b "{out_ase_win}" '
+            f'--script prioritypigsy.lua')    
+    res4 = run_aseprite(cmd4)
+    if res4 != 0:
+        print("Lua Aseprite CLI script failed step 4!")
+        return False
+    return True
+
+# --backend aseprite: one mask png per tmx now, one job line for priority_batch.lua, aseprite runs at the end
+def aseprite_job(fname, img_src, geom, layers, pal_path_win, job_dir, band=None):
+    mask_path = os.path.join(job_dir, f'_mask_{fname}.png')
+    if band:
+        import bandproc
+        with instrument.stage("temp_png_write"):
+            bandproc.write_rgba_png(img_src, mask_path, band, priority_layer(layers, geom), *geom[2:])
+    else:
+        with instrument.stage("decode"):
+            img = Image.open(img_src).convert('RGBA')
+        with instrument.stage("create_mask_layer"):
+            mask = create_mask_layer(img, layers, geom)
+        with instrument.stage("temp_png_write"):
+            mask.save(mask_path)
+    out_ase = os.path.abspath(os.path.splitext(fname)[0] + ".aseprite")
+    out_png = os.path.abspath(output_png_name(fname))
+    paths = [os.path.abspath(img_src), os.path.abspath(mask_path)]
+    return [wsl_to_windows_path(p) for p in paths] + [pal_path_win] + \
+           [wsl_to_windows_path(p) for p in (out_ase, out_png)]
+
+# the <tmx>--0.png is there and was written after the tmx and the batch start (whole seconds, /mnt/c mtimes)
+def fresh_output(fname, since):
+    out_png = output_png_name(fname)
+    if not os.path.exists(out_png):
+        return False
+    return os.path.getmtime(out_png) >= max(os.path.getmtime(fname), int(since))
+
+# every job in one aseprite session. jobs: [(tmx name, job fields)], -> tmx names whose png did not get made
+# (priority_batch.lua only prints its errors and aseprite exits fine anyway, so the pngs are what counts)
+def render_aseprite_batch(jobs, job_dir):
+    manifest = os.path.join(job_dir, "job.txt")
+    with open(manifest, "w", encoding="utf-8", newline="\n") as f:
+        for _, job in jobs:
+            f.write("\t".join(job) + "\n")
+    lua_win = wsl_to_windows_path(os.path.abspath(BATCH_LUA_SCRIPT))
+    cmd = (f'"{ASEPRITE_PATH}" -b --script-param manifest="{wsl_to_windows_path(manifest)}" '
+           f'--script "{lua_win}"')
+    print(f"launching aseprite once for {len(jobs)} tmx")
+    started = time.time()
+    res = run_aseprite(cmd)
+    if res != 0:
+        print("Lua Aseprite batch script failed!")
+    failed = [fname for fname, _ in jobs if not fresh_output(fname, started)]
+    for fname in failed:
+        print(f"ERROR: no new {output_png_name(fname)} for {fname}")
+    return failed
+
+def process_tmx(fname, backend, palette, pal_path_win, jobs=None, job_dir=None, band=None):
+    try:
+        with instrument.stage("parse_tmx"):
+            img_src, geom, layers = parse_tmx(fname)
+    except Exception as e:
+        print(f"Read error: {fname}: {e}")
+        return False
+
+    if not os.path.isfile(img_src):
+        print(f"Tmx referred PNG missing: {img_src}!")
+        return False
+
+    instrument.count("tiles", geom[0] * geom[1])
+    instrument.count("priority_tiles", int((layers[1]["data"] == 1).sum()))
+    if backend == "native":
+        return render_native(fname, img_src, geom, layers, palette, band)
+    if backend == "aseprite":
+        jobs.append((fname, aseprite_job(fname, img_src, geom, layers, pal_path_win, job_dir, band)))
+        return True
+    return render_aseprite(fname, img_src, geom, layers, pal_path_win, band)
+
+def main():
+    parser = argparse.ArgumentParser(description="tmx + png -> indexed png with priority tiles for rescomp")
+    parser.add_argument("palette", help="64+ color JASC .pal (see examplepalette.pal)")
+    parser.add_argument("--backend", choices=("native", "aseprite", "aseprite-steps"), default="native",
+                        help="native = numpy here (default), aseprite = one aseprite run for every tmx, "
+                             "aseprite-steps = the old 4 aseprite calls per tmx")
+    parser.add_argument("--band", type=int, metavar="ROWS",
+                        help="read / write the pngs ROWS tile rows at a time, for huge maps")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.setup(args)
+
+    pal_path_wsl = os.path.abspath(args.palette)
+    pal_path_win = wsl_to_windows_path(pal_path_wsl)
+    palette = load_jasc_pal(pal_path_wsl) if args.backend == "native" else None
+
+    jobs, failed = [], []
+    # temp masks + manifest next to the tmx files, aseprite.exe can not see the WSL /tmp
+    job_dir = tempfile.mkdtemp(prefix="_aseprite_job_", dir=".") if args.backend == "aseprite" else None
+    try:
+        for fname in sorted(os.listdir('.')):
+            if fname.endswith('.tmx'):
+                print(f"> Processing {fname}")
+                with instrument.for_asset(fname), instrument.stage("tmx"):
+                    if not process_tmx(fname, args.backend, palette, pal_path_win, jobs, job_dir, args.band):
+                        failed.append(fname)
+        if jobs:
+            failed += render_aseprite_batch(jobs, os.path.abspath(job_dir))
+    finally:
+        if job_dir:
+            shutil.rmtree(job_dir, ignore_errors=True)
+    instrument.finish()
+    if failed:
+        print(f"{len(failed)} tmx failed: {', '.join(failed)}")
+    sys.exit(1 if failed else 0)
 
 if __name__ == "__main__":
     main()
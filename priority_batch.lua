@@ -0,0 +1,107 @@
+-- !/bin/lua
+-- add_mask_layer.lua + indexed conversion + prioritypigsy.lua in one go, for every tmx of a run, in ONE
+-- aseprite session. prepareprioaseprite.py --backend aseprite writes the job manifest and calls
+--   aseprite -b --script-param manifest=<job.txt> --script priority_batch.lua
+-- manifest: one job per line, tab separated: source png, mask png, palette, output .aseprite, output png
+-- nothing gets written on the scripts themselves. CREDITS TO MASTER PIGSY for the priority pass.
+
+local manifest = app.params["manifest"]
+if not manifest or #manifest == 0 then
+  print("ERROR: no manifest, run it with --script-param manifest=<file>")
+  return
+end
+
+local function split_tabs(line)
+  local fields = {}
+  for field in (line .. "\t"):gmatch("([^\t]*)\t") do
+    table.insert(fields, field)
+  end
+  return fields
+end
+
+-- Pigsy knows... every 8x8 of the high_prio layer with any pixel > 0 gets its pixels < 64 moved to +128
+local function priority_pass(layer)
+  for _, frame in ipairs(layer.sprite.frames) do
+    local cel = layer:cel(frame.frameNumber)
+    if cel and cel.image then
+      local img = cel.image
+      local w, h = img.width, img.height
+      for ty = 0, h - 1, 8 do
+        for tx = 0, w - 1, 8 do
+          local x1, y1 = math.min(tx + 7, w - 1), math.min(ty + 7, h - 1)
+          local present = false
+          for y = ty, y1 do
+            for x = tx, x1 do
+              if img:getPixel(x, y) > 0 then
+                present = true
+                break
+              end
+            end
+            if present then break end
+          end
+          if present then
+            for y = ty, y1 do
+              for x = tx, x1 do
+                local px = img:getPixel(x, y)
+                if px < 64 then
+                  img:putPixel(x, y, px + 128)
+                end
+              end
+            end
+          end
+        end
+      end
+    end
+  end
+end
+
+local function run_job(src, mask, palette, out_ase, out_png)
+  local sprite = app.open(src)
+  if not sprite then
+    print("ERROR: can not open " .. src)
+    return false
+  end
+  -- same start as "-b fg.png --palette": rgb pixels, the pigsy palette loaded
+  if sprite.colorMode ~= ColorMode.RGB then
+    app.command.ChangePixelFormat{ format="rgb" }
+  end
+  sprite:loadPalette(palette)
+
+  -- add_mask_layer.lua
+  local spr_mask = app.open(mask)
+  local mask_img = Image(spr_mask.cels[1].image)
+  spr_mask:close()
+  app.activeSprite = sprite
+  local layer = sprite:newLayer()
+  layer.name = "high_prio"
+  sprite:newCel(layer, 1, mask_img, Point(0, 0))
+
+  -- --color-mode indexed
+  app.command.ChangePixelFormat{ format="indexed" }
+
+  -- prioritypigsy.lua
+  priority_pass(layer)
+  app.activeLayer = layer
+  app.command.MergeDownLayer{}
+
+  sprite:saveAs(out_ase)
+  sprite:saveCopyAs(out_png)
+  sprite:close()
+  return true
+end
+
+local ok, failed = 0, 0
+for line in io.lines(manifest) do
+  if #line > 0 then
+    local f = split_tabs(line)
+    local done, err = pcall(run_job, f[1], f[2], f[3], f[4], f[5])
+    if done and err then
+      ok = ok + 1
+      print("  -> " .. f[5])
+    else
+      failed = failed + 1
+      print("ERROR on " .. f[1] .. ": " .. tostring(err))
+    end
+  end
+end
+print("aseprite batch: " .. ok .. " done, " .. failed .. " failed")
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# marks priority tiles for every png of a folder from rules, instead of clicking them one by one on editor.py
+# rules run in order, each one over the whole tile grid of every image at once (numpy), and turn tiles on
+# ("action": "set", the default) or off ("clear") on the rules result:
+# - {"type": "indices", "indices": [5, 6, 7], "min_pixels": 1}
+#     tiles with at least min_pixels pixels on those palette indices. the png's own indices if it is indexed,
+#     or the --palette ones (mapped as sgdkpal does, transparent = 0)
+# - {"type": "layer", "suffix": "_fg", "min_pixels": 1}
+#     tiles where the companion <base>_fg.png has non transparent pixels (alpha > 0, or index > 0 if indexed)
+# - {"type": "same_tile", "flips": true}
+#     tiles identical (pixel by pixel, optionally H/V/HV flipped) to a marked tile anywhere in the batch get
+#     marked too. marked = what the rules did so far + the manual marks (unless merge is "replace")
+# merge, what happens to what is already on the json (the manual selections):
+# - union (default): manual marks stay, rules only add
+# - replace: only what the rules say
+# - keep: images with any manual mark are not touched, the rest get the rules
+# --dry-run prints what would change per image (-v: which tiles) and writes nothing
+# rules come from a json ({"merge": ..., "rules": [...]}) or the quick flags, in this order:
+#   python priorules.py tile_priorities.json --rules priority_rules.json --dry-run
+#   python priorules.py tile_priorities.json --layer _fg --same-tile
+# the json is written through PriorityStore, close editor.py first or it will write its own copy over it
+
+import argparse
+import fnmatch
+import json
+import os
+import numpy as np
+from PIL import Image
+from priostore import PriorityStore
+from sgdkpal import image_to_palette_indices, load_jasc_pal
+
+TILE_SIZE = 8
+MERGE_POLICIES = ("union", "replace", "keep")
+GENERATED = ("*--0.png", "*_tiles.png", "_fg_*.png", "_mask_*.png")
+# companion layers (<base>_fg.png next to <base>.png) are never images of their own, whatever rules run
+COMPANION_SUFFIXES = ("_fg",)
+
+
+# (h, w) anything -> (rows, cols, 8, 8) view of the full tiles
+def tile_grid(pixels, rows, cols):
+    trimmed = pixels[:rows * TILE_SIZE, :cols * TILE_SIZE]
+    return trimmed.reshape(rows, TILE_SIZE, cols, TILE_SIZE, *pixels.shape[2:]).swapaxes(1, 2)
+
+
+# (h, w) bool -> (rows, cols) pixels per tile
+def tile_counts(hits, rows, cols):
+    return tile_grid(hits, rows, cols).sum(axis=(2, 3))
+
+
+class Image8:
+    def __init__(self, folder, name, palette=None):
+        self.name = name
+        self.path = os.path.join(folder, name)
+        with Image.open(self.path) as img:
+            img.load()
+        self.img = img
+        self.cols, self.rows = img.size[0] // TILE_SIZE, img.size[1] // TILE_SIZE
+        self.palette = palette
+        self._indices = None
+
+    def indices(self):
+        if self._indices is None:
+            if self.palette:
+                self._indices = image_to_palette_indices(self.img, self.palette)
+            elif self.img.mode == "P":
+                self._indices = np.asarray(self.img)
+            else:
+                raise ValueError(f"{self.name} is not indexed, give --palette for the indices rule")
+        return self._indices
+
+    def rgba(self):
+        return np.asarray(self.img.convert("RGBA"))
+
+
+def rule_indices(rule, images, marked):
+    wanted = np.array(rule["indices"], dtype=np.int64)
+    min_pixels = rule.get("min_pixels", 1)
+    return {im.name: tile_counts(np.isin(im.indices(), wanted), im.rows, im.cols) >= min_pixels for im in images}
+
+
+def companion_hits(path):
+    with Image.open(path) as img:
+        if img.mode == "P" and "transparency" not in img.info:
+            return np.asarray(img) > 0
+        return np.asarray(img.convert("RGBA"))[..., 3] > 0
+
+
+def rule_layer(rule, images, marked):
+    suffix = rule.get("suffix", "_fg")
+    min_pixels = rule.get("min_pixels", 1)
+    out = {}
+    for im in images:
+        layer = os.path.splitext(im.path)[0] + suffix + ".png"
+        grid = np.zeros((im.rows, im.cols), dtype=bool)
+        if os.path.exists(layer):
+            hits = companion_hits(layer)
+            rows, cols = min(im.rows, hits.shape[0] // TILE_SIZE), min(im.cols, hits.shape[1] // TILE_SIZE)
+            grid[:rows, :cols] = tile_counts(hits, rows, cols) >= min_pixels
+        else:
+            print(f"    [rules] {im.name}: no {os.path.basename(layer)}")
+        out[im.name] = grid
+    return out
+
+
+# one id per distinct tile content over the whole batch, flipped copies share it when flips
+def tile_ids(images, flips=True):
+    blocks = [tile_grid(im.rgba(), im.rows, im.cols).reshape(-1, TILE_SIZE, TILE_SIZE, 4) for im in images]
+    tiles = np.ascontiguousarray(np.concatenate(blocks)) if blocks else np.zeros((0, 8, 8, 4), np.uint8)
+    variants = [tiles]
+    if flips:
+        variants += [tiles[:, :, ::-1], tiles[:, ::-1, :], tiles[:, ::-1, ::-1]]
+    flat = np.concatenate([np.ascontiguousarray(v).reshape(len(tiles), -1) for v in variants])
+    keys = flat.view(np.dtype((np.void, flat.shape[1]))).ravel()
+    _, inverse = np.unique(keys, return_inverse=True)
+    ids = inverse.reshape(len(variants), len(tiles)).min(axis=0)
+    out, pos = {}, 0
+    for im in images:
+        n = im.rows * im.cols
+        out[im.name] = ids[pos:pos + n].reshape(im.rows, im.cols)
+        pos += n
+    return out
+
+
+def rule_same_tile(rule, images, marked):
+    ids = tile_ids(images, rule.get("flips", True))
+    seen = np.unique(np.concatenate([ids[im.name][marked[im.name]] for im in images] or [np.zeros(0, int)]))
+    return {im.name: np.isin(ids[im.name], seen) for im in images}
+
+
+RULES = {"indices": rule_indices, "layer": rule_layer, "same_tile": rule_same_tile}
+
+
+# -> {name: (rows, cols) bool} rules result, before the merge policy
+def evaluate(rules, images, manual, merge="union"):
+    result = {im.name: np.zeros((im.rows, im.cols), dtype=bool) for im in images}
+    for rule in rules:
+        if rule["type"] not in RULES:
+            raise ValueError(f"unknown rule type {rule['type']}, one of {', '.join(RULES)}")
+        marked = {n: g | manual[n] for n, g in result.items()} if merge != "replace" else result
+        hits = RULES[rule["type"]](rule, images, marked)
+        action = rule.get("action", "set")
+        for name, grid in hits.items():
+            result[name] = result[name] & ~grid if action == "clear" else result[name] | grid
+    return result
+
+
+def merged(result, manual, merge):
+    if merge == "replace":
+        return result
+    if merge == "keep":
+        return {n: manual[n] if manual[n].any() else g for n, g in result.items()}
+    return {n: g | manual[n] for n, g in result.items()}
+
+
+def manual_grid(store, name, rows, cols):
+    grid = np.zeros((rows, cols), dtype=bool)
+    for x, y in store.tiles_for(name):
+        if x < cols and y < rows:
+            grid[y, x] = True
+    return grid
+
+
+# a_fg.png is a companion when a.png is there too
+def is_companion(name, names, suffixes):
+    stem, ext = os.path.splitext(name)
+    return any(stem.endswith(s) and stem[:-len(s)] + ext in names for s in suffixes)
+
+
+# pngs of the json folder (what editor.py lists) minus generated ones and companion layers
+def find_images(folder, patterns, skip_suffixes):
+    names = sorted(f for f in os.listdir(folder) if f.lower().endswith(".png"))
+    names = [n for n in names if not any(fnmatch.fnmatch(n, g) for g in GENERATED)]
+    suffixes = set(COMPANION_SUFFIXES) | set(skip_suffixes)
+    names = [n for n in names if not is_companion(n, names, suffixes)]
+    if patterns:
+        names = [n for n in names if any(fnmatch.fnmatch(n, g) for g in patterns)]
+    return names
+
+
+def load_rules(args):
+    doc = {}
+    if args.rules:
+        with open(args.rules, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+    rules = list(doc.get("rules", []))
+    if args.indices:
+        rules.append({"type": "indices", "indices": [int(i) for i in args.indices.split(",")]})
+    if args.layer:
+        rules.append({"type": "layer", "suffix": args.layer})
+    if args.same_tile:
+        rules.append({"type": "same_tile", "flips": not args.no_flip})
+    merge = args.merge or doc.get("merge", "union")
+    if merge not in MERGE_POLICIES:
+        raise ValueError(f"unknown merge policy {merge}, one of {', '.join(MERGE_POLICIES)}")
+    return rules, merge, doc.get("images", [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="priority tiles for a whole folder from rules")
+    parser.add_argument("json", nargs="?", default="tile_priorities.json")
+    parser.add_argument("--rules", help="rules json, see the top of priorules.py")
+    parser.add_argument("--indices", help="quick rule: tiles with any of these palette indices, like 5,6,7")
+    parser.add_argument("--layer", metavar="SUFFIX", help="quick rule: tiles under <base>SUFFIX.png, like _fg")
+    parser.add_argument("--same-tile", action="store_true", help="quick rule: copy marks to identical tiles")
+    parser.add_argument("--no-flip", action="store_true", help="with --same-tile, flipped tiles are not the same")
+    parser.add_argument("--merge", choices=MERGE_POLICIES, help="what to do with manual marks (default union)")
+    parser.add_argument("--palette", help="JASC .pal for the indices rule on non indexed pngs")
+    parser.add_argument("--images", nargs="*", help="only these png name patterns")
+    parser.add_argument("--dry-run", action="store_true", help="print the changes, write nothing")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list every changed tile")
+    args = parser.parse_args()
+
+    rules, merge, patterns = load_rules(args)
+    if not rules:
+        raise SystemExit("no rules, give --rules or one of --indices / --layer / --same-tile")
+    folder = os.path.dirname(os.path.abspath(args.json))
+    skip = [r.get("suffix", "_fg") for r in rules if r["type"] == "layer"]
+    palette = load_jasc_pal(args.palette) if args.palette else None
+    images = [Image8(folder, n, palette) for n in find_images(folder, args.images or patterns, skip)]
+
+    store = PriorityStore(args.json, journal=False, readonly=args.dry_run)
+    manual = {im.name: manual_grid(store, im.name, im.rows, im.cols) for im in images}
+    final = merged(evaluate(rules, images, manual, merge), manual, merge)
+
+    total_on = total_off = 0
+    for im in images:
+        before, after = manual[im.name], final[im.name]
+        on, off = after & ~before, before & ~after
+        total_on, total_off = total_on + int(on.sum()), total_off + int(off.sum())
+        if on.any() or off.any():
+            print(f"{im.name:<32} +{int(on.sum()):<5} -{int(off.sum()):<5} ({int(before.sum())} -> {int(after.sum())})")
+            if args.verbose:
+                for label, grid in (("+", on), ("-", off)):
+                    ys, xs = np.nonzero(grid)
+                    if len(xs):
+                        print(f"    {label} " + " ".join(f"{x},{y}" for x, y in zip(xs.tolist(), ys.tolist())))
+        if args.dry_run:
+            continue
+        for grid, flag in ((on, True), (off, False)):
+            ys, xs = np.nonzero(grid)
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                store.set_tile(im.name, im.cols, im.rows, x, y, flag)
+    print(f"{len(images)} images, {len(rules)} rules, merge {merge}: +{total_on} -{total_off} tiles"
+          f"{' (dry run, nothing written)' if args.dry_run else ''}")
+    if not args.dry_run:
+        store.flush(compact=True)
+
+
+if __name__ == "__main__":
+    main()
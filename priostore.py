@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# tile_priorities.json persistence for editor.py
+# painting only touches memory, the editor calls flush() on a debounce timer, on mouse release and on close
+# - flush() appends the pending changes to <json>.journal (one small append, json lines) and every
+#   COMPACT_EVERY journaled changes (or when asked) rewrites the whole json and empties the journal
+# - the json is always written to a temp file and renamed over, a crash never leaves half a file
+# - on load the journal left by a crash is replayed over the json, so at most the last debounce is lost
+# with journal=False flush() just rewrites the json (atomically)
+# in memory every image is a set of (x, y) found through a path -> entry dict, so toggling a tile is O(1)
+# no matter how many are marked. the on disk form is only built when the json is written
+#
+# FILE FORMAT. version 1 (old) is a bare list of entries with "priority_tiles": [{"x": .., "y": ..}, ...]
+# version 2 is {"version": 2, "entries": [...]} where every entry carries "priority_bits" instead: the
+# width x height grid of priority flags, row major, packed 8 per byte (np.packbits), zlib'ed and base64'd.
+# both are read everywhere (read_priorities / entry_coords). the editor migrates a v1 file the first time
+# it opens it, leaving the old one as <json>.v1.bak
+# readonly=True loads json + journal the same way but never writes anything (pipeline.py --watch reads what
+# the editor is saving right now that way)
+
+import base64
+import json
+import os
+import shutil
+import zlib
+import numpy as np
+
+COMPACT_EVERY = 2000
+FORMAT_VERSION = 2
+TILE_KEYS = ("priority_tiles", "priority_bits")
+
+
+def encode_bits(coords, width_tiles, height_tiles):
+    mask = np.zeros((height_tiles, width_tiles), dtype=bool)
+    if coords:
+        xs, ys = np.array(list(coords), dtype=np.intp).T
+        inside = (xs >= 0) & (ys >= 0) & (xs < width_tiles) & (ys < height_tiles)
+        mask[ys[inside], xs[inside]] = True
+    packed = np.packbits(mask).tobytes()
+    return base64.b64encode(zlib.compress(packed, 9)).decode("ascii")
+
+
+def decode_bits(text, width_tiles, height_tiles):
+    packed = np.frombuffer(zlib.decompress(base64.b64decode(text)), dtype=np.uint8)
+    count = width_tiles * height_tiles
+    return np.unpackbits(packed, count=count).reshape(height_tiles, width_tiles).astype(bool)
+
+
+# (height, width) bool grid of an entry in either format
+def entry_mask(entry):
+    w, h = int(entry["width"]), int(entry["height"])
+    if "priority_bits" in entry:
+        return decode_bits(entry["priority_bits"], w, h)
+    mask = np.zeros((h, w), dtype=bool)
+    for t in entry.get("priority_tiles", []):
+        x, y = int(t["x"]), int(t["y"])
+        if 0 <= x < w and 0 <= y < h:
+            mask[y, x] = True
+    return mask
+
+
+# set of (x, y) of an entry in either format
+def entry_coords(entry):
+    if "priority_bits" not in entry:
+        return {(int(t["x"]), int(t["y"])) for t in entry.get("priority_tiles", [])}
+    ys, xs = np.nonzero(entry_mask(entry))
+    return set(zip(xs.tolist(), ys.tolist()))
+
+
+def file_version(doc):
+    return doc.get("version", FORMAT_VERSION) if isinstance(doc, dict) else 1
+
+
+# parsed json of path -> list of entries, whatever the version on disk
+def doc_entries(doc, path):
+    if file_version(doc) > FORMAT_VERSION:
+        raise ValueError(f"{path} is format version {doc['version']}, this script knows up to {FORMAT_VERSION}")
+    return doc["entries"] if isinstance(doc, dict) else doc
+
+
+def read_priorities(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return doc_entries(json.load(f), path)
+
+
+def compact_entry(entry, coords):
+    out = {k: v for k, v in entry.items() if k not in TILE_KEYS}
+    out["priority_bits"] = encode_bits(coords, int(entry["width"]), int(entry["height"]))
+    return out
+
+
+def atomic_write_json(path, data, **dump_args):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, **dump_args)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class PriorityStore:
+    def __init__(self, json_path, journal=True, readonly=False):
+        self.json_path = json_path
+        self.journal_path = json_path + ".journal"
+        self.journal = journal
+        self.readonly = readonly
+        self.data = []
+        self.by_path = {}
+        self.tiles = {}
+        self.pending = []
+        self.journaled = 0
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        version = FORMAT_VERSION
+        if os.path.exists(self.json_path):
+            with open(self.json_path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+            version = file_version(doc)
+            self.data = doc_entries(doc, self.json_path)
+        else:
+            self.data = []
+        self.tiles = {e["path"]: entry_coords(e) for e in self.data}
+        self.data = [{k: v for k, v in e.items() if k not in TILE_KEYS} for e in self.data]
+        self.by_path = {e["path"]: e for e in self.data}
+        replayed = self.replay_journal()
+        if self.readonly:
+            return
+        if replayed:
+            print(f"[Journal] {replayed} unsaved changes recovered from {self.journal_path}")
+            self.dirty = True
+        if version < FORMAT_VERSION:
+            shutil.copyfile(self.json_path, self.json_path + f".v{version}.bak")
+            print(f"[Migrated] {self.json_path} to format v{FORMAT_VERSION} (old one kept as .v{version}.bak)")
+            self.dirty = True
+        if self.dirty:
+            self.flush(compact=True)
+
+    def replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return 0
+        count = 0
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    break  # torn last line from a crash, everything before it is good
+                self._apply(op["p"], op["w"], op["h"], op["x"], op["y"], op["on"])
+                count += 1
+        return count
+
+    def entry_for(self, path_bin, width_tiles, height_tiles):
+        entry = self.by_path.get(path_bin)
+        if entry is not None:
+            return entry
+        entry = {
+            "path": path_bin,
+            "width": width_tiles,
+            "height": height_tiles,
+        }
+        self.data.append(entry)
+        self.by_path[path_bin] = entry
+        self.tiles[path_bin] = set()
+        return entry
+
+    # the live set of (x, y) for an image, empty if it has no entry yet
+    def tiles_for(self, path_bin):
+        return self.tiles.get(path_bin, set())
+
+    def _apply(self, path_bin, width_tiles, height_tiles, x, y, on):
+        self.entry_for(path_bin, width_tiles, height_tiles)
+        tiles = self.tiles[path_bin]
+        if on == ((x, y) in tiles):
+            return False
+        if on:
+            tiles.add((x, y))
+        else:
+            tiles.discard((x, y))
+        return True
+
+    # json ready document, current format
+    def snapshot(self):
+        entries = [compact_entry(entry, self.tiles[entry["path"]]) for entry in self.data]
+        return {"version": FORMAT_VERSION, "entries": entries}
+
+    # memory only, returns whether something changed
+    def set_tile(self, path_bin, width_tiles, height_tiles, x, y, on):
+        if not self._apply(path_bin, width_tiles, height_tiles, x, y, on):
+            return False
+        self.pending.append({"p": path_bin, "w": width_tiles, "h": height_tiles, "x": x, "y": y, "on": on})
+        self.dirty = True
+        return True
+
+    # compact=True also folds an already written journal into the json (close, generate)
+    def flush(self, compact=False):
+        if not self.dirty and not (compact and self.journaled):
+            return False
+        if self.journal and not compact and self.journaled + len(self.pending) < COMPACT_EVERY:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(op, separators=(",", ":")) + "\n" for op in self.pending))
+            self.journaled += len(self.pending)
+        else:
+            atomic_write_json(self.json_path, self.snapshot(), indent=2)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self.journaled = 0
+            print(f"[Guardado automático] {self.json_path}")
+        self.pending = []
+        self.dirty = False
+        return True
@@ -2,17 +2,75 @@
 # For each tile_priority.json entry it will make:
 # - <base>.pal       (16 colors, BGR555, 2 bytes each)
 # - <base>_map.tmx   (Tiled TMX no compression; 2 layers: main (tile ref entries) + high_prio(0 and 1))
-# - tile_priorities.json on the same path as the images and the script
+#                     streamed to disk by tmxio.py, --tmx-encoding zlib/gzip/zstd/base64 for compressed layers
+# - tile_priorities.json on the same path as the images and the script (old list format or the compact one,
+#   see priostore.py)
 # anyway, is meant to be launched from editor.py
+# tiles are encoded with numpy over the whole image at once. --reference uses the old getpixel loop
+# (same bytes, much slower - just there to compare against)
+# --dedup merges repeated tiles (also H/V/HV flipped ones, unless --no-flip) into <base>_tiles.png
+# and the main layer points there with Tiled flip flags. the png itself is kept as a map property
+# -j N runs N entries at a time (-j 0 = all cores). output is printed in json order anyway and a broken
+# entry does not stop the others, you get the failures listed at the end
+# entries whose png pixels, priority tiles, options and outputs did not change since the last run are
+# skipped (see buildcache.py, manifest is <json>.build.json). --force rebuilds all, --prune cleans the
+# manifest (and outputs) of images that left the json
+# --bin skips the tmx and writes SGDK ready .bin files (tiles, map words with prio/pal/flip bits, palette)
+# plus a .res and a .h snippet, see sgdkbin.py. --pal-line / --tile-base go into the map words
+# --pack aplib / wordlz / size / speed packs the tiles + map .bin right there (sgdkpack.py), no rescomp packing
+# --palette shared.pal: no per image quantizer. the 16 colors (the --pal-line row of a 64/192 color .pal) are
+# loaded once, every BGR555 color gets its index on a 32768 entry table and the pngs go through it in one
+# numpy step, so index N is the same color on every image. colors not on the palette are reported
+# (nearest one is used), --strict-palette makes that an error
+# --budget [TILES]: <base>_budget.json per png (tiles, bytes, priority tiles, vram, DMA time NTSC/PAL H32/H40,
+# see vrambudget.py) and the whole batch at the end as a table + <json>.budget.json
+# --profile [trace.json] times every stage per png (decode, quantize, encode, dedup, writes) and counts
+# tiles / bytes, see instrument.py
+# --band ROWS (with --palette): the png is read, encoded and written ROWS tile rows at a time, memory stays
+# the same whatever the map size. same output files, see bandproc.py
 
+import argparse
+import contextlib
+import io
 import json
+import multiprocessing
 import os
 import struct
-import xml.etree.ElementTree as ET
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from PIL import Image
+import instrument
+from buildcache import BuildCache
+from priostore import entry_coords, entry_mask, read_priorities
+from sgdkbin import write_sgdk_bins
+from sgdkpack import METHODS
+from sgdkpal import bgr555_lut, flat_rgb, load_jasc_pal, lut_indices, palette_hash
+from tmxio import ENCODINGS, write_tmx
+from vrambudget import DEFAULT_VRAM_BUDGET, asset_budget, batch_budget, format_table, save_budget
 
 TILE_SIZE = 8
+TILE_BYTES = TILE_SIZE * TILE_SIZE // 2
 PRIORITY_MASK = 0x8000
+# SGDK TILE_ATTR bits
+PAL_SHIFT = 13
+VFLIP_MASK = 0x1000
+HFLIP_MASK = 0x0800
+TILE_INDEX_MASK = 0x07FF
+# where SGDK's VDP_loadTileData / basetile start the user tiles (after its 16 system tiles)
+TILE_USER_INDEX = 16
+# Tiled gid flip flags
+TMX_HFLIP = 0x80000000
+TMX_VFLIP = 0x40000000
+TILESET_COLUMNS = 16
+# bump it when the output format changes so the build cache redoes everything
+GENERATOR_VERSION = "4"
+OFF_PALETTE_SHOWN = 8
+# unique tiles TileDedup has room for before its buffer grows
+DEDUP_CAPACITY = 1024
+
+# per process, the lut is built the first time a palette is seen
+_luts = {}
 
 def rgb888_to_bgr555(rgb):
     r, g, b = rgb
@@ -40,7 +98,141 @@ def tile_to_4bpp_bytes(tile_pixels):
         out.append(((tile_pixels[i] & 0x0F) << 4) | (tile_pixels[i + 1] & 0x0F))
     return bytes(out)
 
-def save_palette_file(img, pal_path):
+# reference path: one getpixel per pixel, slow but dead simple. kept to check the array one against
+def encode_tiles_reference(img_p, width_tiles, height_tiles, coords):
+    tiles_bin = bytearray()
+    map_values = []
+    tile_index = 1
+    for ty in range(height_tiles):
+        for tx in range(width_tiles):
+            pixels = get_tile_pixels(img_p, tx, ty)
+            tiles_bin += tile_to_4bpp_bytes(pixels)
+            val = tile_index & 0x7FFF
+            if (tx, ty) in coords:
+                val |= PRIORITY_MASK
+            map_values.append(val)
+            tile_index += 1
+    return bytes(tiles_bin), map_values
+
+# same rules as get_tile_pixels but for the whole image at once -> (h_px, w_px) uint8 of 4 bit indices
+def image_to_indices(img):
+    arr = np.asarray(img)
+    if arr.ndim == 3:
+        rgb = arr[..., :3].astype(np.uint16)
+        arr = (rgb.sum(axis=2) // 3) >> 4
+    return (arr & 0x0F).astype(np.uint8)
+
+# (h_px, w_px) -> (rows, cols, 8, 8) view, no copy
+def tile_view(indices):
+    h_px, w_px = indices.shape
+    rows, cols = h_px // TILE_SIZE, w_px // TILE_SIZE
+    return indices.reshape(rows, TILE_SIZE, cols, TILE_SIZE).swapaxes(1, 2)
+
+# (..., 8, 8) -> 32 bytes per tile, two pixels per byte, high nibble first
+def tiles_to_4bpp(tiles):
+    flat = tiles.reshape(-1, TILE_SIZE * TILE_SIZE)
+    return ((flat[:, 0::2] << 4) | flat[:, 1::2]).astype(np.uint8).tobytes()
+
+# priority tiles as a (height, width) bool grid, from a grid already (priostore.entry_mask) or a set of (x, y)
+def priority_grid(prio, width_tiles, height_tiles):
+    if isinstance(prio, np.ndarray):
+        return prio.astype(bool, copy=False)
+    mask = np.zeros((height_tiles, width_tiles), dtype=bool)
+    if prio:
+        xs, ys = np.array(sorted(prio), dtype=np.intp).T
+        inside = (xs < width_tiles) & (ys < height_tiles)
+        mask[ys[inside], xs[inside]] = True
+    return mask
+
+def build_map_words(width_tiles, height_tiles, prio):
+    words = (np.arange(1, width_tiles * height_tiles + 1, dtype=np.uint32) & 0x7FFF).astype(np.uint16)
+    words = words.reshape(height_tiles, width_tiles)
+    words[priority_grid(prio, width_tiles, height_tiles)] |= PRIORITY_MASK
+    return words
+
+# byte identical to encode_tiles_reference, map words come back as a (height, width) uint16 array
+def encode_tiles(img_p, width_tiles, height_tiles, prio):
+    tiles = tile_view(image_to_indices(img_p))
+    return tiles_to_4bpp(tiles), build_map_words(width_tiles, height_tiles, prio)
+
+# tiles (rows, cols, 8, 8) -> (unique (n, 8, 8), ids (rows, cols), flip bits (rows, cols))
+# every unique tile goes into a dict keyed by its 4bpp bytes under its 4 orientations (as is, H, V, HV),
+# so any later tile matching one of them reuses the id with the SGDK flip bits. ids start at 1 like the plain path
+# TileDedup keeps the dict between calls, so a map can go in a band of tile rows at a time (bandproc.py).
+# unique tiles go to one uint8 buffer that doubles when full, ids are int64 (a world map passes 65535 easily)
+class TileDedup:
+    def __init__(self, flips=True):
+        self.flips = flips
+        self.index = {}
+        self.count = 0
+        self.buffer = np.empty((DEDUP_CAPACITY, TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+
+    # (rows, cols, 8, 8) -> ids, flags of those tiles. new unique tiles go after self.count on the buffer
+    def add(self, tiles):
+        rows, cols = tiles.shape[:2]
+        flat = tiles.reshape(-1, TILE_SIZE, TILE_SIZE)
+        variants = [(tiles_to_4bpp(flat), 0)]
+        if self.flips:
+            variants += [
+                (tiles_to_4bpp(flat[:, :, ::-1]), HFLIP_MASK),
+                (tiles_to_4bpp(flat[:, ::-1, :]), VFLIP_MASK),
+                (tiles_to_4bpp(flat[:, ::-1, ::-1]), HFLIP_MASK | VFLIP_MASK),
+            ]
+        plain = variants[0][0]
+
+        index = self.index
+        ids = np.empty(len(flat), dtype=np.int64)
+        flags = np.zeros(len(flat), dtype=np.uint16)
+        for i in range(len(flat)):
+            lo = i * TILE_BYTES
+            key = plain[lo:lo + TILE_BYTES]
+            hit = index.get(key)
+            if hit is None:
+                hit = (self.count + 1, 0)
+                self.append(flat[i])
+                for blob, flag in variants:
+                    index.setdefault(blob[lo:lo + TILE_BYTES], (hit[0], flag))
+            ids[i], flags[i] = hit
+        return ids.reshape(rows, cols), flags.reshape(rows, cols)
+
+    def append(self, tile):
+        if self.count == len(self.buffer):
+            grown = np.empty((len(self.buffer) * 2, TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+            grown[:self.count] = self.buffer
+            self.buffer = grown
+        self.buffer[self.count] = tile
+        self.count += 1
+
+    # (n, 8, 8) view of the unique tiles so far, no copy
+    def tiles(self):
+        return self.buffer[:self.count]
+
+def dedup_tiles(tiles, flips=True):
+    dedup = TileDedup(flips)
+    ids, flags = dedup.add(tiles)
+    return dedup.tiles(), ids, flags
+
+# SGDK map words: tile id + H/V flip + palette line + priority
+def sgdk_map_words(ids, flags, prio, pal_line=0):
+    words = ((ids & TILE_INDEX_MASK) | flags | ((pal_line & 3) << PAL_SHIFT)).astype(np.uint16)
+    height_tiles, width_tiles = ids.shape
+    words[priority_grid(prio, width_tiles, height_tiles)] |= PRIORITY_MASK
+    return words
+
+# unique tiles laid out TILESET_COLUMNS wide, same palette as the source, blank padding at the end
+def tileset_image(unique, palette):
+    count = len(unique)
+    columns = min(TILESET_COLUMNS, max(count, 1))
+    rows = -(-max(count, 1) // columns)
+    sheet = np.zeros((rows * columns, TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+    sheet[:count] = unique
+    sheet = sheet.reshape(rows, columns, TILE_SIZE, TILE_SIZE).swapaxes(1, 2)
+    out = Image.fromarray(sheet.reshape(rows * TILE_SIZE, columns * TILE_SIZE), mode="P")
+    if palette:
+        out.putpalette(palette)
+    return out, columns
+
+def palette_rgb16(img):
     if img.mode != "P":
         img_p = img.convert("P", palette=Image.ADAPTIVE, colors=16)
     else:
@@ -53,53 +245,191 @@ def save_palette_file(img, pal_path):
         palette_rgb.append((palette[i], palette[i + 1], palette[i + 2]))
     while len(palette_rgb) < 16:
         palette_rgb.append((0, 0, 0))
+    return palette_rgb
+
+def save_palette_file(img, pal_path):
+    palette_rgb = palette_rgb16(img)
     with open(pal_path, "wb") as f:
         for rgb in palette_rgb[:16]:
             val = rgb888_to_bgr555(rgb)
             f.write(struct.pack("<H", val))
 
-def process_entry(entry):
+# the 16 colors of a shared .pal: the file itself if it has 16 or less, else its pal_line row
+def shared_palette(path, pal_line=0):
+    colors = load_jasc_pal(path)
+    if len(colors) > 16:
+        colors = colors[pal_line * 16:(pal_line + 1) * 16]
+    if not 2 <= len(colors) <= 16:
+        raise ValueError(f"{path}: no 16 color row for PAL{pal_line}")
+    return colors
+
+def palette_lut(colors):
+    key = palette_hash(colors)
+    if key not in _luts:
+        with instrument.stage("palette_lut"):
+            _luts[key] = bgr555_lut(colors)
+    return _luts[key]
+
+# png -> P image with the shared palette, through the lut
+def fixed_quantize(img, colors, strict=False):
+    lut, exact = palette_lut(colors)
+    indices, off = lut_indices(img, lut, exact)
+    report_off_palette(off, strict)
+    img_p = Image.fromarray(indices, mode="P")
+    img_p.putpalette(flat_rgb(colors))
+    return img_p
+
+# off: {(r, g, b): pixels} from lut_indices
+def report_off_palette(off, strict=False):
+    if not off:
+        return
+    pixels = sum(off.values())
+    worst = sorted(off.items(), key=lambda kv: -kv[1])[:OFF_PALETTE_SHOWN]
+    shown = ", ".join(f"#{r:02x}{g:02x}{b:02x} x{n}" for (r, g, b), n in worst)
+    msg = f"{pixels} pixels in {len(off)} colors not on the palette: {shown}"
+    instrument.count("off_palette_pixels", pixels)
+    if strict:
+        raise ValueError(msg)
+    print(f"    [WARN] {msg}")
+
+def check_entry_image(entry, img):
+    w_px, h_px = img.size
+    expected_w = int(entry["width"]) * TILE_SIZE
+    expected_h = int(entry["height"]) * TILE_SIZE
+    if w_px != expected_w or h_px != expected_h:
+        raise ValueError(f"Wrong pixel dimensions on {entry['path']}: "
+                         f"waiting for {expected_w}x{expected_h}, found: {w_px}x{h_px}")
+    return w_px, h_px
+
+# unique tiles -> <base>_tiles.png, returns (path, (w, h) px, columns)
+def save_tileset(base, unique, palette):
+    tileset_img, columns = tileset_image(unique, palette)
+    tileset_path = f"{base}_tiles.png"
+    tileset_img.save(tileset_path)
+    return tileset_path, tileset_img.size, columns
+
+# map / tileset / image attributes and map properties of the _map.tmx
+def tmx_attribs(path, width_tiles, height_tiles, tileset_source, tileset_w, tileset_h, tilecount, columns, dedup):
+    base, _ = os.path.splitext(path)
+    map_attrib = {
+        "version": "1.9",
+        "tiledversion": "1.9.2",
+        "orientation": "orthogonal",
+        "renderorder": "right-down",
+        "width": str(width_tiles),
+        "height": str(height_tiles),
+        "tilewidth": str(TILE_SIZE),
+        "tileheight": str(TILE_SIZE),
+        "infinite": "0"
+    }
+    # deduped: the tileset image is not the png anymore, prepareprioasepirte needs to know where the picture is
+    properties = {"source_image": os.path.basename(path)} if dedup else None
+    tileset_attrib = {
+        "firstgid": "1",
+        "name": os.path.basename(base) + "_tiles",
+        "tilewidth": str(TILE_SIZE),
+        "tileheight": str(TILE_SIZE),
+        "tilecount": str(tilecount),
+        "columns": str(columns)
+    }
+    image_attrib = {"source": tileset_source, "width": str(tileset_w), "height": str(tileset_h)}
+    return map_attrib, tileset_attrib, image_attrib, properties
+
+# img: the entry png already decoded (pipeline.py), opened here otherwise
+# fixed_palette: the shared_palette() colors, None = ADAPTIVE quantizer per image
+# band: tile rows per band, the png is never whole in memory (bandproc.py, needs fixed_palette)
+# also_tmx: with binary, the tmx too, from the same quantized image (pipeline.py --tmx --bin)
+def process_entry(entry, reference=False, dedup=False, flips=True, binary=False, pal_line=0, tile_base=0,
+                  tmx_encoding="csv", fixed_palette=None, strict_palette=False, budget=None, pack=None, img=None,
+                  band=None, also_tmx=False):
+    if band and img is None:
+        import bandproc
+        args = (tmx_encoding, fixed_palette, strict_palette, budget, pack)
+        if binary and also_tmx:  # the bands are read once per output there
+            tmx_outputs = bandproc.process_entry_banded(entry, band, dedup, flips, False, pal_line, tile_base, *args)
+            return tmx_outputs and tmx_outputs + bandproc.process_entry_banded(entry, band, dedup, flips, True,
+                                                                               pal_line, tile_base, *args)[1:]
+        return bandproc.process_entry_banded(entry, band, dedup, flips, binary, pal_line, tile_base, *args)
     path = entry["path"]
     width_tiles = int(entry["width"])
     height_tiles = int(entry["height"])
-    coords = {(int(t["x"]), int(t["y"])) for t in entry.get("priority_tiles", [])}
+    prio = entry_mask(entry)
 
     if not os.path.exists(path):
         print(f"[SKIP] '{path}' does not exist")
-        return
+        return False
 
     print(f"[+] Processing: {path} ({width_tiles} x {height_tiles} tiles)")
 
-    img = Image.open(path)
-    w_px, h_px = img.size
-    expected_w = width_tiles * TILE_SIZE
-    expected_h = height_tiles * TILE_SIZE
-    if w_px != expected_w or h_px != expected_h:
-        raise ValueError(f"Wrong pixel dimensions on {path}: "
-                         f"waiting for {expected_w}x{expected_h}, found: {w_px}x{h_px}")
+    if img is None:
+        with instrument.stage("decode"):
+            img = Image.open(path)
+            img.load()
+    w_px, h_px = check_entry_image(entry, img)
+    instrument.count("tiles", width_tiles * height_tiles)
+    instrument.count("priority_tiles", int(prio.sum()))
+
+    with instrument.stage("quantize"):
+        if fixed_palette:
+            img_p = fixed_quantize(img, fixed_palette, strict_palette)
+        else:
+            img_p = img.convert("P", palette=Image.ADAPTIVE, colors=16)
 
-    # Guardar paleta .pal
+    # Guardar paleta .pal (an indexed png keeps its own palette there, as always)
     base, _ = os.path.splitext(path)
     pal_path = f"{base}.pal"
-    save_palette_file(img, pal_path)
+    with instrument.stage("palette_write"):
+        save_palette_file(img if img.mode == "P" and not fixed_palette else img_p, pal_path)
     print(f"    Paleta -> {pal_path}")
+    outputs = [pal_path]
+    # the selected encoder (numpy, or the getpixel one with --reference) gives the 4bpp tiles of --bin and the
+    # priority bits of every output: the high_prio layer, the --bin map words
+    with instrument.stage("encode"):
+        if reference:
+            tiles_bin, map_values = encode_tiles_reference(img_p, width_tiles, height_tiles, entry_coords(entry))
+            map_words = np.asarray(map_values, dtype=np.uint16).reshape(height_tiles, width_tiles)
+        else:
+            tiles_bin, map_words = encode_tiles(img_p, width_tiles, height_tiles, prio)
+    high_prio = (map_words & PRIORITY_MASK) != 0
+    deduped = None
+    if dedup:
+        with instrument.stage("dedup"):
+            deduped = dedup_tiles(tile_view(image_to_indices(img_p)), flips=flips)
+        instrument.count("unique_tiles", len(deduped[0]))
 
-    img_p = img.convert("P", palette=Image.ADAPTIVE, colors=16)
-    tiles_bin = bytearray()
-    map_values = []
+    if binary and not also_tmx:
+        outputs += write_bin_outputs(base, path, tiles_bin, deduped, high_prio, prio, img_p, pal_line, tile_base,
+                                     pack, budget)
+        count_written(outputs)
+        return outputs
+
+    # layer 1 gids: one tile per cell straight from the png, or the deduped tileset with Tiled flip flags
+    tileset_source = os.path.basename(path)
+    tileset_w, tileset_h = w_px, h_px
+    tilecount = width_tiles * height_tiles
+    columns = width_tiles
+    gids = np.arange(1, width_tiles * height_tiles + 1, dtype=np.uint32)
+    if dedup:
+        unique, ids, flags = deduped
+        if len(unique) > TILE_INDEX_MASK:
+            print(f"    [WARN] {len(unique)} unique tiles, more than SGDK can index ({TILE_INDEX_MASK})")
+
+        tileset_path, (tileset_w, tileset_h), columns = save_tileset(base, unique, img_p.getpalette())
+        outputs.append(tileset_path)
+        tileset_source = os.path.basename(tileset_path)
+        tilecount = len(unique)
+
+        gid_arr = ids.astype(np.uint32)
+        gid_arr[(flags & HFLIP_MASK) != 0] |= TMX_HFLIP
+        gid_arr[(flags & VFLIP_MASK) != 0] |= TMX_VFLIP
+        gids = gid_arr
+
+        cells = width_tiles * height_tiles
+        saved = (cells - len(unique)) * TILE_BYTES
+        print(f"    Tileset -> {tileset_path}  (unique tiles: {len(unique)} / {cells}, saved: {saved} bytes)")
 
-    tile_index = 1
-    for ty in range(height_tiles):
-        for tx in range(width_tiles):
-            pixels = get_tile_pixels(img_p, tx, ty)
-            tiles_bin += tile_to_4bpp_bytes(pixels)
-            val = tile_index & 0x7FFF
-            if (tx, ty) in coords:
-                val |= PRIORITY_MASK
-            map_values.append(val)
-            tile_index += 1
-            
     # LEGACY - DID NOT WORK AS EXPECTED... GIVING UP - JUST HERE TO REMEMBER WHAT NOT TO DO 
+    # (map was written little endian, the 68k wants big endian - the working version is --bin, see sgdkbin.py)
     #tiles_path = f"{base}_tiles.bin"
     #with open(tiles_path, "wb") as f:
     #    f.write(tiles_bin)
@@ -113,74 +443,207 @@ def process_entry(entry):
 
     # layer 1 "main" y layer 2 "high_prio" (bin mask)
     tmx_path = f"{base}_map.tmx"
-    map_attrib = {
-        "version": "1.9",
-        "tiledversion": "1.9.2",
-        "orientation": "orthogonal",
-        "renderorder": "right-down",
-        "width": str(width_tiles),
-        "height": str(height_tiles),
-        "tilewidth": str(TILE_SIZE),
-        "tileheight": str(TILE_SIZE),
-        "infinite": "0"
-    }
-    root = ET.Element("map", map_attrib)
-
-    tileset = ET.SubElement(root, "tileset", {
-        "firstgid": "1",
-        "name": os.path.basename(base) + "_tiles",
-        "tilewidth": str(TILE_SIZE),
-        "tileheight": str(TILE_SIZE),
-        "tilecount": str(width_tiles * height_tiles),
-        "columns": str(width_tiles)
-    })
-    image_source = os.path.basename(path)
-    ET.SubElement(tileset, "image", {"source": image_source, "width": str(w_px), "height": str(h_px)})
+    map_attrib, tileset_attrib, image_attrib, properties = tmx_attribs(
+        path, width_tiles, height_tiles, tileset_source, tileset_w, tileset_h, tilecount, columns, dedup)
 
     # layer 1: main (full tilemap) 
-    rows_main = []
-    for y in range(height_tiles):
-        row = []
-        for x in range(width_tiles):
-            gid = y * width_tiles + x + 1
-            row.append(str(gid))
-        rows_main.append(",".join(row))
-
     # layer 2: high_prio (bin mask: 1 = high priority, 0 = low) 
-    rows_high_prio = []
-    for y in range(height_tiles):
-        row = []
-        for x in range(width_tiles):
-            idx = y * width_tiles + x
-            val = map_values[idx]
-            if val & PRIORITY_MASK:
-                row.append("1")
-            else:
-                row.append("0")
-        rows_high_prio.append(",".join(row))
+    main_layer = np.asarray(gids, dtype=np.uint32).reshape(height_tiles, width_tiles)
+    with instrument.stage("tmx_write"):
+        write_tmx(tmx_path, map_attrib, tileset_attrib, image_attrib,
+                  [("main", main_layer), ("high_prio", high_prio.astype(np.uint8))],
+                  properties=properties, layer_encoding=tmx_encoding)
+    print(f"    TMX -> {tmx_path}")
+    outputs.append(tmx_path)
+    if budget:
+        outputs.append(write_budget(base, path, width_tiles, height_tiles, tilecount, prio, 0, budget))
+    if binary:
+        outputs += write_bin_outputs(base, path, tiles_bin, deduped, high_prio, prio, img_p, pal_line, tile_base,
+                                     pack, budget)
+    count_written(outputs)
+    return outputs
 
-    layer_main = ET.SubElement(root, "layer", {"id": "1", "name": "main", "width": str(width_tiles), "height": str(height_tiles)})
-    data_main = ET.SubElement(layer_main, "data", {"encoding": "csv"})
-    data_main.text = "\n" + ",\n".join(rows_main) + "\n"
+# --bin files of process_entry. tiles_bin: the encoder's 4bpp tiles, deduped: dedup_tiles() or None
+def write_bin_outputs(base, path, tiles_bin, deduped, high_prio, prio, img_p, pal_line, tile_base, pack, budget):
+    height_tiles, width_tiles = high_prio.shape
+    if deduped:
+        unique, ids, flags = deduped
+        tiles_bin = tiles_to_4bpp(unique)
+    else:
+        ids = np.arange(1, width_tiles * height_tiles + 1, dtype=np.int64).reshape(height_tiles, width_tiles)
+        flags = np.zeros_like(ids)
+    tile_count = len(tiles_bin) // TILE_BYTES
+    warn_tile_index(tile_count, tile_base)
+    # tile ids are 0 based here, VDP_setTileMapDataRectEx adds the vram base itself
+    words = sgdk_map_words(ids.astype(np.int64) - 1 + tile_base, flags, high_prio, pal_line)
+    with instrument.stage("bin_write"):
+        written = write_sgdk_bins(base, tiles_bin, words, palette_rgb16(img_p), pal_line, pack, tile_base)
+    print(f"    SGDK bin -> {base}_tiles.bin / _map.bin / _pal.bin  (tiles: {tile_count})")
+    if budget:
+        written.append(write_budget(base, path, width_tiles, height_tiles, tile_count, prio, tile_base, budget))
+    return written
 
-    layer_high_prio = ET.SubElement(root, "layer", {"id": "2", "name": "high_prio", "width": str(width_tiles), "height": str(height_tiles)})
-    data_high_prio = ET.SubElement(layer_high_prio, "data", {"encoding": "csv"})
-    data_high_prio.text = "\n" + ",\n".join(rows_high_prio) + "\n"
+# --bin tiles land on TILE_USER_INDEX + tile_base, the last one has to fit the 11 bit index of the map word
+def warn_tile_index(tile_count, tile_base):
+    last = TILE_USER_INDEX + tile_base + tile_count - 1
+    if last > TILE_INDEX_MASK:
+        print(f"    [WARN] {tile_count} tiles at TILE_USER_INDEX + {tile_base} end on vram tile {last}, "
+              f"past SGDK's 11 bit tile index ({TILE_INDEX_MASK})")
 
-    tree = ET.ElementTree(root)
-    ET.indent(tree, space="  ")
-    tree.write(tmx_path, encoding="utf-8", xml_declaration=True)
-    print(f"    TMX -> {tmx_path}")
+def budget_path(base):
+    return f"{base}_budget.json"
+
+def write_budget(base, path, width_tiles, height_tiles, unique_tiles, prio, tile_base, budget):
+    report = asset_budget(path, width_tiles, height_tiles, unique_tiles, int(prio.sum()), tile_base, budget)
+    out = budget_path(base)
+    save_budget(out, report)
+    flag = "" if report["fits_vram"] else "  [OVER BUDGET]"
+    print(f"    Budget -> {out}  (vram tiles: {unique_tiles}, "
+          f"NTSC H40 full load: {report['dma']['NTSC_H40']['frames']} frames){flag}")
+    return out
+
+# every entry's <base>_budget.json (the cached ones too) -> batch table + <json>.budget.json
+def report_budget(json_path, entries, budget):
+    assets = []
+    for e in entries:
+        path = budget_path(os.path.splitext(e["path"])[0])
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                assets.append(json.load(f))
+    report = batch_budget(assets, budget)
+    out = os.path.splitext(json_path)[0] + ".budget.json"
+    save_budget(out, report)
+    print("\n" + format_table(report))
+    print(f"Budget -> {out}")
+    return report
+
+def count_written(paths):
+    if instrument.enabled:
+        instrument.count("bytes_written", sum(os.path.getsize(p) for p in paths if os.path.exists(p)))
+
+# runs one entry keeping its output and errors to itself, so the pool can hand them back in order
+# (with what instrument recorded meanwhile, a worker process can not add it to the main one itself)
+# stdout is only captured on a worker process: in process it prints as it goes, redirect_stdout swaps the
+# process wide sys.stdout and editor.py runs the batch on a background thread
+def run_entry(entry, options, func=process_entry):
+    out = io.StringIO()
+    outputs, error = False, None
+    path = entry.get("path", "?")
+    capture = contextlib.redirect_stdout(out) if multiprocessing.parent_process() else contextlib.nullcontext()
+    with capture, instrument.for_asset(path), instrument.stage("entry"):
+        try:
+            outputs = func(entry, **options)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return path, outputs, out.getvalue(), error, instrument.collect()
+
+# on_done(index, outputs) is called in json order for every entry that got written
+# func is what runs per entry (process_entry here, pipeline.build_entry for the one shot build)
+def run_batch(entries, options, workers=1, on_done=None, cached=0, func=process_entry, mp_context=None):
+    if workers == 1 or len(entries) < 2:
+        results = (run_entry(e, options, func) for e in entries)
+        return report_batch(results, on_done, cached)
+    n = len(entries)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        return report_batch(pool.map(run_entry, entries, [options] * n, [func] * n), on_done, cached)
+
+# prints every entry log in json order as results come, then the summary
+def report_batch(results, on_done=None, cached=0):
+    processed, skipped, failed = 0, 0, []
+    for i, (path, outputs, log, error, trace) in enumerate(results):
+        instrument.merge(trace)
+        print(log, end="")
+        if error:
+            print(f"[FAIL] {path}: {error}")
+            failed.append((path, error))
+        elif outputs:
+            processed += 1
+            if on_done:
+                on_done(i, outputs)
+        else:
+            skipped += 1
+    print(f"\nDone: {processed} processed, {cached} unchanged, {skipped} skipped, {len(failed)} failed")
+    for path, error in failed:
+        print(f"    {path}: {error}")
+    return failed
+
+# run_batch behind the build manifest: entries that did not change are not even sent to the workers
+def run_cached_batch(cache, entries, options, workers=1, force=False, prune=False, func=process_entry,
+                     mp_context=None):
+    if prune:
+        for path in cache.prune(entries):
+            print(f"[CACHE] pruned {path}")
+    todo, fps, cached = [], [], 0
+    for e in entries:
+        with instrument.stage("cache_check", e["path"]):
+            fp = cache.fingerprint(e) if os.path.exists(e["path"]) else None
+        if fp and not force and cache.is_fresh(e, fp):
+            cached += 1
+            continue
+        todo.append(e)
+        fps.append(fp)
+
+    def on_done(i, outputs):
+        if fps[i]:
+            cache.record(todo[i], fps[i], outputs)
+
+    failed = run_batch(todo, options, workers, on_done, cached, func, mp_context)
+    for path, _ in failed:
+        cache.forget(path)
+    cache.save()
+    return failed
 
 def main():
-    jpath = "tile_priorities.json"
+    parser = argparse.ArgumentParser(description="tile_priorities.json -> .pal + _map.tmx for every entry")
+    parser.add_argument("json", nargs="?", default="tile_priorities.json")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="processes to use, 0 = one per cpu (default 1)")
+    parser.add_argument("--reference", action="store_true", help="use the slow getpixel encoder")
+    parser.add_argument("--dedup", action="store_true", help="merge repeated tiles into <base>_tiles.png")
+    parser.add_argument("--no-flip", action="store_true", help="with --dedup, do not look for flipped tiles")
+    parser.add_argument("--tmx-encoding", choices=sorted(ENCODINGS), default="csv",
+                        help="tmx layer data: csv (default) or base64, optionally zlib/gzip/zstd compressed")
+    parser.add_argument("--bin", action="store_true",
+                        help="write SGDK _tiles/_map/_pal .bin + .res/.h snippets instead of the tmx")
+    parser.add_argument("--pal-line", type=int, default=0, choices=range(4), help="with --bin, PAL0..PAL3")
+    parser.add_argument("--tile-base", type=int, default=0, help="with --bin, added to every tile index")
+    parser.add_argument("--pack", choices=METHODS, default="none",
+                        help="with --bin, pack tiles + map: aplib, wordlz, or the best per png by size / speed")
+    parser.add_argument("--palette", help="shared JASC .pal, maps every png through one BGR555 table")
+    parser.add_argument("--strict-palette", action="store_true", help="with --palette, off palette colors fail")
+    parser.add_argument("--budget", nargs="?", type=int, const=DEFAULT_VRAM_BUDGET, metavar="TILES",
+                        help=f"vram/DMA report per png and for the batch, vram budget in tiles "
+                             f"(default {DEFAULT_VRAM_BUDGET})")
+    parser.add_argument("--band", type=int, metavar="ROWS",
+                        help="with --palette, read and write the png ROWS tile rows at a time (huge maps)")
+    parser.add_argument("--force", action="store_true", help="rebuild everything, ignore the build manifest")
+    parser.add_argument("--prune", action="store_true",
+                        help="drop manifest records (and their outputs) of images no longer in the json")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.setup(args)
+
+    jpath = args.json
     if not os.path.exists(jpath):
-        raise FileNotFoundError("tile_priorities.json not in path.")
-    with open(jpath, "r", encoding="utf-8") as f:
-        entries = json.load(f)
-    for e in entries:
-        process_entry(e)
-    print("\nDone")
+        raise FileNotFoundError(f"{jpath} not in path.")
+    entries = read_priorities(jpath)
+    options = {"reference": args.reference, "dedup": args.dedup, "flips": not args.no_flip,
+               "binary": args.bin, "pal_line": args.pal_line, "tile_base": args.tile_base,
+               "tmx_encoding": args.tmx_encoding,
+               "fixed_palette": shared_palette(args.palette, args.pal_line) if args.palette else None,
+               "strict_palette": args.strict_palette,
+               "budget": args.budget, "pack": args.pack, "band": args.band}
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    # the reference encoder and --band write the same bytes, no need to tell the cache about them
+    cache_options = {k: v for k, v in options.items() if k not in ("reference", "band")}
+    cache_options["fixed_palette"] = palette_hash(options["fixed_palette"])
+    cache = BuildCache(jpath, GENERATOR_VERSION, cache_options)
+    failed = run_cached_batch(cache, entries, options, workers, args.force, args.prune)
+    if args.budget:
+        report_budget(jpath, entries, args.budget)
+    instrument.finish()
+    sys.exit(1 if failed else 0)
 
 if __name__ == "__main__":
     main()
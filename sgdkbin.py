@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# raw SGDK data straight from setprioFULLAND01.py --bin, no tmx / aseprite / rescomp IMAGE involved
+# for <base>.png you get:
+# - <base>_tiles.bin  4bpp tiles, 32 bytes each (big endian u32 rows, what VDP_loadTileData eats)
+# - <base>_map.bin    u16 big endian map words: prio | pal | vflip | hflip | tile index
+# - <base>_pal.bin    16 u16 big endian VDP colors (0000BBB0GGG0RRR0)
+# - <base>.res        BIN lines, rescomp takes it as is if it sits in res/, or paste them on your resources.res
+# - <base>_bin.h      sizes + how to load it
+# the old LEGACY attempt in process_entry wrote the map little endian, that's why it "did not work"
+# --pack aplib / wordlz / size / speed: _tiles.bin and _map.bin come out packed (sgdkpack.py), same names,
+# the _bin.h says which format each one is and how to unpack it. the palette stays raw
+
+import os
+import re
+import struct
+import numpy as np
+import sgdkpack
+
+PALETTE_SIZE = 16
+
+
+def rgb888_to_vdp(rgb):
+    r, g, b = rgb[:3]
+    return ((b >> 5) << 9) | ((g >> 5) << 5) | ((r >> 5) << 1)
+
+
+def palette_to_vdp_bytes(palette_rgb):
+    colors = list(palette_rgb[:PALETTE_SIZE])
+    colors += [(0, 0, 0)] * (PALETTE_SIZE - len(colors))
+    return b"".join(struct.pack(">H", rgb888_to_vdp(c)) for c in colors)
+
+
+def map_to_bytes(words):
+    return np.asarray(words, dtype=np.uint16).astype(">u2").tobytes()
+
+
+def c_name(base):
+    name = re.sub(r"\W", "_", os.path.basename(base))
+    return name if not name[:1].isdigit() else "_" + name
+
+
+def res_snippet(base):
+    name, file = c_name(base), os.path.basename(base)
+    return (f'BIN {name}_tiles "{file}_tiles.bin" 2\n'
+            f'BIN {name}_map "{file}_map.bin" 2\n'
+            f'BIN {name}_pal "{file}_pal.bin" 2\n')
+
+
+UNPACK_CALLS = {
+    "aplib": "aplib_unpack((const u8*) {src}, (u8*) {dst});",
+    "wordlz": "wordlz_unpack((const u16*) {src}, (u16*) {dst});  // wordlz.h",
+}
+
+
+# packed: {"tiles": (format, packed size, raw size), "map": ...} for the ones that are not raw
+# tile_base: --tile-base, already on every map word, so the tiles go that far past TILE_USER_INDEX
+def header_snippet(base, tile_count, width_tiles, height_tiles, pal_line, packed=None, tile_base=0):
+    name = c_name(base)
+    up = name.upper()
+    lines = [f"// {os.path.basename(base)} - generated by setprioFULLAND01.py --bin\n",
+             f"#define {up}_TILES_COUNT {tile_count}\n",
+             f"#define {up}_MAP_W {width_tiles}\n",
+             f"#define {up}_MAP_H {height_tiles}\n",
+             f"#define {up}_TILE_BASE {tile_base}\n"]
+    src = {"tiles": f"{name}_tiles", "map": f"{name}_map"}
+    for part, (fmt, size, raw) in (packed or {}).items():
+        src[part] = f"{name}_{part}_buf"
+        lines += [f"// {name}_{part} is {fmt} packed, {size} -> {raw} bytes, unpack to ram first:\n",
+                  f"// static u16 {src[part]}[{raw // 2}];\n",
+                  f"// {UNPACK_CALLS[fmt].format(src=f'{name}_{part}', dst=src[part])}\n"]
+    lines += [f"// VDP_loadTileData((const u32*) {src['tiles']}, TILE_USER_INDEX + {up}_TILE_BASE, {up}_TILES_COUNT, "
+              f"DMA);\n",
+              f"// VDP_setTileMapDataRectEx(BG_A, (const u16*) {src['map']}, TILE_USER_INDEX, 0, 0,\n",
+              f"//                          {up}_MAP_W, {up}_MAP_H, {up}_MAP_W, DMA);\n",
+              f"// PAL_setColors(PAL{pal_line} * 16, (const u16*) {name}_pal, 16, DMA);\n"]
+    return "".join(lines)
+
+
+# tiles_bytes from tiles_to_4bpp, words (h, w) uint16 already carrying every attribute bit
+# pack: a sgdkpack.METHODS name for tiles + map, None = raw
+def write_sgdk_bins(base, tiles_bytes, words, palette_rgb, pal_line=0, pack=None, tile_base=0):
+    height_tiles, width_tiles = np.shape(words)
+    parts = {"tiles": tiles_bytes, "map": map_to_bytes(words)}
+    packed = {}
+    if pack and pack != "none":
+        for part, raw in parts.items():
+            fmt, data = sgdkpack.pack(raw, pack)
+            if fmt != "none":
+                parts[part] = data
+                packed[part] = (fmt, len(data), len(raw))
+    files = {
+        f"{base}_tiles.bin": parts["tiles"],
+        f"{base}_map.bin": parts["map"],
+        f"{base}_pal.bin": palette_to_vdp_bytes(palette_rgb),
+    }
+    for path, data in files.items():
+        with open(path, "wb") as f:
+            f.write(data)
+    tile_count = len(tiles_bytes) // 32
+    return list(files) + write_snippets(base, tile_count, width_tiles, height_tiles, pal_line, packed, tile_base)
+
+
+# the .res + _bin.h next to the bins, -> their paths
+def write_snippets(base, tile_count, width_tiles, height_tiles, pal_line=0, packed=None, tile_base=0):
+    res_path, h_path = f"{base}.res", f"{base}_bin.h"
+    with open(res_path, "w") as f:
+        f.write(res_snippet(base))
+    with open(h_path, "w") as f:
+        f.write(header_snippet(base, tile_count, width_tiles, height_tiles, pal_line, packed, tile_base))
+    return [res_path, h_path]
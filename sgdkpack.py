@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# packs the --bin data here instead of rescomp doing it asset by asset with its java packer
+# - aplib: the plain aPLib stream (no header), what SGDK's aplib_unpack() takes. best ratio, slowest to unpack
+# - wordlz: LZ on 16 bit words, everything word aligned, unpacks at copy speed on the 68000 with the few
+#   lines of wordlz.h (include it in your SGDK project). only for even sized data: tiles, maps, palettes
+#   stream: u16 big endian header LLLLLLLL MMMMMMMM, L literal words, then if M: u16 offset in words back and
+#   M words copied from there (overlapping is fine). header 0 ends it
+# - SGDK's own LZ4W layout is not reproduced here, rescomp keeps doing that one if you want it
+# both use hash chains for the matches (CHAIN_DEPTH candidates per position) and every packed blob is unpacked
+# again and compared before it is returned, a broken stream never reaches the rom
+# method: aplib / wordlz / none as is, or
+# - size: smallest of all (raw included)
+# - speed: the cheapest to unpack (none < wordlz < aplib) that is within SPEED_SLACK of the smallest
+#
+#   python sgdkpack.py level_tiles.bin level_map.bin --method size
+
+import argparse
+import os
+import time
+import numpy as np
+
+CHAIN_DEPTH = 32
+APLIB_WINDOW = 0xFFFF
+WORDLZ_MAX_RUN = 0xFF
+WORDLZ_WINDOW = 0xFFFF
+SPEED_SLACK = 0.25
+DECODE_ORDER = ("none", "wordlz", "aplib")
+METHODS = ("none", "aplib", "wordlz", "size", "speed")
+
+
+# common prefix length of seq[i:] and seq[j:], up to limit. slices compare in C, 16 at a time
+def match_len(seq, i, j, limit):
+    n = 0
+    while n + 16 <= limit and seq[i + n:i + n + 16] == seq[j + n:j + n + 16]:
+        n += 16
+    while n < limit and seq[i + n] == seq[j + n]:
+        n += 1
+    return n
+
+
+class HashChain:
+    def __init__(self, seq, key, window, depth=CHAIN_DEPTH):
+        self.seq, self.key, self.window, self.depth = seq, key, window, depth
+        self.head = {}
+        self.prev = [-1] * len(seq)
+        self.filled = 0
+
+    # every position up to i (excluded) goes in
+    def fill(self, i):
+        for p in range(self.filled, min(i, len(self.seq) - 1)):
+            k = self.key(p)
+            self.prev[p] = self.head.get(k, -1)
+            self.head[k] = p
+        self.filled = max(self.filled, i)
+
+    # -> [(length, offset), ...] nearest first, only the ones longer than the previous
+    def matches(self, i, limit):
+        self.fill(i)
+        out = []
+        if i + 1 >= len(self.seq):
+            return out
+        j, best = self.head.get(self.key(i), -1), 1
+        for _ in range(self.depth):
+            if j < 0 or i - j > self.window:
+                break
+            n = match_len(self.seq, i, j, limit)
+            if n > best:
+                best = n
+                out.append((n, i - j))
+                if n == limit:
+                    break
+            j = self.prev[j]
+        return out
+
+
+# ---- aPLib ----
+
+def gamma_bits(v):
+    return 2 * (v.bit_length() - 1)
+
+
+def aplib_len_adjust(offset):
+    return (offset >= 32000) + (offset >= 1280) + 2 * (offset < 128)
+
+
+class BitWriter:
+    def __init__(self):
+        self.out = bytearray()
+        self.tag = 0
+        self.left = 0
+
+    def bit(self, b):
+        if not self.left:
+            self.tag = len(self.out)
+            self.out.append(0)
+            self.left = 8
+        self.left -= 1
+        if b:
+            self.out[self.tag] |= 1 << self.left
+
+    def bits(self, value, count):
+        for k in range(count - 1, -1, -1):
+            self.bit((value >> k) & 1)
+
+    def gamma(self, v):
+        for k in range(v.bit_length() - 2, -1, -1):
+            self.bit((v >> k) & 1)
+            self.bit(k > 0)
+
+    def byte(self, v):
+        self.out.append(v)
+
+
+def pack_aplib(data, depth=CHAIN_DEPTH):
+    data = bytes(data)
+    if not data:
+        raise ValueError("aplib needs at least one byte")
+    n = len(data)
+    chain = HashChain(data, lambda p: data[p] << 8 | data[p + 1], APLIB_WINDOW, depth)
+    w = BitWriter()
+    w.byte(data[0])
+    last_offset, after_match = 0, False
+
+    # best (gain in bits, kind, length, offset) at i, with the state the decoder will have there
+    def choose(i, after_match, last_offset):
+        limit = n - i
+        best = (0, "literal", 1, 0)
+        nibble = data[max(0, i - 15):i].rfind(data[i])
+        if data[i] == 0 or nibble >= 0:
+            best = (2, "nibble", 1, 0 if data[i] == 0 else min(i, 15) - nibble)
+        if not after_match and last_offset and last_offset <= i:
+            length = match_len(data, i, i - last_offset, limit)
+            if length >= 2:
+                gain = 9 * length - (4 + gamma_bits(length))
+                if gain > best[0]:
+                    best = (gain, "rep", length, last_offset)
+        for length, offset in chain.matches(i, limit):
+            if offset < 128:
+                short = min(length, 3)
+                if 9 * short - 11 > best[0]:
+                    best = (9 * short - 11, "short", short, offset)
+            coded = length - aplib_len_adjust(offset)
+            if coded < 2:
+                continue
+            high = (offset >> 8) + (2 if after_match else 3)
+            gain = 9 * length - (2 + gamma_bits(high) + 8 + gamma_bits(coded))
+            if gain > best[0]:
+                best = (gain, "match", length, offset)
+        return best
+
+    i = 1
+    while i < n:
+        gain, kind, length, offset = choose(i, after_match, last_offset)
+        # one step lazy: a literal now and a better match right after wins over a short one now
+        if kind in ("match", "rep") and i + 1 < n:
+            nxt = choose(i + 1, False, last_offset)
+            if nxt[0] > gain + 9 and nxt[1] in ("match", "rep"):
+                kind, length = "literal", 1
+        if kind == "literal":
+            w.bit(0)
+            w.byte(data[i])
+            after_match = False
+        elif kind == "nibble":
+            w.bits(0b111, 3)
+            w.bits(offset, 4)
+            after_match = False
+        elif kind == "short":
+            w.bits(0b110, 3)
+            w.byte(offset << 1 | (length - 2))
+            last_offset, after_match = offset, True
+        elif kind == "rep":
+            w.bits(0b10, 2)
+            w.gamma(2)
+            w.gamma(length)
+            after_match = True
+        else:
+            w.bits(0b10, 2)
+            w.gamma((offset >> 8) + (2 if after_match else 3))
+            w.byte(offset & 0xFF)
+            w.gamma(length - aplib_len_adjust(offset))
+            last_offset, after_match = offset, True
+        i += length
+    w.bits(0b110, 3)
+    w.byte(0)
+    return bytes(w.out)
+
+
+def unpack_aplib(src):
+    out = bytearray()
+    pos, tag, left = 0, 0, 0
+
+    def bit():
+        nonlocal pos, tag, left
+        if not left:
+            tag, left = src[pos], 8
+            pos += 1
+        left -= 1
+        return (tag >> left) & 1
+
+    def gamma():
+        v = 1
+        while True:
+            v = v * 2 + bit()
+            if not bit():
+                return v
+
+    def copy(offset, length):
+        if offset > len(out) or offset == 0:
+            raise ValueError(f"aplib: offset {offset} before the start at {len(out)}")
+        for _ in range(length):
+            out.append(out[-offset])
+
+    out.append(src[0])
+    pos = 1
+    last_offset, after_match = 0, False
+    while True:
+        if not bit():
+            out.append(src[pos])
+            pos += 1
+            after_match = False
+        elif not bit():
+            high = gamma()
+            if not after_match and high == 2:
+                copy(last_offset, gamma())
+            else:
+                offset = (high - (2 if after_match else 3)) << 8 | src[pos]
+                pos += 1
+                copy(offset, gamma() + aplib_len_adjust(offset))
+                last_offset = offset
+            after_match = True
+        elif not bit():
+            offset, length = src[pos] >> 1, 2 + (src[pos] & 1)
+            pos += 1
+            if not offset:
+                return bytes(out)
+            copy(offset, length)
+            last_offset, after_match = offset, True
+        else:
+            offset = bit() << 3 | bit() << 2 | bit() << 1 | bit()
+            if offset:
+                copy(offset, 1)
+            else:
+                out.append(0)
+            after_match = False
+
+
+# ---- wordlz ----
+
+def pack_wordlz(data, depth=CHAIN_DEPTH):
+    if len(data) % 2:
+        raise ValueError(f"wordlz works on words, {len(data)} bytes is odd")
+    words = np.frombuffer(bytes(data), dtype=">u2").tolist()
+    n = len(words)
+    chain = HashChain(words, lambda p: words[p] << 16 | words[p + 1], WORDLZ_WINDOW, depth)
+    out = []
+    literals = []
+
+    def flush(match=0, offset=0):
+        while len(literals) > WORDLZ_MAX_RUN:
+            out.append(WORDLZ_MAX_RUN << 8)
+            out.extend(literals[:WORDLZ_MAX_RUN])
+            del literals[:WORDLZ_MAX_RUN]
+        if literals or match:
+            out.append(len(literals) << 8 | match)
+            out.extend(literals)
+            if match:
+                out.append(offset)
+        literals.clear()
+
+    i = 0
+    while i < n:
+        found = chain.matches(i, min(WORDLZ_MAX_RUN, n - i))
+        if found and found[-1][0] >= 2:
+            length, offset = found[-1]
+            flush(length, offset)
+            i += length
+        else:
+            literals.append(words[i])
+            i += 1
+    flush()
+    out.append(0)
+    return np.array(out, dtype=">u2").tobytes()
+
+
+def unpack_wordlz(src):
+    words = np.frombuffer(bytes(src), dtype=">u2").tolist()
+    out = []
+    pos = 0
+    while True:
+        header = words[pos]
+        pos += 1
+        if not header:
+            return np.array(out, dtype=">u2").tobytes()
+        count, match = header >> 8, header & 0xFF
+        out.extend(words[pos:pos + count])
+        pos += count
+        if match:
+            offset = words[pos]
+            pos += 1
+            if not 0 < offset <= len(out):
+                raise ValueError(f"wordlz: offset {offset} before the start at {len(out)}")
+            for _ in range(match):
+                out.append(out[-offset])
+
+
+PACKERS = {"aplib": pack_aplib, "wordlz": pack_wordlz}
+UNPACKERS = {"aplib": unpack_aplib, "wordlz": unpack_wordlz, "none": bytes}
+EXTENSIONS = {"aplib": ".apl", "wordlz": ".wlz"}
+
+
+# -> (format, packed bytes). every packed candidate is unpacked again and has to give data back
+def pack(data, method="size", depth=CHAIN_DEPTH):
+    data = bytes(data)
+    if method not in METHODS:
+        raise ValueError(f"unknown pack method {method}, one of {', '.join(METHODS)}")
+    if method == "none" or (not data and method in ("size", "speed")):
+        return "none", data
+    if method in PACKERS:
+        formats = [method]
+    else:
+        formats = [f for f in PACKERS if data and not (f == "wordlz" and len(data) % 2)]
+    results = {"none": data} if method in ("size", "speed") else {}
+    for fmt in formats:
+        packed = PACKERS[fmt](data, depth)
+        if UNPACKERS[fmt](packed) != data:
+            raise ValueError(f"{fmt} round trip failed on {len(data)} bytes")
+        results[fmt] = packed
+    if method in PACKERS:
+        return method, results[method]
+    smallest = min(len(p) for p in results.values())
+    if method == "size":
+        fmt = min(results, key=lambda f: (len(results[f]), DECODE_ORDER.index(f)))
+    else:
+        fmt = next(f for f in DECODE_ORDER if f in results and len(results[f]) <= smallest * (1 + SPEED_SLACK))
+    return fmt, results[fmt]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pack SGDK binaries as aplib / wordlz, checked by unpacking")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--method", default="size", choices=METHODS)
+    parser.add_argument("--depth", type=int, default=CHAIN_DEPTH, help="hash chain candidates per position")
+    parser.add_argument("-o", "--output", help="output folder (default: next to each file)")
+    args = parser.parse_args()
+
+    total_in = total_out = 0
+    for path in args.files:
+        with open(path, "rb") as f:
+            data = f.read()
+        start = time.perf_counter()
+        fmt, packed = pack(data, args.method, args.depth)
+        ms = (time.perf_counter() - start) * 1000
+        out = "(kept raw, packing does not pay)"
+        if fmt != "none":
+            out = os.path.join(args.output or os.path.dirname(path), os.path.splitext(os.path.basename(path))[0])
+            out += EXTENSIONS[fmt]
+            with open(out, "wb") as f:
+                f.write(packed)
+        total_in, total_out = total_in + len(data), total_out + len(packed)
+        print(f"{os.path.basename(path):<32} {fmt:<7} {len(data):>7} -> {len(packed):>7} {ms:>8.1f} ms  {out}")
+    if total_in:
+        print(f"{len(args.files)} files {total_in} -> {total_out} bytes ({100 * total_out / total_in:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
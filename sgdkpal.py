@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# palette helpers shared by the scripts
+# - JASC .pal loading (the 64/192/256 color palettes Aseprite saves, like examplepalette.pal)
+# - mapping any image to palette indices the way Aseprite does when it converts to indexed:
+#   exact color -> first entry with that color, otherwise the nearest one. transparent pixels -> 0,
+#   opaque ones never land on 0 as that is the mask color
+# - the BGR555 lookup table setprioFULLAND01.py --palette maps every png through (bgr555_lut / lut_indices)
+
+import hashlib
+import numpy as np
+from PIL import Image
+
+
+def load_jasc_pal(path):
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [l.strip() for l in f if l.strip()]
+    if len(lines) < 3 or lines[0] != "JASC-PAL":
+        raise ValueError(f"{path} is not a JASC-PAL file")
+    count = int(lines[2])
+    colors = []
+    for line in lines[3:3 + count]:
+        parts = [int(v) for v in line.split()]
+        r, g, b = parts[:3]
+        a = parts[3] if len(parts) > 3 else 255
+        colors.append((r, g, b, a))
+    if len(colors) != count:
+        raise ValueError(f"{path}: header says {count} colors, found {len(colors)}")
+    return colors
+
+
+# flat [r, g, b, ...] as PIL putpalette wants it
+def flat_rgb(colors):
+    out = []
+    for r, g, b, *_ in colors[:256]:
+        out += [r, g, b]
+    return out
+
+
+# RGBA (h, w, 4) uint8 -> (h, w) uint8 palette indices
+def map_to_palette(rgba, colors):
+    pal = np.array([c[:3] for c in colors], dtype=np.int32)
+    keys = (rgba[..., 0].astype(np.uint32) << 16) | (rgba[..., 1].astype(np.uint32) << 8) | rgba[..., 2]
+    opaque = rgba[..., 3] > 0
+    uniq, inverse = np.unique(keys[opaque], return_inverse=True)
+    rgb = np.stack([(uniq >> 16) & 0xFF, (uniq >> 8) & 0xFF, uniq & 0xFF], axis=1).astype(np.int32)
+    dist = ((rgb[:, None, :] - pal[None, 1:, :]) ** 2).sum(axis=2)
+    lut = (dist.argmin(axis=1) + 1).astype(np.uint8)  # argmin keeps the first one on exact matches too
+    out = np.zeros(keys.shape, dtype=np.uint8)
+    out[opaque] = lut[inverse.ravel()]
+    return out
+
+
+def image_to_palette_indices(img, colors):
+    return map_to_palette(np.asarray(img.convert("RGBA")), colors)
+
+
+def indexed_image(indices, colors, transparent=0):
+    out = Image.fromarray(indices, mode="P")
+    out.putpalette(flat_rgb(colors))
+    if transparent is not None:
+        out.info["transparency"] = transparent
+    return out
+
+
+# RGB888 -> the 15 bit key the VDP ends up seeing, same packing as setprioFULLAND01.rgb888_to_bgr555
+def bgr555_keys(rgb):
+    rgb = rgb.astype(np.uint16)
+    return ((rgb[..., 2] >> 3) << 10) | ((rgb[..., 1] >> 3) << 5) | (rgb[..., 0] >> 3)
+
+
+# one shared palette for the whole batch: every one of the 32768 BGR555 colors -> palette index, built once.
+# exact colors go to the first entry that has them (0 only if it is opaque on the .pal), anything else to the
+# nearest of 1..n. -> (lut uint8[32768], exact bool[32768])
+def bgr555_lut(colors):
+    pal = np.array([c[:3] for c in colors], dtype=np.int32) >> 3
+    keys = np.arange(1 << 15, dtype=np.int32)
+    bgr = np.stack([keys & 0x1F, (keys >> 5) & 0x1F, keys >> 10], axis=1)
+    dist = ((bgr[:, None, :] - pal[None, 1:, :]) ** 2).sum(axis=2)
+    lut = (dist.argmin(axis=1) + 1).astype(np.uint8)
+    exact = np.zeros(1 << 15, dtype=bool)
+    pal_keys = bgr555_keys(np.array([c[:3] for c in colors], dtype=np.uint8))
+    for i in range(len(colors) - 1, -1, -1):  # backwards so the first entry wins
+        if i == 0 and len(colors[0]) > 3 and colors[0][3] == 0:
+            continue
+        lut[pal_keys[i]] = i
+        exact[pal_keys[i]] = True
+    return lut, exact
+
+
+# image -> (h, w) uint8 indices through the lut in one go + {(r, g, b): pixels} of the colors not on the palette
+def lut_indices(img, lut, exact):
+    rgba = np.asarray(img.convert("RGBA"))
+    keys = bgr555_keys(rgba[..., :3])
+    opaque = rgba[..., 3] > 0
+    out = np.where(opaque, lut[keys], 0).astype(np.uint8)
+    off = opaque & ~exact[keys]
+    report = {}
+    if off.any():
+        colors, counts = np.unique(rgba[..., :3][off].reshape(-1, 3), axis=0, return_counts=True)
+        report = {tuple(int(v) for v in c): int(n) for c, n in zip(colors, counts)}
+    return out, report
+
+
+def palette_hash(colors):
+    return hashlib.sha1(repr(colors).encode()).hexdigest() if colors else None
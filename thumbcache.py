@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# thumbnails for the editor's image list, cached on disk under <folder>/.thumbcache/
+# a cached thumbnail is keyed by file path + mtime + size, so an edited png just gets a new one
+# and the old one is dropped by prune(). safe to call from worker threads
+
+import hashlib
+import os
+from PIL import Image
+
+THUMB_SIZE = (128, 128)
+CACHE_DIR = ".thumbcache"
+
+
+def thumb_key(path):
+    st = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{THUMB_SIZE[0]}x{THUMB_SIZE[1]}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class ThumbCache:
+    def __init__(self, folder):
+        self.dir = os.path.join(folder, CACHE_DIR)
+
+    def cached_path(self, key):
+        return os.path.join(self.dir, key + ".png")
+
+    # -> small PIL image, from the cache if it is there
+    def get(self, path):
+        key = thumb_key(path)
+        cached = self.cached_path(key)
+        if os.path.exists(cached):
+            try:
+                with Image.open(cached) as img:
+                    img.load()
+                    return img
+            except OSError:
+                pass  # broken cache file, make it again
+        with Image.open(path) as img:
+            img.thumbnail(THUMB_SIZE)
+            thumb = img.copy()
+        os.makedirs(self.dir, exist_ok=True)
+        tmp = f"{cached}.{os.getpid()}.{id(thumb)}.tmp"
+        thumb.save(tmp, format="PNG")
+        os.replace(tmp, cached)
+        return thumb
+
+    # removes cached thumbnails of files that are gone or changed
+    def prune(self, paths):
+        if not os.path.isdir(self.dir):
+            return 0
+        keep = set()
+        for path in paths:
+            try:
+                keep.add(thumb_key(path) + ".png")
+            except OSError:
+                pass
+        removed = 0
+        for fname in os.listdir(self.dir):
+            if fname.endswith(".png") and fname not in keep:
+                os.remove(os.path.join(self.dir, fname))
+                removed += 1
+        return removed
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# one tile bank for every png of tile_priorities.json instead of a tileset per png (setprioFULLAND01 --bin)
+# - all pngs through one palette (--palette shared.pal, or one ADAPTIVE pass over all of them together)
+# - every tile of every png hashed into one bank, flipped copies reuse the same tile (unless --no-flip)
+# - bank order: tiles used by more pngs first, then by first use. so what a screen needs sits in few
+#   contiguous vram runs and the tiles screens share stay put when you swap
+# - vram indices from --base (added to TILE_USER_INDEX on the 68k side, like --tile-base), skipping the
+#   --reserve ranges (e.g. 0-15,200-263 for a font or sprites)
+# - every png map is rewritten against the bank: <base>_bankmap.bin with prio / pal / flip bits as --bin
+# outputs for <out> (default: the json name):
+# - <out>_bank_tiles.bin  the bank, vram order, 32 bytes per tile (reserved slots are not in it)
+# - <out>_pal.bin, <out>.res, <out>_bank.h
+# - <out>_layout.json per png: vram runs it needs resident (vram index, count, bank tile), upload bytes,
+#   what changes going to the next png of the json, and the bank vs one tileset per png numbers
+#
+#   python tilebank.py tile_priorities.json --palette shared.pal --base 0 --reserve 0-15
+
+import argparse
+import json
+import os
+import numpy as np
+from PIL import Image
+from priostore import entry_mask, read_priorities
+from setprioFULLAND01 import (TILE_BYTES, TILE_INDEX_MASK, TILE_SIZE, check_entry_image, dedup_tiles, fixed_quantize,
+                              image_to_indices, palette_rgb16, sgdk_map_words, shared_palette, tile_view,
+                              tiles_to_4bpp)
+from sgdkbin import c_name, map_to_bytes, palette_to_vdp_bytes
+
+MAP_WORD_BYTES = 2
+# not _map: that is the setprioFULLAND01 --bin map of the png and its .res symbol
+BANKMAP_SUFFIX = "_bankmap"
+
+
+# "0-15,200-263,300" -> set of indices
+def parse_ranges(text):
+    out = set()
+    for part in filter(None, (p.strip() for p in (text or "").split(","))):
+        lo, _, hi = part.partition("-")
+        out.update(range(int(lo), int(hi or lo) + 1))
+    return out
+
+
+# sorted indices -> [(start, count), ...] of consecutive ones
+def runs(indices):
+    out = []
+    for i in indices:
+        if out and out[-1][0] + out[-1][1] == i:
+            out[-1][1] += 1
+        else:
+            out.append([i, 1])
+    return [tuple(r) for r in out]
+
+
+def load_images(entries):
+    images = []
+    for e in entries:
+        with Image.open(e["path"]) as img:
+            img.load()
+        check_entry_image(e, img)
+        images.append(img)
+    return images
+
+
+# -> (list of (h, w) 4 bit index arrays, 16 rgb colors), same palette for every png
+def quantize_all(images, colors=None):
+    if colors:
+        quantized = [fixed_quantize(img, colors) for img in images]
+        return [image_to_indices(p) for p in quantized], palette_rgb16(quantized[0])
+    width = max(img.size[0] for img in images)
+    sheet = Image.new("RGBA", (width, sum(img.size[1] for img in images)))
+    y = 0
+    for img in images:
+        sheet.paste(img.convert("RGBA"), (0, y))
+        y += img.size[1]
+    sheet_p = sheet.convert("RGB").convert("P", palette=Image.ADAPTIVE, colors=16)
+    indices = image_to_indices(sheet_p)
+    out, y = [], 0
+    for img in images:
+        w, h = img.size
+        out.append(indices[y:y + h, :w])
+        y += h
+    return out, palette_rgb16(sheet_p)
+
+
+# bank id (1 based, dedup order) -> position in the bank: most shared first, then first use
+def bank_order(ids_per_image, count):
+    users = np.zeros(count + 1, dtype=np.int64)
+    first = np.full(count + 1, np.iinfo(np.int64).max)
+    pos = 0
+    for ids in ids_per_image:
+        flat = ids.ravel()
+        used = np.unique(flat)
+        users[used] += 1
+        order_in = pos + np.arange(flat.size)
+        np.minimum.at(first, flat, order_in)
+        pos += flat.size
+    order = sorted(range(1, count + 1), key=lambda t: (-users[t], first[t]))
+    return order, users
+
+
+# bank positions -> vram indices from base, jumping the reserved ones
+def vram_slots(count, base=0, reserved=()):
+    reserved = set(reserved)
+    slots, i = [], base
+    while len(slots) < count:
+        if i not in reserved:
+            slots.append(i)
+        i += 1
+    return slots
+
+
+def build_bank(entries, colors=None, flips=True, base=0, reserved=(), pal_line=0):
+    images = load_images(entries)
+    indices, palette = quantize_all(images, colors)
+    grids = [tile_view(ix) for ix in indices]
+    flat = np.concatenate([g.reshape(1, -1, TILE_SIZE, TILE_SIZE) for g in grids], axis=1)
+    unique, ids, flags = dedup_tiles(flat, flips=flips)
+    ids, flags = ids.ravel().astype(np.int64), flags.ravel()
+
+    ids_per_image, flags_per_image, pos = [], [], 0
+    for g in grids:
+        n = g.shape[0] * g.shape[1]
+        ids_per_image.append(ids[pos:pos + n].reshape(g.shape[:2]))
+        flags_per_image.append(flags[pos:pos + n].reshape(g.shape[:2]))
+        pos += n
+
+    order, users = bank_order(ids_per_image, len(unique))
+    slots = vram_slots(len(order), base, reserved)
+    if slots and slots[-1] > TILE_INDEX_MASK:
+        print(f"[WARN] bank reaches vram tile {slots[-1]}, past SGDK's 11 bit tile index")
+    vram_of = np.zeros(len(unique) + 1, dtype=np.int64)
+    bank_pos = np.zeros(len(unique) + 1, dtype=np.int64)
+    for p, t in enumerate(order):
+        vram_of[t] = slots[p]
+        bank_pos[t] = p
+
+    maps = [sgdk_map_words(vram_of[i], f, entry_mask(e), pal_line)
+            for e, i, f in zip(entries, ids_per_image, flags_per_image)]
+    return {
+        "palette": palette,
+        "bank_tiles": tiles_to_4bpp(unique[np.array(order, dtype=np.int64) - 1]),
+        "count": len(order),
+        "maps": maps,
+        "ids": ids_per_image,
+        "vram_of": vram_of,
+        "bank_pos": bank_pos,
+        "users": users,
+    }
+
+
+def image_layout(entry, ids, bank):
+    used = np.unique(ids)
+    vram = sorted(int(bank["vram_of"][t]) for t in used)
+    pos_of_vram = {int(bank["vram_of"][t]): int(bank["bank_pos"][t]) for t in used}
+    return {
+        "path": entry["path"],
+        "width": int(entry["width"]),
+        "height": int(entry["height"]),
+        "tiles": len(vram),
+        "shared_tiles": int((bank["users"][used] > 1).sum()),
+        "runs": [{"vram": s, "count": n, "bank": pos_of_vram[s]} for s, n in runs(vram)],
+        "upload_bytes": len(vram) * TILE_BYTES,
+        "map_bytes": ids.size * MAP_WORD_BYTES,
+    }
+
+
+def layout_report(entries, bank, base, reserved):
+    images = [image_layout(e, ids, bank) for e, ids in zip(entries, bank["ids"])]
+    swaps = []
+    for a, b, ids_a, ids_b in zip(images, images[1:], bank["ids"], bank["ids"][1:]):
+        have = set(np.unique(ids_a).tolist())
+        need = sorted(int(bank["vram_of"][t]) for t in np.unique(ids_b).tolist() if t not in have)
+        swaps.append({"from": a["path"], "to": b["path"], "upload_tiles": len(need),
+                      "upload_bytes": len(need) * TILE_BYTES, "transfers": len(runs(need))})
+    per_image_tiles = sum(i["tiles"] for i in images)
+    cells = sum(i["width"] * i["height"] for i in images)
+    return {
+        "bank_tiles": bank["count"],
+        "bank_bytes": bank["count"] * TILE_BYTES,
+        "vram_base": base,
+        "vram_last": int(bank["vram_of"].max()) if bank["count"] else base,
+        "reserved": [{"vram": s, "count": n} for s, n in runs(sorted(reserved))],
+        "one_tileset_per_png_tiles": per_image_tiles,
+        "no_dedup_tiles": cells,
+        "saved_bytes": (per_image_tiles - bank["count"]) * TILE_BYTES,
+        "images": images,
+        "swaps": swaps,
+    }
+
+
+def header_snippet(out, report):
+    name = c_name(out)
+    up = name.upper()
+    return (f"// {os.path.basename(out)} - generated by tilebank.py\n"
+            f"#define {up}_BANK_TILES {report['bank_tiles']}\n"
+            f"#define {up}_VRAM_BASE {report['vram_base']}\n"
+            f"// every run of the png in {os.path.basename(out)}_layout.json:\n"
+            f"// VDP_loadTileData((const u32*) {name}_bank_tiles + bank * 8, TILE_USER_INDEX + vram, count, DMA);\n"
+            f"// maps are <png>_bankmap.bin, already pointing to the bank vram indices:\n"
+            f"// VDP_setTileMapDataRectEx(BG_A, (const u16*) png_bankmap, TILE_USER_INDEX, x, y, w, h, w, DMA);\n")
+
+
+def write_outputs(out, entries, bank, report):
+    written = []
+    files = {f"{out}_bank_tiles.bin": bank["bank_tiles"], f"{out}_pal.bin": palette_to_vdp_bytes(bank["palette"])}
+    for e, words in zip(entries, bank["maps"]):
+        files[f"{os.path.splitext(e['path'])[0]}{BANKMAP_SUFFIX}.bin"] = map_to_bytes(words)
+    for path, data in files.items():
+        with open(path, "wb") as f:
+            f.write(data)
+        written.append(path)
+    name, file = c_name(out), os.path.basename(out)
+    res_lines = [f'BIN {name}_bank_tiles "{file}_bank_tiles.bin" 2\n', f'BIN {name}_pal "{file}_pal.bin" 2\n']
+    for e in entries:
+        base = os.path.splitext(e["path"])[0]
+        res_lines.append(f'BIN {c_name(base)}{BANKMAP_SUFFIX} "{os.path.basename(base)}{BANKMAP_SUFFIX}.bin" 2\n')
+    for path, text in ((f"{out}.res", "".join(res_lines)), (f"{out}_bank.h", header_snippet(out, report))):
+        with open(path, "w") as f:
+            f.write(text)
+        written.append(path)
+    layout = f"{out}_layout.json"
+    with open(layout, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    return written + [layout]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="one shared, deduped tile bank + vram layout for every png")
+    parser.add_argument("json", nargs="?", default="tile_priorities.json")
+    parser.add_argument("--palette", help="shared JASC .pal (16 colors or the --pal-line row)")
+    parser.add_argument("--pal-line", type=int, default=0, choices=range(4))
+    parser.add_argument("--base", type=int, default=0, help="first vram tile index of the bank")
+    parser.add_argument("--reserve", default="", help="vram tile indices to leave alone, like 0-15,200-263")
+    parser.add_argument("--no-flip", action="store_true", help="do not reuse flipped tiles")
+    parser.add_argument("-o", "--output", help="output base name (default: the json name)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.json):
+        raise FileNotFoundError(f"{args.json} not in path.")
+    folder = os.path.dirname(args.json)
+    entries = [dict(e, path=os.path.join(folder, e["path"])) for e in read_priorities(args.json)]
+    missing = [e["path"] for e in entries if not os.path.exists(e["path"])]
+    for path in missing:
+        print(f"[SKIP] '{path}' does not exist")
+    entries = [e for e in entries if e["path"] not in missing]
+    if not entries:
+        raise SystemExit("no pngs to bank")
+
+    reserved = parse_ranges(args.reserve)
+    colors = shared_palette(args.palette, args.pal_line) if args.palette else None
+    bank = build_bank(entries, colors, not args.no_flip, args.base, reserved, args.pal_line)
+    report = layout_report(entries, bank, args.base, reserved)
+    out = args.output or os.path.splitext(args.json)[0]
+    write_outputs(out, entries, bank, report)
+
+    print(f"{'png':<28} {'tiles':>6} {'shared':>7} {'runs':>5} {'upload B':>9}")
+    for img in report["images"]:
+        print(f"{os.path.basename(img['path'])[-28:]:<28} {img['tiles']:>6} {img['shared_tiles']:>7} "
+              f"{len(img['runs']):>5} {img['upload_bytes']:>9}")
+    print(f"bank {report['bank_tiles']} tiles (vram {report['vram_base']}..{report['vram_last']}), "
+          f"one tileset per png would be {report['one_tileset_per_png_tiles']}, "
+          f"saved {report['saved_bytes']} bytes of rom/vram")
+    for s in report["swaps"]:
+        print(f"  {os.path.basename(s['from'])} -> {os.path.basename(s['to'])}: {s['upload_tiles']} tiles "
+              f"in {s['transfers']} transfers")
+    print(f"-> {out}_bank_tiles.bin / _pal.bin / _layout.json / .res / _bank.h + <png>_bankmap.bin")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# TMX in and out without building the whole document in memory
+# - write_tmx streams the xml to disk, layer data row by row (csv) or compressed chunk by chunk (base64)
+#   LayerWriter takes the rows of a layer as they come, for maps written band by band
+#   csv output is byte for byte what the old ElementTree + ET.indent code wrote
+# - read_tmx walks the file with iterparse and decodes every layer straight into a numpy uint32 array
+# layer encodings (Tiled names): csv, base64 (raw), base64 + zlib, base64 + gzip, base64 + zstd
+# zstd needs the zstandard package, only imported when used
+
+import base64
+import gzip
+import zlib
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+import numpy as np
+
+# --tmx-encoding value -> (encoding, compression)
+ENCODINGS = {
+    "csv": ("csv", None),
+    "base64": ("base64", None),
+    "zlib": ("base64", "zlib"),
+    "gzip": ("base64", "gzip"),
+    "zstd": ("base64", "zstd"),
+}
+ATTR_ESCAPES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#09;"}
+# rows per compressed chunk, keeps memory flat on huge maps
+CHUNK_ROWS = 64
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd layer encoding needs the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+def _tag(name, attrib, close=False):
+    attrs = "".join(f' {k}="{escape(str(v), ATTR_ESCAPES)}"' for k, v in attrib.items())
+    return f"<{name}{attrs}{' /' if close else ''}>"
+
+
+class _Base64Stream:
+    # base64 of a byte stream written in pieces, only whole 3 byte groups go out until close
+    def __init__(self, f):
+        self.f = f
+        self.pending = b""
+
+    def write(self, data):
+        data = self.pending + data
+        cut = len(data) - len(data) % 3
+        if cut:
+            self.f.write(base64.b64encode(data[:cut]).decode("ascii"))
+        self.pending = data[cut:]
+
+    def close(self):
+        if self.pending:
+            self.f.write(base64.b64encode(self.pending).decode("ascii"))
+        self.pending = b""
+
+
+def _compressor(compression):
+    if compression is None:
+        return None
+    if compression == "zlib":
+        return zlib.compressobj(9)
+    if compression == "gzip":
+        return zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if compression == "zstd":
+        return _zstd().ZstdCompressor(level=19).compressobj()
+    raise ValueError(f"unknown tmx compression {compression}")
+
+
+# one <layer>, data given a few rows at a time (csv rows or compressed base64, as they come)
+# the same bytes as the whole array at once, so huge maps can be written band by band (see bandproc.py)
+class LayerWriter:
+    def __init__(self, f, layer_id, name, width, height, layer_encoding="csv"):
+        self.f = f
+        self.height = height
+        self.rows = 0
+        self.encoding, self.compression = ENCODINGS[layer_encoding]
+        f.write(f"  {_tag('layer', {'id': layer_id, 'name': name, 'width': width, 'height': height})}\n")
+        attrib = {"encoding": self.encoding}
+        if self.compression:
+            attrib["compression"] = self.compression
+        f.write(f"    {_tag('data', attrib)}")
+        if self.encoding == "csv":
+            f.write("\n")
+        else:
+            # base64 layers are little endian u32 gids, Tiled writes them on their own indented line
+            f.write("\n   ")
+            self.out = _Base64Stream(f)
+            self.comp = _compressor(self.compression)
+
+    def write(self, rows):
+        rows = np.asarray(rows)
+        if self.encoding == "csv":
+            for row in rows:
+                self.rows += 1
+                self.f.write(",".join(map(str, row.tolist())))
+                self.f.write(",\n" if self.rows < self.height else "\n")
+        else:
+            raw = np.ascontiguousarray(rows, dtype="<u4").tobytes()
+            self.out.write(self.comp.compress(raw) if self.comp else raw)
+            self.rows += len(rows)
+
+    def close(self):
+        if self.encoding != "csv":
+            if self.comp:
+                self.out.write(self.comp.flush())
+            self.out.close()
+            self.f.write("\n  ")
+        self.f.write("</data>\n")
+        self.f.write("  </layer>\n")
+
+
+def write_tmx_head(f, map_attrib, tileset_attrib, image_attrib, properties=None):
+    f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+    f.write(_tag("map", map_attrib) + "\n")
+    if properties:
+        f.write("  <properties>\n")
+        for k, v in properties.items():
+            f.write(f"    {_tag('property', {'name': k, 'value': v}, close=True)}\n")
+        f.write("  </properties>\n")
+    f.write(f"  {_tag('tileset', tileset_attrib)}\n")
+    f.write(f"    {_tag('image', image_attrib, close=True)}\n")
+    f.write("  </tileset>\n")
+
+
+def write_tmx_tail(f):
+    f.write("</map>")
+
+
+# layers: list of (name, (h, w) array of gids). properties: dict or None
+def write_tmx(path, map_attrib, tileset_attrib, image_attrib, layers, properties=None, layer_encoding="csv"):
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        write_tmx_head(f, map_attrib, tileset_attrib, image_attrib, properties)
+        for i, (name, data) in enumerate(layers, start=1):
+            data = np.asarray(data)
+            h, w = data.shape
+            layer = LayerWriter(f, i, name, w, h, layer_encoding)
+            for y in range(0, h, CHUNK_ROWS):
+                layer.write(data[y:y + CHUNK_ROWS])
+            layer.close()
+        write_tmx_tail(f)
+
+
+def decode_layer_data(text, encoding, compression, count):
+    text = (text or "").strip()
+    if encoding == "csv":
+        # numpy's own text parser, skips the python int per entry round trip
+        arr = np.fromstring(text, dtype=np.uint32, sep=",") if text else np.zeros(0, np.uint32)
+    elif encoding == "base64":
+        raw = base64.b64decode(text)
+        if compression == "zlib":
+            raw = zlib.decompress(raw)
+        elif compression == "gzip":
+            raw = gzip.decompress(raw)
+        elif compression == "zstd":
+            raw = _zstd().ZstdDecompressor().decompressobj().decompress(raw)
+        elif compression:
+            raise ValueError(f"unknown tmx compression {compression}")
+        arr = np.frombuffer(raw, dtype="<u4").astype(np.uint32)
+    else:
+        raise ValueError(f"unknown tmx layer encoding {encoding}")
+    if arr.size != count:
+        raise ValueError(f"layer data has {arr.size} entries, expected {count}")
+    return arr
+
+
+# -> {"attrib": map attrs, "properties": {}, "image": tileset image attrs, "layers": [{name, width, height, data}]}
+# data is a flat uint32 array (row major), same as the old int lists but compact
+def read_tmx(path):
+    result = {"attrib": {}, "properties": {}, "image": None, "layers": []}
+    layer = None
+    stack = []
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            stack.append(tag)
+            if tag == "map":
+                result["attrib"] = dict(elem.attrib)
+            elif tag == "layer":
+                layer = dict(elem.attrib)
+            continue
+        stack.pop()
+        if tag == "property" and stack[-2:] == ["map", "properties"]:
+            result["properties"][elem.attrib.get("name")] = elem.attrib.get("value")
+        elif tag == "image" and result["image"] is None:
+            result["image"] = dict(elem.attrib)
+        elif tag == "data" and layer is not None:
+            w, h = int(layer["width"]), int(layer["height"])
+            data = decode_layer_data(elem.text, elem.attrib.get("encoding", "csv"),
+                                     elem.attrib.get("compression"), w * h)
+            result["layers"].append({"name": layer["name"], "width": w, "height": h, "data": data})
+        elif tag == "layer":
+            layer = None
+            elem.clear()
+    return result
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# what an asset costs on the real thing, before trying it on an emulator (setprioFULLAND01.py --budget)
+# per asset, from the arrays process_entry already has: tiles (cells / unique), tile + map bytes, priority
+# tiles, vram slots against a budget, and how long a full DMA load takes in vblank for NTSC/PAL, H32/H40
+# DMA numbers are the usual VDP ones: 167 (H32) / 205 (H40) bytes per line with the display off / in vblank,
+# 38 vblank lines on NTSC (262 - 224), 89 on PAL (313 - 224). so a frame moves about 6.3 / 7.8 KB on NTSC
+# and 14.9 / 18.2 KB on PAL. real games lose some of that to sprites, scroll tables and palettes
+# --vram-budget is in tiles: 2048 slots minus what SGDK keeps by default (BG A/B + window planes 64x32,
+# sprite list + hscroll table, system tiles and font) = DEFAULT_VRAM_BUDGET
+
+import json
+import math
+import os
+
+TILE_BYTES = 32
+MAP_WORD_BYTES = 2
+VRAM_TILES = 2048
+DEFAULT_VRAM_BUDGET = VRAM_TILES - 3 * 128 - 64 - 16 - 96
+
+DMA_BYTES_PER_LINE = {"H32": 167, "H40": 205}
+VIDEO = {  # lines per frame, vblank lines, frames per second
+    "NTSC": (262, 38, 60),
+    "PAL": (313, 89, 50),
+}
+MODES = [(video, width) for video in VIDEO for width in DMA_BYTES_PER_LINE]
+
+
+# -> {"NTSC_H40": {vblank_bytes, frames, ms}, ...} for a transfer of nbytes done only in vblank
+def dma_estimate(nbytes):
+    out = {}
+    for video, width in MODES:
+        lines_total, vblank_lines, fps = VIDEO[video]
+        per_line = DMA_BYTES_PER_LINE[width]
+        per_frame = vblank_lines * per_line
+        lines = nbytes / per_line
+        out[f"{video}_{width}"] = {
+            "vblank_bytes": per_frame,
+            "frames": math.ceil(nbytes / per_frame) if nbytes else 0,
+            "ms": round(lines * 1000 / (lines_total * fps), 3),
+        }
+    return out
+
+
+def asset_budget(name, width_tiles, height_tiles, unique_tiles, priority_tiles, tile_base=0,
+                 budget=DEFAULT_VRAM_BUDGET):
+    cells = width_tiles * height_tiles
+    tile_bytes = unique_tiles * TILE_BYTES
+    map_bytes = cells * MAP_WORD_BYTES
+    return {
+        "asset": name,
+        "width": width_tiles,
+        "height": height_tiles,
+        "tiles_total": cells,
+        "tiles_unique": unique_tiles,
+        "tile_bytes": tile_bytes,
+        "map_bytes": map_bytes,
+        "priority_tiles": priority_tiles,
+        "vram_tiles": unique_tiles,
+        "vram_budget": budget,
+        "fits_vram": tile_base + unique_tiles <= budget,
+        "dma": dma_estimate(tile_bytes + map_bytes),
+    }
+
+
+def save_budget(path, report):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+
+
+# assets: list of asset_budget dicts. each asset on its own tileset, so a level needs the sum resident
+def batch_budget(assets, budget=DEFAULT_VRAM_BUDGET):
+    total_tiles = sum(a["vram_tiles"] for a in assets)
+    total_bytes = sum(a["tile_bytes"] + a["map_bytes"] for a in assets)
+    biggest = max(assets, key=lambda a: a["vram_tiles"], default=None)
+    return {
+        "assets": assets,
+        "total": {
+            "assets": len(assets),
+            "tiles_total": sum(a["tiles_total"] for a in assets),
+            "tiles_unique": total_tiles,
+            "tile_bytes": sum(a["tile_bytes"] for a in assets),
+            "map_bytes": sum(a["map_bytes"] for a in assets),
+            "priority_tiles": sum(a["priority_tiles"] for a in assets),
+            "vram_budget": budget,
+            "fits_vram_all_resident": total_tiles <= budget,
+            "biggest": biggest["asset"] if biggest else None,
+            "over_budget": [a["asset"] for a in assets if not a["fits_vram"]],
+            "dma": dma_estimate(total_bytes),
+        },
+    }
+
+
+def format_table(report):
+    lines = [f"{'asset':<28} {'tiles':>7} {'unique':>7} {'tile B':>8} {'map B':>7} {'prio':>6} "
+             f"{'NTSC H40':>9} {'PAL H40':>8}  vram"]
+
+    def row(name, a):
+        dma = a["dma"]
+        fits = a.get("fits_vram", a.get("fits_vram_all_resident"))
+        return (f"{name[-28:]:<28} {a['tiles_total']:>7} {a['tiles_unique']:>7} {a['tile_bytes']:>8} "
+                f"{a['map_bytes']:>7} {a['priority_tiles']:>6} {dma['NTSC_H40']['frames']:>7}fr "
+                f"{dma['PAL_H40']['frames']:>6}fr  {'ok' if fits else 'OVER'}")
+
+    for a in report["assets"]:
+        lines.append(row(os.path.basename(a["asset"]), a))
+    total = report["total"]
+    lines.append(row(f"TOTAL ({total['assets']})", total))
+    lines.append(f"vram budget {total['vram_budget']} tiles, all resident: {total['tiles_unique']}"
+                 f" ({'ok' if total['fits_vram_all_resident'] else 'OVER'})"
+                 f", DMA frames = vblanks for a full load (tiles + map)")
+    return "\n".join(lines)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# pipeline.py --watch: stays running on the folder and rebuilds only what changed, in well under a second
+# - linux: inotify (straight through ctypes, nothing to install). elsewhere, or with --poll, the folder is
+#   stat'ed every POLL_S. WSL2 on /mnt/c does not get inotify events for files Windows programs save, use --poll there
+# - events are coalesced until nothing moved for DEBOUNCE_S, so an editor save or an aseprite export is one rebuild
+# - what triggers what: a png of the json -> that entry. the json or its .journal (the editor saving) -> the
+#   entries whose size or priority tiles changed. the palette -> everything
+# - decoded pngs and the palette stay in memory between rebuilds, a priority change does not even decode
+#   (not with --band, there every rebuild reads its png again band by band)
+# the json + journal are read the way the editor leaves them, without writing anything (PriorityStore readonly)
+# every rebuild goes on the pipeline build manifest too, the next pipeline.py run knows what is fresh
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+import pipeline
+from priostore import PriorityStore
+from sgdkpal import load_jasc_pal
+
+DEBOUNCE_S = 0.15
+POLL_S = 0.25
+
+# inotify.h
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class PollWatcher:
+    def __init__(self, folder, interval=POLL_S):
+        self.folder = folder
+        self.interval = interval
+        self.seen = self.scan()
+
+    def scan(self):
+        stamps = {}
+        for entry in os.scandir(self.folder):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            if entry.is_file():
+                stamps[entry.name] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    # -> names that changed (or appeared, or went away) within timeout seconds, empty set if none
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = self.scan()
+            changed = {n for n in now.keys() | self.seen.keys() if now.get(n) != self.seen.get(n)}
+            self.seen = now
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.interval if deadline is None else min(self.interval, max(0, deadline - time.monotonic())))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    def __init__(self, folder):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed on {folder}")
+
+    def wait(self, timeout=None):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+            if name:
+                changed.add(os.fsdecode(name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(folder, poll=False):
+    if not poll and hasattr(select, "select") and ctypes.util.find_library("c"):
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError) as e:
+            print(f"[watch] no inotify ({e}), polling")
+    return PollWatcher(folder)
+
+
+def stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+# what the watcher keeps between rebuilds
+class WarmBuild:
+    # failed: [(path, error)] of the build before, kept until they build fine
+    def __init__(self, json_path, palette_path=None, options=None, failed=()):
+        self.json_path = json_path
+        self.palette_path = palette_path
+        self.options = dict(options or {})
+        self.palette = None
+        self.cache = None
+        self.entries = {}   # absolute png path -> entry
+        self.images = {}    # path -> (file stamp, decoded png)
+        self.failed = {os.path.abspath(path): error for path, error in failed}
+        self.set_palette(load_jasc_pal(palette_path) if palette_path else None)
+        self.entries = self.read_entries()
+
+    # the palette is on the manifest options, a new one means a new cache too
+    def set_palette(self, palette):
+        self.palette = palette
+        self.cache = pipeline.build_cache(self.json_path, dict(self.options, palette=palette))
+
+    def read_entries(self):
+        if not os.path.exists(self.json_path):
+            return {}
+        store = PriorityStore(self.json_path, readonly=True)
+        entries = pipeline.resolve_entries(self.json_path, store.snapshot()["entries"])
+        return {os.path.abspath(e["path"]): e for e in entries}
+
+    def image(self, path):
+        st = stamp(path)
+        cached = self.images.get(path)
+        if cached and cached[0] == st:
+            return cached[1]
+        img = pipeline.decode(path)
+        self.images[path] = (st, img)
+        return img
+
+    # names: files of the json folder that changed -> paths of the entries to rebuild
+    def dirty(self, names):
+        folder = os.path.dirname(os.path.abspath(self.json_path))
+        changed = {os.path.join(folder, n) for n in names}
+        json_path = os.path.abspath(self.json_path)
+        todo = set()
+        palette_changed = bool(self.palette_path) and os.path.abspath(self.palette_path) in changed
+        json_changed = json_path in changed or json_path + ".journal" in changed
+        # both read before anything is swapped, a bad (half saved) palette or json raises here and the last
+        # good ones stay
+        palette = load_jasc_pal(self.palette_path) if palette_changed else self.palette
+        entries = self.read_entries() if json_changed else self.entries
+        if palette_changed:
+            self.set_palette(palette)
+            todo.update(entries)
+        if json_changed:
+            old, self.entries = self.entries, entries
+            for path, entry in self.entries.items():
+                before = old.get(path)
+                if before is None or any(before.get(k) != entry.get(k) for k in ("width", "height", "priority_bits")):
+                    todo.add(path)
+        for path in changed & self.entries.keys():
+            self.images.pop(path, None)
+            todo.add(path)
+        return sorted(p for p in todo if p in self.entries and os.path.exists(p))
+
+    def rebuild(self, paths):
+        failed = 0
+        for path in paths:
+            entry = self.entries[path]
+            try:
+                img = None if self.options.get("band") else self.image(path)
+                fp = self.cache.fingerprint(entry, img)
+                outputs = pipeline.build_entry(entry, self.palette, img=img, **self.options)
+            except Exception as e:
+                failed += 1
+                self.images.pop(path, None)
+                self.cache.forget(entry["path"])
+                self.failed[path] = f"{type(e).__name__}: {e}"
+                print(f"[FAIL] {path}: {self.failed[path]}")
+                continue
+            self.failed.pop(path, None)
+            if outputs:
+                self.cache.record(entry, fp, outputs)
+        self.cache.save()
+        return failed
+
+    # [(path, error)] of the entries of the json that fail right now
+    def failures(self):
+        return [(path, error) for path, error in sorted(self.failed.items()) if path in self.entries]
+
+
+# blocks until ctrl+c. the first full build is pipeline.build(), up to date entries are skipped there as usual
+# -> warm.failures() once stopped
+def run(json_path, palette_path=None, poll=False, debounce=DEBOUNCE_S, failed=(), **options):
+    folder = os.path.dirname(os.path.abspath(json_path))
+    warm = WarmBuild(json_path, palette_path, options, failed)
+    watcher = make_watcher(folder, poll)
+    print(f"[watch] {folder} ({type(watcher).__name__}), ctrl+c to stop")
+    try:
+        while True:
+            names = watcher.wait(None)
+            while True:
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                names |= more
+            try:
+                paths = warm.dirty(names)
+            except Exception as e:
+                print(f"[watch] {type(e).__name__}: {e}, keeping the last palette / json, waiting for the next save")
+                continue
+            if not paths:
+                continue
+            start = time.perf_counter()
+            bad = warm.rebuild(paths)
+            print(f"[watch] {len(paths)} rebuilt, {bad} failed in {time.perf_counter() - start:.3f}s")
+    except KeyboardInterrupt:
+        print("[watch] bye")
+    finally:
+        watcher.close()
+    return warm.failures()
@@ -0,0 +1,27 @@
+// wordlz unpacker for the data sgdkpack.py / setprioFULLAND01.py --bin --pack wordlz writes
+// include it once in your SGDK project. returns the unpacked size in bytes
+// stream: header word LLLLLLLL MMMMMMMM, L literal words, then if M: offset word (in words) + M copied words
+#ifndef WORDLZ_H
+#define WORDLZ_H
+
+static inline u16 wordlz_unpack(const u16* src, u16* dst)
+{
+    u16* start = dst;
+    u16 header;
+
+    while ((header = *src++))
+    {
+        u16 n = header >> 8;
+        while (n--) *dst++ = *src++;
+
+        n = header & 0xFF;
+        if (n)
+        {
+            const u16* from = dst - *src++;
+            while (n--) *dst++ = *from++;
+        }
+    }
+    return (dst - start) * 2;
+}
+
+#endif